@@ -1,25 +1,44 @@
-from fastapi import FastAPI, File, UploadFile, Query, Body
-from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, Query, Body, Header, BackgroundTasks
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, Response
 import google.generativeai as genai
-from PyPDF2 import PdfReader
 import os
 import time
+import hashlib
+import asyncio
 import secrets
-import csv
-import io
-from io import BytesIO
-from datetime import date as date_type
-from icalendar import Calendar as ICalendar, Event as ICalEvent
+import shutil
+import math
+from contextlib import asynccontextmanager
+from datetime import date as date_type, datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from dotenv import load_dotenv
 from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from database.db_manager import init_db, fetch_user_creds, update_creds
+from database.db_manager import init_db
+from database import db_manager, parse_cache, job_store, channel_store
+# Async versions of the db_manager functions, so handlers never block the event loop on SQLite
+from database.async_db import (
+    database, fetch_user_creds, update_creds, fetch_sync_state, save_sync_state, clear_sync_state, save_course_events,
+    fetch_events, fetch_events_version, fetch_calendar_id, save_calendar_id, forget_calendar, issue_feed_token,
+    fetch_feed_owner, fetch_remote_changes, save_remote_changes, clear_remote_changes
+)
 import json
-from pydantic import BaseModel
-from typing import List, Optional
-from pdf2image import convert_from_bytes
-import pytesseract
+from pydantic import BaseModel, field_validator
+from typing import Callable, Dict, List, Optional, Tuple
+from llm_client import GeminiClient
+from rule_extractor import extract_rule_based, unresolved_fragments
+from syllabus_chunks import split_syllabus, syllabus_header, merge_chunk_results
+from google_calendar import (
+    CalendarCredentialsCache, UserSyncLimiter, execute_batch, error_status, event_content_hash, GONE_STATUS_CODES,
+    raise_if_rate_limited, rate_limit_scope, retry_after
+)
+from calendar_quota import CalendarQuota, quota_lane, BULK
+from calendar_watch import WatchManager
+from extraction import (
+    ExtractionPool, ExtractionBusyError, ExtractionTimeoutError, extract_text_from_file, EXTRACTION_WORKERS
+)
+from exporters import iter_ics, iter_csv, event_uid
+from syllabus_jobs import JobRunner, JOB_WORKERS, JOB_DIR
+from uploads import StoredUpload, spool_upload, stored_upload, UploadTooLargeError, NotAPdfError
 
 
 class CalendarEvent(BaseModel):
@@ -42,6 +61,18 @@ class SyncEventRequest(BaseModel):
     google_event_id: Optional[str] = None
     is_deleted: bool = False
 
+    @field_validator('date')
+    @classmethod
+    def _iso_date(cls, value: str) -> str:
+        # Google answers anything else with a 400, which would send the sync down the rebuild path
+        try:
+            valid = date_type.fromisoformat(value).isoformat() == value
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError("date must be YYYY-MM-DD")
+        return value
+
 
 class CalendarClassSyncRequest(BaseModel):
     class_name: str
@@ -50,6 +81,10 @@ class CalendarClassSyncRequest(BaseModel):
     background_color: Optional[str] = None  # Hex color for calendar background (e.g., "#FF5733")
     foreground_color: Optional[str] = None  # Hex color for text (e.g., "#FFFFFF")
 
+
+class CalendarSyncAllRequest(BaseModel):
+    classes: List[CalendarClassSyncRequest]
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -60,6 +95,23 @@ if not GEMINI_API_KEY:
 
 genai.configure(api_key=GEMINI_API_KEY)
 
+# One shared model for every request; see llm_client.GeminiClient for limits and retries
+gemini_client = GeminiClient(
+    'gemini-2.5-flash',
+    generation_config=genai.types.GenerationConfig(
+        temperature=0.1,  # Lower temperature for more consistent output
+        top_p=0.8,       # Nucleus sampling
+        top_k=40,        # Top-k sampling  
+        max_output_tokens=4096,  # Limit response length
+        response_mime_type="application/json"  # Force JSON output
+    ),
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    timeout=float(os.getenv("GEMINI_TIMEOUT", "60")),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+)
+# Syllabi longer than this are split and the parts parsed concurrently
+GEMINI_CHUNK_CHARS = int(os.getenv("GEMINI_CHUNK_CHARS", "12000"))
+
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -73,6 +125,23 @@ SCOPES = [
     'openid'
 ]
 
+# Every Calendar API call is metered against Google's per-user and per-project quotas.
+# Defaults stay 10% under per-minute quotas of 600 per user and 10,000 per project;
+# set them from the quotas shown for the project in the Cloud console.
+calendar_quota = CalendarQuota(
+    user_per_minute=float(os.getenv("CALENDAR_USER_QPM", "540")),
+    project_per_minute=float(os.getenv("CALENDAR_PROJECT_QPM", "9000")),
+    max_wait=float(os.getenv("CALENDAR_QUOTA_MAX_WAIT", "20"))  # longer waits are answered with 429
+)
+# Each user's parsed OAuth credentials, shared by the Calendar services built for their requests
+calendar_credentials = CalendarCredentialsCache(
+    max_size=int(os.getenv("CALENDAR_CREDENTIALS_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CALENDAR_CREDENTIALS_TTL", "900")),
+    quota=calendar_quota
+)
+# Classes of one user synced concurrently by /calendar/sync/all (shared across that user's requests)
+user_sync_limits = UserSyncLimiter(int(os.getenv("CALENDAR_SYNC_CONCURRENCY", "3")))
+
 # In-memory OAuth state store: {state_token: created_timestamp}
 _oauth_states: dict[str, float] = {}
 OAUTH_STATE_TTL = 300  # 5 minutes
@@ -86,12 +155,49 @@ def _cleanup_expired_states():
         del _oauth_states[s]
 
 
+# PDF/OCR extraction runs in worker processes so it never blocks the event loop
+EXTRACTION_QUEUE_DEPTH = int(os.getenv("EXTRACTION_QUEUE_DEPTH", "8"))  # uploads allowed to wait for a worker
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "120"))  # seconds per document
+extraction_pool = ExtractionPool(EXTRACTION_WORKERS, EXTRACTION_QUEUE_DEPTH, EXTRACTION_TIMEOUT)
+SYLLABUS_BATCH_MAX_FILES = int(os.getenv("SYLLABUS_BATCH_MAX_FILES", "8"))
+
+# Uploads queued via POST /syllabus/jobs are parsed by these workers
+job_runner = JobRunner(
+    lambda pdf_path: _parse_stored_pdf(pdf_path),  # defined below
+    workers=JOB_WORKERS,
+    transient=(ExtractionBusyError, ExtractionTimeoutError)
+)
+
+# Class calendars are watched for edits made in Google Calendar (POST /calendar/notifications)
+watches = WatchManager(
+    lambda email: _watch_service(email),  # defined below
+    lambda channel, events, full: _apply_calendar_changes(channel, events, full),
+    after_use=lambda email: _save_refreshed_credentials(email)
+)
+
 # Initialize database on startup
 init_db()
+parse_cache.init_parse_cache()
+job_store.init_job_store()
+channel_store.init_channel_store()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_runner.start()
+    watches.start()
+    yield
+    await watches.stop()
+    await job_runner.stop()
+    extraction_pool.shutdown()
+    gemini_client.shutdown()
+    database.shutdown()
+
 
 app = FastAPI(
     title='Plannr API',
-    description='Upload your syllabus, the API parses it and uploads the relevant time slots to your Google Calendar'
+    description='Upload your syllabus, the API parses it and uploads the relevant time slots to your Google Calendar',
+    lifespan=lifespan
 )
 
 
@@ -173,8 +279,9 @@ async def auth_callback(code: str = Query(...), state: str = Query(None), redire
         }
 
         # Ensure user exists and update credentials
-        fetch_user_creds(email)  # This creates user if not exists
-        update_creds(email, creds_data)
+        await fetch_user_creds(email)  # This creates user if not exists
+        await update_creds(email, creds_data)
+        calendar_credentials.invalidate(email)
 
         # Redirect to iOS app with custom URL scheme
         from urllib.parse import quote
@@ -200,40 +307,29 @@ async def google_oauth_login():
 
 @app.post('/syllabus', tags=['Plannr'])
 async def parse_syllabus(file: UploadFile = File(...)):
+    upload = None
     try:
         print(f"\n=== NEW UPLOAD ===")
         print(f"Filename: {file.filename}")
         
-        # Read the uploaded file
-        contents = await file.read()
-        print(f"File size: {len(contents)} bytes")
-        
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(contents)
-        print(f"\n=== EXTRACTED PDF TEXT ===")
-        print(f"Text length: {len(pdf_text)} characters")
-        print(pdf_text[:500])  # First 500 characters
-        
-        if not pdf_text:
-            return JSONResponse(
-                status_code=400,
-                content={"error": "Could not extract text from PDF"}
-            )
-        
-        # Send to Gemini for parsing
-        parsed_events = await parse_with_gemini(pdf_text)
-        
-        print(f"\n=== FINAL RESPONSE ===")
-        print(f"Events parsed: {len(parsed_events.get('events', []))}")
-        
+        # Copy the upload to disk in chunks; extraction reads it from there
+        upload = await spool_upload(file)
+        print(f"File size: {upload.size} bytes")
+
+        events, cached = await _parse_pdf(upload)
+        return _syllabus_response(file.filename, upload.size, events, cached=cached)
+    except (UploadTooLargeError, NotAPdfError) as e:
+        return _upload_error_response(e)
+    except ExtractionBusyError as e:
         return JSONResponse(
-            status_code=200,
-            content={
-                "message": "Syllabus received and parsed",
-                "filename": file.filename,
-                "size": len(contents),
-                "events": parsed_events.get('events', [])
-            }
+            status_code=429,
+            headers={"Retry-After": "10"},
+            content={"error": str(e)}
+        )
+    except ExtractionTimeoutError as e:
+        return JSONResponse(
+            status_code=504,
+            content={"error": str(e)}
         )
     except Exception as e:
         print(f"\n=== ERROR IN /SYLLABUS ===")
@@ -244,68 +340,393 @@ async def parse_syllabus(file: UploadFile = File(...)):
             status_code=400,
             content={"error": str(e)}
         )
+    finally:
+        if upload is not None:
+            upload.remove()
+
+
+def _upload_error_response(e: Exception) -> JSONResponse:
+    status_code = 413 if isinstance(e, UploadTooLargeError) else 415
+    return JSONResponse(status_code=status_code, content={"error": str(e)})
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF bytes. Falls back to OCR for scanned/image PDFs."""
+# Called as progress(stage, **data) as parsing advances; see POST /syllabus/stream
+Progress = Optional[Callable[..., None]]
+
+
+def _report(progress: Progress, stage: str, **data) -> None:
+    if progress is not None:
+        progress(stage, **data)
+
+
+async def _parse_pdf(upload: StoredUpload, progress: Progress = None) -> Tuple[list, bool]:
+    """
+    Parse one PDF into events, shared by POST /syllabus, the job workers and the stream.
+
+    Returns (events, cached). Raises ExtractionBusyError / ExtractionTimeoutError
+    from the worker pool, and Exception if the PDF has no extractable text.
+    """
+    # Identical PDFs (e.g. a whole class uploading the same syllabus) skip extraction and the LLM
+    pdf_key = upload.sha256
+    cached_events = await _parse_cache_get(parse_cache.get_by_pdf_hash, pdf_key)
+    if cached_events is not None:
+        print(f"Parse cache hit (pdf): {len(cached_events)} events")
+        _report(progress, "cache_hit", source="pdf")
+        return cached_events, True
+
+    # Extract text from PDF
+    pdf_text = await _extract_text(upload.path, progress)
+    print(f"\n=== EXTRACTED PDF TEXT ===")
+    print(f"Text length: {len(pdf_text)} characters")
+    print(pdf_text[:500])  # First 500 characters
+
+    if not pdf_text:
+        raise Exception("Could not extract text from PDF")
+    _report(progress, "text_extracted", characters=len(pdf_text))
+
+    # Same content in a different PDF (re-export, different metadata) still hits
+    text_key = parse_cache.text_hash(pdf_text)
+    cached_events = await _parse_cache_get(parse_cache.get_by_text_hash, text_key)
+    if cached_events is not None:
+        print(f"Parse cache hit (text): {len(cached_events)} events")
+        _report(progress, "cache_hit", source="text")
+        await _parse_cache_store(pdf_key, text_key, cached_events)
+        return cached_events, True
+    parse_cache.record_miss()
+
+    # Resolve explicit dates locally, send the rest to Gemini
+    parsed_events = await parse_syllabus_text(pdf_text, progress)
+    events = parsed_events.get('events', [])
+    _report(progress, "events_parsed", count=len(events))
+
+    print(f"\n=== FINAL RESPONSE ===")
+    print(f"Events parsed: {len(events)}")
+
+    # Failed, partial or empty parses are not cached so the next upload retries the LLM
+    if parsed_events.get('partial'):
+        print("Parse is partial (a Gemini call failed); not caching it")
+    elif events:
+        await _parse_cache_store(pdf_key, text_key, events)
+    return events, False
+
+
+async def _parse_stored_pdf(pdf_path) -> Tuple[list, bool]:
+    """_parse_pdf for a PDF already on disk, e.g. a queued job's upload."""
+    return await _parse_pdf(await asyncio.to_thread(stored_upload, pdf_path))
+
+
+def _syllabus_response(filename: str, size: int, events: list, cached: bool = False) -> JSONResponse:
+    return JSONResponse(status_code=200, content=_syllabus_payload(filename, size, events, cached))
+
+
+def _syllabus_payload(filename: str, size: int, events: list, cached: bool = False) -> dict:
+    return {
+        "message": "Syllabus received and parsed",
+        "filename": filename,
+        "size": size,
+        "events": events,
+        "cached": cached
+    }
+
+
+@app.post('/syllabus/stream', tags=['Plannr'])
+async def stream_syllabus(file: UploadFile = File(...)):
+    """
+    POST /syllabus as Server-Sent Events.
+
+    Emits one event per stage (received, text_layer, ocr_page, text_extracted,
+    llm_request, partial_events, events_parsed), then 'done' with the /syllabus
+    payload or 'error' with the status /syllabus would have answered. Every event
+    carries elapsed_ms since the upload was received.
+    """
+    started = time.monotonic()
     try:
-        pdf_file = BytesIO(pdf_bytes)
-        pdf_reader = PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() or ""
-        
-        if text.strip():
-            print(f"PyPDF2 extracted {len(text)} characters")
-            return text
-        
-        print("No text found via PyPDF2, falling back to OCR...")
-        return extract_text_via_ocr(pdf_bytes)
+        upload = await spool_upload(file)
+    except (UploadTooLargeError, NotAPdfError) as e:
+        return _upload_error_response(e)
+    updates = asyncio.Queue()
+
+    def progress(stage, **data):
+        updates.put_nowait((stage, {**data, "elapsed_ms": round((time.monotonic() - started) * 1000)}))
+
+    async def parse():
+        try:
+            events, cached = await _parse_pdf(upload, progress)
+            progress("done", **_syllabus_payload(file.filename, upload.size, events, cached))
+        except ExtractionBusyError as e:
+            progress("error", status=429, error=str(e))
+        except ExtractionTimeoutError as e:
+            progress("error", status=504, error=str(e))
+        except Exception as e:
+            print(f"Error in /syllabus/stream: {e}")
+            progress("error", status=400, error=str(e))
+        finally:
+            updates.put_nowait(None)
+
+    async def stream():
+        progress("received", filename=file.filename, size=upload.size)
+        task = asyncio.create_task(parse())
+        try:
+            while (update := await updates.get()) is not None:
+                yield _sse_event(*update)
+        finally:
+            task.cancel()  # client went away
+            upload.remove()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse_event(stage: str, data: dict) -> bytes:
+    return f"event: {stage}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+@app.post('/syllabus/batch', tags=['Plannr'])
+async def parse_syllabus_batch(files: List[UploadFile] = File(...)):
+    """
+    Parse several syllabi in one request.
 
+    Files are parsed concurrently, sharing the extraction pool and Gemini limits
+    with every other request. Identical files are parsed once. Returns one result
+    per file, in upload order, with the status POST /syllabus would have answered.
+    """
+    if len(files) > SYLLABUS_BATCH_MAX_FILES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"At most {SYLLABUS_BATCH_MAX_FILES} files can be uploaded at once"}
+        )
+
+    uploads = []
+    try:
+        results = []
+        for file in files:
+            try:
+                uploads.append(await spool_upload(file))
+                results.append(None)
+            except (UploadTooLargeError, NotAPdfError) as e:
+                uploads.append(None)
+                results.append({"filename": file.filename, "status": _upload_error_response(e).status_code, "error": str(e)})
+
+        # The first file with a given hash is parsed; later copies reuse its result
+        first_by_hash = {}
+        for index, upload in enumerate(uploads):
+            if upload is not None:
+                first_by_hash.setdefault(upload.sha256, index)
+        unique = sorted(first_by_hash.values())
+        print(f"Batch upload: {len(uploads)} file(s), {len(unique)} unique")
+
+        outcomes = await asyncio.gather(*(_parse_batch_file(uploads[i]) for i in unique))
+        parsed = dict(zip(unique, outcomes))
+
+        for index, upload in enumerate(uploads):
+            if upload is None:
+                continue
+            first = first_by_hash[upload.sha256]
+            results[index] = {"filename": upload.filename, "size": upload.size, **parsed[first]}
+            if first != index:
+                results[index]["duplicate_of"] = first
+    finally:
+        for upload in uploads:
+            if upload is not None:
+                upload.remove()
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "files": results,
+            "succeeded": sum(1 for r in results if r["status"] == 200),
+            "failed": sum(1 for r in results if r["status"] != 200)
+        }
+    )
+
+
+async def _parse_batch_file(upload: StoredUpload) -> dict:
+    """One file of a batch; errors are returned the way POST /syllabus would answer them."""
+    try:
+        events, cached = await _parse_pdf(upload)
+        return {"status": 200, "events": events, "cached": cached}
+    except ExtractionBusyError as e:
+        return {"status": 429, "error": str(e)}
+    except ExtractionTimeoutError as e:
+        return {"status": 504, "error": str(e)}
     except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return extract_text_via_ocr(pdf_bytes)
+        print(f"Error in /syllabus/batch: {e}")
+        return {"status": 400, "error": str(e)}
 
 
-def extract_text_via_ocr(pdf_bytes: bytes) -> str:
-    """OCR fallback for scanned/image-based PDFs."""
+@app.post('/syllabus/jobs', tags=['Plannr'], status_code=202)
+async def enqueue_syllabus(file: UploadFile = File(...)):
+    """Queue a syllabus for parsing and return its job id; poll GET /syllabus/jobs/{job_id} for the events."""
     try:
-        from pdf2image import convert_from_bytes
-        import pytesseract
+        upload = await spool_upload(file)
+    except (UploadTooLargeError, NotAPdfError) as e:
+        return _upload_error_response(e)
 
-        images = convert_from_bytes(pdf_bytes, dpi=200)
-        print(f"OCR: converted PDF to {len(images)} image(s)")
-        
-        text = ""
-        for i, image in enumerate(images):
-            page_text = pytesseract.image_to_string(image)
-            print(f"OCR page {i+1}: {len(page_text)} characters")
-            text += page_text + "\n"
-        
-        print(f"OCR total: {len(text)} characters extracted")
-        return text
+    job_id = secrets.token_urlsafe(16)
+    pdf_path = JOB_DIR / f"{job_id}.pdf"
+    try:
+        await asyncio.to_thread(_save_job_upload, upload, pdf_path)
+        await database.write(job_store.create_job, job_id, file.filename, str(pdf_path), upload.size)
+    except Exception as e:
+        print(f"Failed to queue syllabus job: {e}")
+        upload.remove()
+        return JSONResponse(status_code=500, content={"error": "Could not queue the syllabus for parsing"})
+
+    job_runner.start()
+    job_runner.notify()
+    status_url = f"/syllabus/jobs/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        headers={"Location": status_url},
+        content={"job_id": job_id, "status": job_store.QUEUED, "status_url": status_url}
+    )
 
+
+def _save_job_upload(upload: StoredUpload, pdf_path) -> None:
+    # A rename when JOB_DIR is on the same filesystem as the temp file, otherwise a copy
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(upload.path, pdf_path)
+    upload.path = pdf_path
+
+
+@app.get('/syllabus/jobs/{job_id}', tags=['Plannr'])
+async def get_syllabus_job(job_id: str):
+    """Status of a queued syllabus; once done, the same payload as POST /syllabus."""
+    job = await database.read(job_store.get_job, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return _job_response(job)
+
+
+@app.post('/syllabus/jobs/{job_id}/retry', tags=['Plannr'])
+async def retry_syllabus_job(job_id: str):
+    """Queue a failed job again using the stored upload."""
+    if not await database.write(job_store.retry_job, job_id):
+        job = await database.read(job_store.get_job, job_id)
+        if job is None:
+            return JSONResponse(status_code=404, content={"error": "Job not found"})
+        return JSONResponse(status_code=409, content={"error": f"Job is {job['status']}, only failed jobs can be retried"})
+    job_runner.start()
+    job_runner.notify()
+    return _job_response(await database.read(job_store.get_job, job_id))
+
+
+def _job_response(job: dict) -> JSONResponse:
+    content = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "size": job["size"],
+        "attempts": job["attempts"]
+    }
+    if job["status"] == job_store.DONE:
+        content.update(message="Syllabus received and parsed", events=job["events"], cached=job["cached"])
+    elif job["error"]:
+        # Also set on a queued job that is waiting for an automatic retry
+        content["error"] = job["error"]
+    return JSONResponse(status_code=200, content=content)
+
+
+async def _parse_cache_get(lookup, key: str) -> Optional[list]:
+    """Cache lookup that treats a database error as a miss instead of failing the upload."""
+    try:
+        events = await database.read(lookup, key)
     except Exception as e:
-        print(f"OCR failed: {e}")
-        return ""
+        print(f"Warning: parse cache lookup failed: {e}")
+        return None
+    if events is not None:
+        try:
+            # The hit's last_used goes through the writer like every other write
+            await database.write(parse_cache.apply_touches)
+        except Exception as e:
+            print(f"Warning: parse cache touch failed: {e}")
+    return events
+
 
-async def parse_with_gemini(syllabus_text: str) -> dict:
-    """Use Gemini to extract calendar events from syllabus text"""
+async def _parse_cache_store(pdf_key: str, text_key: str, events: list) -> None:
     try:
-        # Configure generation settings for more deterministic output
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.1,  # Lower temperature for more consistent output
-            top_p=0.8,       # Nucleus sampling
-            top_k=40,        # Top-k sampling  
-            max_output_tokens=4096,  # Limit response length
-            response_mime_type="application/json"  # Force JSON output
-        )
-        
-        model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            generation_config=generation_config
-        )
-        
+        await database.write(parse_cache.store, pdf_key, text_key, events)
+    except Exception as e:
+        print(f"Warning: parse cache store failed: {e}")
+
+
+async def _extract_text(pdf_path, progress: Progress = None) -> str:
+    """Extract text from a PDF on disk in the worker pool. Raises ExtractionBusyError / ExtractionTimeoutError."""
+    return await extraction_pool.run(extract_text_from_file, str(pdf_path), progress=progress)
+
+async def parse_syllabus_text(syllabus_text: str, progress: Progress = None) -> dict:
+    """
+    Extract events, using the LLM only for what the rule-based extractor can't resolve.
+
+    - Every deliverable line has an explicit date and the year is known: no LLM call.
+    - Some lines are unresolved: only those fragments (plus the header for context) go to Gemini.
+    - Nothing resolved, or the year had to be guessed: the full text goes to Gemini.
+
+    Rule-based events are reported as partial results before any Gemini call.
+    """
+    rules = extract_rule_based(syllabus_text)
+    print(f"Rule-based extraction: {len(rules.events)} events, {len(rules.unresolved)} unresolved lines, "
+          f"confidence {rules.confidence:.2f}")
+    if rules.is_confident:
+        return {"events": rules.events}
+    if rules.events:
+        _report(progress, "partial_events", source="rules", events=rules.events)
+    if not rules.events or not rules.unresolved:
+        llm_result = await parse_with_gemini(syllabus_text, progress)
+    else:
+        fragments = unresolved_fragments(syllabus_text, rules)
+        _report(progress, "llm_request", chunks=1, characters=len(fragments))
+        llm_result = await _parse_chunk_with_gemini(fragments, context=syllabus_header(syllabus_text))
+    return merge_chunk_results([{"events": rules.events}, llm_result], syllabus_header(syllabus_text))
+
+
+async def parse_with_gemini(syllabus_text: str, progress: Progress = None) -> dict:
+    """
+    Use Gemini to extract calendar events from syllabus text.
+
+    Long syllabi are split on section/table boundaries and the chunks are parsed
+    concurrently, so a week-by-week schedule can't overflow max_output_tokens.
+    """
+    chunks = split_syllabus(syllabus_text, GEMINI_CHUNK_CHARS)
+    _report(progress, "llm_request", chunks=len(chunks), characters=len(syllabus_text))
+    if len(chunks) == 1:
+        return await _parse_chunk_with_gemini(syllabus_text)
+
+    print(f"Syllabus split into {len(chunks)} chunks for parsing")
+    header = syllabus_header(syllabus_text)
+
+    async def parse_chunk(i, chunk):
+        result = await _parse_chunk_with_gemini(chunk, context=header if i > 0 else "")
+        if result.get("events"):
+            _report(progress, "partial_events", source="llm", chunk=i, events=result["events"])
+        return result
+
+    results = await asyncio.gather(*(parse_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+    return merge_chunk_results(results, header)
+
+
+async def _parse_chunk_with_gemini(syllabus_text: str, context: str = "") -> dict:
+    """
+    Single Gemini call. context is the syllabus header when syllabus_text is a later chunk.
+
+    A failed call returns {"events": [], "partial": True}, which merge_chunk_results
+    carries over so the merged result is not cached.
+    """
+    try:
+        context_section = ""
+        if context:
+            context_section = f"""
+        The syllabus below is ONE PART of a longer document. The beginning of the document is included
+        first so you can infer the course name, quarter and year. Only extract events that appear in the
+        Syllabus part, not in the Beginning of document.
+
+        Beginning of document:
+        {context}
+        """
+
         prompt = f"""
         You are an AI assistant that parses university course syllabi into a structured list of **graded deliverables**. The user has provided the full syllabus text. Your job is to accurately extract **what is due**, **when it is due**, and **how it should be labeled**, using careful temporal and contextual reasoning.
 
@@ -431,17 +852,13 @@ Return a **single JSON object** in this exact format:
                 }}
             ]
         }}
-        
+        {context_section}
         Syllabus:
         {syllabus_text}
         """
         
-        response = model.generate_content(prompt)
-        
         # Parse the response (Gemini should return JSON)
-        import json
-        # Try to extract JSON from the response
-        response_text = response.text
+        response_text = await gemini_client.generate(prompt)
         
         print("\n=== GEMINI RAW RESPONSE ===")
         print(response_text)
@@ -460,14 +877,23 @@ Return a **single JSON object** in this exact format:
             return parsed
         else:
             print("\n=== NO JSON FOUND IN RESPONSE ===")
-            return {"events": []}
+            return {"events": [], "partial": True}
             
     except Exception as e:
         print(f"\n=== ERROR CALLING GEMINI ===")
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
-        return {"events": []}
+        return {"events": [], "partial": True}
+
+
+async def _save_refreshed_credentials(email: str) -> None:
+    """Write back an access token google-auth refreshed during this request."""
+    try:
+        # Rare (about once an hour per user), so a plain worker thread is fine here
+        await asyncio.to_thread(calendar_credentials.save_if_refreshed, email, db_manager.update_creds)
+    except Exception as e:
+        print(f"Warning: failed to save refreshed credentials for {email}: {e}")
 
 
 @app.post('/calendar', tags=['Syllabus to Calendar'])
@@ -475,47 +901,16 @@ async def add_to_calendar(email: str = Query(...), request: CalendarSyncRequest
     """Add parsed syllabus events to user's Google Calendar"""
     try:
         # Get user credentials from database
-        creds_json = fetch_user_creds(email)
+        creds_json = await fetch_user_creds(email)
         if not creds_json:
             return JSONResponse(
                 status_code=401,
                 content={"error": "User not authenticated. Please sign in with Google first."}
             )
 
-        # Parse stored credentials
-        creds_data = json.loads(creds_json)
-        credentials = Credentials(
-            token=creds_data.get('token'),
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data.get('token_uri'),
-            client_id=creds_data.get('client_id'),
-            client_secret=creds_data.get('client_secret'),
-            scopes=creds_data.get('scopes')
-        )
-
-        # Build Calendar service
-        service = build('calendar', 'v3', credentials=credentials)
-
-        created_events = []
-        for event in request.events:
-            # Create calendar event
-            calendar_event = {
-                'summary': event.title,
-                'description': event.description,
-                'start': {
-                    'date': event.date,  # All-day event format: YYYY-MM-DD
-                },
-                'end': {
-                    'date': event.date,
-                },
-            }
-
-            result = service.events().insert(calendarId='primary', body=calendar_event).execute()
-            created_events.append({
-                'title': event.title,
-                'date': event.date,
-                'calendar_event_id': result.get('id')
-            })
+        # Calendar calls may wait for quota, so they run on a worker thread with a service of its own
+        service = await asyncio.to_thread(calendar_credentials.service, email, creds_json)
+        created_events = await asyncio.to_thread(_insert_primary_events, service, request.events)
 
         return JSONResponse(
             status_code=200,
@@ -529,25 +924,73 @@ async def add_to_calendar(email: str = Query(...), request: CalendarSyncRequest
         print(f"Calendar sync error: {e}")
         import traceback
         traceback.print_exc()
-        return JSONResponse(
-            status_code=400,
-            content={"error": f"Failed to add events to calendar: {str(e)}"}
-        )
+        return _calendar_error_response(e, "Failed to add events to calendar")
+    finally:
+        await _save_refreshed_credentials(email)
+
+
+def _insert_primary_events(service, events: List[CalendarEvent]) -> List[dict]:
+    created_events = []
+    for event in events:
+        # Create calendar event
+        calendar_event = {
+            'summary': event.title,
+            'description': event.description,
+            'start': {
+                'date': event.date,  # All-day event format: YYYY-MM-DD
+            },
+            'end': {
+                'date': event.date,
+            },
+        }
 
+        result = service.events().insert(calendarId='primary', body=calendar_event).execute()
+        created_events.append({
+            'title': event.title,
+            'date': event.date,
+            'calendar_event_id': result.get('id')
+        })
+    return created_events
+
+
+def _calendar_error(e: Exception, error: str) -> Tuple[int, str, Optional[int]]:
+    """
+    (status, message, retry_after) for a failed Calendar operation: 429 if Google's
+    quota ran out (or waiting for it took too long), 400 otherwise.
+    """
+    if rate_limit_scope(e) is not None:
+        wait = retry_after(e)
+        return 429, f"{error}: Google Calendar rate limit reached, please try again shortly.", math.ceil(wait) if wait is not None else None
+    return 400, f"{error}: {str(e)}", None
 
-def _find_or_create_calendar(service, class_name: str, background_color: Optional[str] = None, foreground_color: Optional[str] = None) -> str:
-    """Find a secondary calendar by name, or create one with custom colors. Returns the calendar ID."""
-    calendar_list = service.calendarList().list().execute()
-    for cal in calendar_list.get('items', []):
-        if cal.get('summary') == class_name:
+
+def _calendar_error_response(e: Exception, error: str) -> JSONResponse:
+    status, message, wait = _calendar_error(e, error)
+    headers = {"Retry-After": str(wait)} if wait is not None else None
+    return JSONResponse(status_code=status, content={"error": message}, headers=headers)
+
+
+def _find_or_create_calendar(service, class_name: str, background_color: Optional[str] = None, foreground_color: Optional[str] = None,
+                             calendars: Optional[Dict[str, str]] = None) -> str:
+    """
+    Find a secondary calendar by name, or create one with custom colors. Returns the calendar ID.
+
+    calendars ({calendar_id: summary}, from _list_calendars) saves the calendarList
+    scan when several classes are resolved at once; a created calendar is added to it.
+    """
+    if calendars is None:
+        calendars = _list_calendars(service)
+    for cal_id, summary in calendars.items():
+        if summary == class_name:
             # If colors are provided and calendar exists, update colors
             if background_color or foreground_color:
-                _set_calendar_colors(service, cal['id'], background_color, foreground_color)
-            return cal['id']
+                _set_calendar_colors(service, cal_id, background_color, foreground_color)
+            return cal_id
     
     # Not found — create a new secondary calendar
     new_cal = service.calendars().insert(body={'summary': class_name}).execute()
     calendar_id = new_cal['id']
+    calendars[calendar_id] = class_name
     
     # Step 2: Set colors if provided (two-step process required by Google Calendar API)
     if background_color or foreground_color:
@@ -556,6 +999,18 @@ def _find_or_create_calendar(service, class_name: str, background_color: Optiona
     return calendar_id
 
 
+def _list_calendars(service) -> Dict[str, str]:
+    """{calendar_id: summary} for every calendar in the user's calendar list."""
+    calendars = {}
+    page_token = None
+    while True:
+        calendar_list = service.calendarList().list(pageToken=page_token).execute()
+        calendars.update((cal['id'], cal.get('summary')) for cal in calendar_list.get('items', []))
+        page_token = calendar_list.get('nextPageToken')
+        if not page_token:
+            return calendars
+
+
 def _set_calendar_colors(service, calendar_id: str, background_color: Optional[str] = None, foreground_color: Optional[str] = None) -> None:
     """Set custom colors for a calendar using the calendarList PATCH endpoint."""
     try:
@@ -597,143 +1052,677 @@ def _build_google_event_body(event: SyncEventRequest) -> dict:
     }
 
 
+def _event_hash(event: SyncEventRequest) -> str:
+    return event_content_hash(event.title, event.date, event.description, event.type)
+
+
+class CalendarNotFoundError(Exception):
+    """The class calendar was deleted in Google Calendar; the caller finds or creates it again."""
+
+
+def _sync_events_batched(service, cal_id: str, events: List[SyncEventRequest],
+                         synced_state: Optional[Dict[str, Tuple[str, str]]] = None) -> Tuple[List[dict], List[str], List[str]]:
+    """
+    Apply deletes, updates and inserts as batch requests and map results back to local_id.
+
+    Events whose google_event_id and content hash match synced_state (what the
+    last sync wrote, local_id -> (google_event_id, content_hash)) are skipped.
+    An update whose Google event was deleted externally (404/410) is re-inserted
+    on its own instead of failing the sync; any other sub-request that still
+    fails after retries raises so the caller can fall back to a rebuild. A delete
+    that fails is reported instead, so its mapping is kept and the client can retry it.
+
+    Returns (synced, skipped, failed_deletes): the {local_id, google_event_id}
+    mappings of every non-deleted event, the local_ids that needed no API call,
+    and the local_ids of deleted events still in Google Calendar.
+    """
+    synced_state = synced_state or {}
+    skipped = [
+        ev.local_id for ev in events
+        if not ev.is_deleted and ev.google_event_id
+        and synced_state.get(ev.local_id) == (ev.google_event_id, _event_hash(ev))
+    ]
+    unchanged = set(skipped)
+
+    deletes = [
+        (f"delete:{ev.local_id}", service.events().delete(calendarId=cal_id, eventId=ev.google_event_id))
+        for ev in events if ev.is_deleted and ev.google_event_id
+    ]
+    writes = []
+    for ev in events:
+        if ev.is_deleted or ev.local_id in unchanged:
+            continue
+        if ev.google_event_id:
+            writes.append((ev.local_id, service.events().update(
+                calendarId=cal_id, eventId=ev.google_event_id, body=_build_google_event_body(ev)
+            )))
+        else:
+            writes.append((ev.local_id, service.events().insert(
+                calendarId=cal_id, body=_build_google_event_body(ev)
+            )))
+
+    if not deletes and not writes:
+        # Nothing to send, so nothing would notice a deleted calendar; check it explicitly
+        try:
+            service.calendars().get(calendarId=cal_id).execute()
+        except Exception as e:
+            if error_status(e) in GONE_STATUS_CODES:
+                raise CalendarNotFoundError(cal_id) from e
+            raise
+
+    _, delete_errors = execute_batch(service, deletes)
+    delete_errors = {k: v for k, v in delete_errors.items() if error_status(v) not in GONE_STATUS_CODES}
+    raise_if_rate_limited(delete_errors)
+    failed_deletes = []
+    for key, err in delete_errors.items():
+        print(f"Warning: failed to delete {key}: {err}")
+        failed_deletes.append(key.split(":", 1)[1])
+
+    responses, errors = execute_batch(service, writes)
+
+    # Updates of events the user deleted in Google Calendar: recreate them
+    events_by_id = {ev.local_id: ev for ev in events}
+    recreate = [
+        (local_id, service.events().insert(calendarId=cal_id, body=_build_google_event_body(events_by_id[local_id])))
+        for local_id, err in errors.items() if error_status(err) in GONE_STATUS_CODES
+    ]
+    if recreate:
+        recreated, recreate_errors = execute_batch(service, recreate)
+        responses.update(recreated)
+        errors = {k: v for k, v in errors.items() if k not in recreated}
+        errors.update(recreate_errors)
+    # Only inserts are left failing with 404 here, and an insert 404s only if the calendar is gone
+    if any(error_status(err) == 404 for err in errors.values()):
+        raise CalendarNotFoundError(cal_id)
+    raise_if_rate_limited(errors)
+    if errors:
+        local_id, err = next(iter(errors.items()))
+        raise Exception(f"{len(errors)} event(s) failed to sync, e.g. {local_id}: {err}")
+
+    synced = [
+        {
+            "local_id": ev.local_id,
+            "google_event_id": ev.google_event_id if ev.local_id in unchanged else responses[ev.local_id]['id'],
+        }
+        for ev in events if not ev.is_deleted
+    ]
+    return synced, skipped, failed_deletes
+
+
+async def _record_sync_state(email: str, cal_id: str, events: List[SyncEventRequest],
+                       synced_events: List[dict], replace: bool = False, failed_deletes: List[str] = ()) -> None:
+    """
+    Remember the hash of every synced event so the next sync can skip unchanged ones.
+
+    Deleted events leave the sync state, except failed_deletes, which are still in Google Calendar.
+    """
+    events_by_id = {ev.local_id: ev for ev in events}
+    try:
+        await save_sync_state(
+            email, cal_id,
+            [(e["local_id"], e["google_event_id"], _event_hash(events_by_id[e["local_id"]])) for e in synced_events],
+            removed=[ev.local_id for ev in events if ev.is_deleted and ev.local_id not in failed_deletes],
+            replace=replace
+        )
+    except Exception as e:
+        # The calendar itself is in sync; the next sync just won't be able to skip anything
+        print(f"Warning: failed to save sync state for {email}: {e}")
+
+
+def _list_calendar_events(service, cal_id: str) -> Dict[str, dict]:
+    """{event_id: event} for every event in a calendar. Raises CalendarNotFoundError if the calendar is gone."""
+    existing = {}
+    page_token = None
+    while True:
+        try:
+            events_result = service.events().list(
+                calendarId=cal_id, pageToken=page_token, maxResults=2500
+            ).execute()
+        except Exception as e:
+            if error_status(e) in GONE_STATUS_CODES:
+                raise CalendarNotFoundError(cal_id) from e
+            raise
+        existing.update((ev['id'], ev) for ev in events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return existing
+
+
+def _google_event_matches(google_event: dict, event: SyncEventRequest) -> bool:
+    body = _build_google_event_body(event)
+    return (
+        google_event.get('summary') == body['summary']
+        and (google_event.get('description') or '') == body['description']
+        and google_event.get('start', {}).get('date') == event.date
+    )
+
+
+def _reconcile_calendar_batched(service, cal_id: str, events: List[SyncEventRequest],
+                                synced_state: Optional[Dict[str, Tuple[str, str]]] = None) -> Tuple[List[dict], List[str], dict]:
+    """
+    Rebuild a calendar from what is actually in it instead of from the client's ids.
+
+    Lists the calendar once, then keeps every event that is already there with
+    the right content (found through the request's google_event_id or the
+    stored sync state), updates the ones that differ, inserts the missing ones
+    and deletes everything else, all as batch requests.
+
+    Returns (synced, reused, report) where reused are the local_ids left untouched.
+    """
+    synced_state = synced_state or {}
+    existing = _list_calendar_events(service, cal_id)
+    claimed = set()
+    mapping = {}
+    reused, updates, inserts = [], [], []
+    for ev in events:
+        if ev.is_deleted:
+            continue
+        known_ids = (ev.google_event_id, synced_state.get(ev.local_id, (None,))[0])
+        event_id = next((gid for gid in known_ids if gid in existing and gid not in claimed), None)
+        if event_id is None:
+            inserts.append((ev.local_id, service.events().insert(calendarId=cal_id, body=_build_google_event_body(ev))))
+            continue
+        claimed.add(event_id)
+        mapping[ev.local_id] = event_id
+        if _google_event_matches(existing[event_id], ev):
+            reused.append(ev.local_id)
+        else:
+            updates.append((ev.local_id, service.events().update(
+                calendarId=cal_id, eventId=event_id, body=_build_google_event_body(ev)
+            )))
+    strays = [event_id for event_id in existing if event_id not in claimed]
+
+    _, delete_errors = execute_batch(service, [
+        (event_id, service.events().delete(calendarId=cal_id, eventId=event_id)) for event_id in strays
+    ])
+    responses, errors = execute_batch(service, updates + inserts)
+    if any(error_status(errors[local_id]) == 404 for local_id, _ in inserts if local_id in errors):
+        raise CalendarNotFoundError(cal_id)
+    errors.update((k, v) for k, v in delete_errors.items() if error_status(v) not in GONE_STATUS_CODES)
+    raise_if_rate_limited(errors)
+    if errors:
+        key, err = next(iter(errors.items()))
+        raise Exception(f"Reconcile failed for {len(errors)} request(s), e.g. {key}: {err}")
+
+    mapping.update((local_id, responses[local_id]['id']) for local_id, _ in updates + inserts)
+    report = {
+        "mode": "reconcile",
+        "reused": len(reused),
+        "updated": len(updates),
+        "inserted": len(inserts),
+        "deleted": len(strays),
+    }
+    return [{"local_id": ev.local_id, "google_event_id": mapping[ev.local_id]} for ev in events if not ev.is_deleted], reused, report
+
+
+def _create_class_calendar(service, request: CalendarClassSyncRequest) -> str:
+    """Create a new secondary calendar for the class, with its colors, and return its id."""
+    new_cal = service.calendars().insert(body={'summary': request.class_name}).execute()
+    new_cal_id = new_cal['id']
+    if request.background_color or request.foreground_color:
+        _set_calendar_colors(service, new_cal_id, request.background_color, request.foreground_color)
+    return new_cal_id
+
+
+def _insert_events_batched(service, cal_id: str, events: List[SyncEventRequest]) -> List[dict]:
+    """Insert every event that isn't deleted into a new, empty calendar; one batch per 50 events."""
+    inserts = [
+        (ev.local_id, service.events().insert(calendarId=cal_id, body=_build_google_event_body(ev)))
+        for ev in events if not ev.is_deleted
+    ]
+    responses, errors = execute_batch(service, inserts)
+    raise_if_rate_limited(errors)
+    if errors:
+        local_id, err = next(iter(errors.items()))
+        raise Exception(f"Rebuild failed for {len(errors)} event(s), e.g. {local_id}: {err}")
+    return [{"local_id": key, "google_event_id": responses[key]['id']} for key, _ in inserts]
+
+
+async def _record_course_events(email: str, request: CalendarClassSyncRequest, cal_id: str) -> None:
+    """Keep the server's copy of the class's events and calendar id in step with what was synced."""
+    try:
+        await save_course_events(
+            email, request.class_name,
+            [ev.model_dump(include={'local_id', 'title', 'date', 'type', 'description'}) for ev in request.events if not ev.is_deleted],
+            removed=[ev.local_id for ev in request.events if ev.is_deleted],
+            google_calendar_id=cal_id
+        )
+    except Exception as e:
+        print(f"Warning: failed to save {request.class_name} events for {email}: {e}")
+
+
+async def _indexed_calendar_id(email: str, class_name: str) -> Optional[str]:
+    """The calendar id stored for (email, class_name); a database error is treated as a miss."""
+    try:
+        return await fetch_calendar_id(email, class_name)
+    except Exception as e:
+        print(f"Warning: calendar index lookup failed: {e}")
+        return None
+
+
+async def _find_or_create_indexed(service, email: str, request: CalendarClassSyncRequest,
+                                  calendars: Optional[Dict[str, str]] = None) -> str:
+    """_find_or_create_calendar on a worker thread, recording the result in the calendar index."""
+    cal_id = await asyncio.to_thread(_find_or_create_calendar, service, request.class_name,
+                                     request.background_color, request.foreground_color, calendars)
+    try:
+        await save_calendar_id(email, request.class_name, cal_id)
+    except Exception as e:
+        print(f"Warning: failed to index calendar {cal_id}: {e}")
+    return cal_id
+
+
+async def _forget_indexed_calendar(email: str, cal_id: str) -> None:
+    try:
+        await forget_calendar(email, cal_id)
+    except Exception as e:
+        print(f"Warning: failed to drop calendar {cal_id} from the index: {e}")
+    await watches.forget(email, cal_id)
+
+
+async def _take_remote_changes(email: str, request: CalendarClassSyncRequest, cal_id: str) -> Tuple[List[dict], List[str]]:
+    """
+    Fold edits made in Google Calendar (see _apply_calendar_changes) into a sync request.
+
+    An event the client sends as it last synced it is stale: it is replaced by the
+    server's newer copy, or dropped if it was deleted in Google Calendar, so the
+    sync doesn't undo the edit. An event the client changed itself is synced as sent.
+
+    Returns (remote_changes, resolved): the events to send back to the client,
+    and the local_ids whose remote changes this sync settles once it succeeds.
+    """
+    try:
+        pending = await fetch_remote_changes(email, cal_id)
+        if not pending:
+            return [], []
+        stored = {event["local_id"]: event for event in await fetch_events(email, request.class_name)}
+    except Exception as e:
+        print(f"Warning: failed to load remote changes for {email}: {e}")
+        return [], []
+
+    events, remote_changes, resolved = [], [], []
+    for ev in request.events:
+        change = pending.get(ev.local_id)
+        if change is None:
+            events.append(ev)
+            continue
+        resolved.append(ev.local_id)
+        base_hash, deleted = change
+        if ev.is_deleted or _event_hash(ev) != base_hash:
+            events.append(ev)
+        elif deleted or ev.local_id not in stored:
+            remote_changes.append({"local_id": ev.local_id, "google_event_id": ev.google_event_id, "is_deleted": True})
+        else:
+            server = stored[ev.local_id]
+            ev = ev.model_copy(update={field: server[field] for field in ('title', 'date', 'type', 'description')})
+            events.append(ev)
+            remote_changes.append(ev.model_dump(include={'local_id', 'title', 'date', 'type', 'description', 'google_event_id'}))
+    request.events = events
+    return remote_changes, resolved
+
+
+async def _sync_class(email: str, request: CalendarClassSyncRequest, service, cal_id: str) -> dict:
+    """
+    Steps 2-3 of /calendar/sync once the class's calendar is known.
+
+    The blocking Google API work runs on worker threads, so service must not be
+    used by another sync at the same time (see CalendarCredentialsCache.service).
+    """
+    remote_changes, resolved = await _take_remote_changes(email, request, cal_id)
+
+    rebuild = None
+
+    # ── Step 2: incremental sync (batched, unchanged events skipped) ──────────
+    try:
+        synced_state = await fetch_sync_state(email, cal_id)
+    except Exception as e:
+        print(f"Warning: failed to load sync state for {email}: {e}")
+        synced_state = {}
+    try:
+        synced_events, skipped_events, failed_deletes = await asyncio.to_thread(
+            _sync_events_batched, service, cal_id, request.events, synced_state
+        )
+        await _record_sync_state(email, cal_id, request.events, synced_events, failed_deletes=failed_deletes)
+
+    except CalendarNotFoundError:
+        raise
+    except Exception as incremental_err:
+        if rate_limit_scope(incremental_err) is not None:
+            raise  # a rebuild would only need more of the quota that just ran out
+        # ── Step 3 (fallback): rebuild the calendar ───────────────────────────
+        print(f"Incremental sync failed ({incremental_err}), falling back to a rebuild.")
+        cal_id, synced_events, skipped_events, rebuild = await _rebuild_class_calendar(
+            email, request, service, cal_id, synced_state
+        )
+        await _record_sync_state(email, cal_id, request.events, synced_events, replace=True)
+        failed_deletes = []
+    await _record_course_events(email, request, cal_id)
+    if resolved:
+        try:
+            await clear_remote_changes(email, cal_id, resolved)
+        except Exception as e:
+            print(f"Warning: failed to clear remote changes for {email}: {e}")
+
+    result = {
+        "google_calendar_id": cal_id,
+        "synced_events": synced_events,
+        "skipped_events": skipped_events
+    }
+    if rebuild is not None:
+        result["rebuild"] = rebuild
+    if remote_changes:
+        # Edited or deleted in Google Calendar since the client last synced them
+        result["remote_changes"] = remote_changes
+    if failed_deletes:
+        # Still in Google Calendar; the client sends them as is_deleted again on its next sync
+        result["failed_deletes"] = failed_deletes
+    return result
+
+
+async def _rebuild_class_calendar(email: str, request: CalendarClassSyncRequest, service, cal_id: str,
+                                  synced_state: Dict[str, Tuple[str, str]]):
+    """
+    Reconcile the calendar with the request; if the calendar turns out to be gone, recreate it.
+
+    Any other reconcile error is raised: the calendar is never deleted to get
+    around a request Google rejects. Returns (cal_id, synced_events,
+    skipped_events, report); cal_id changes if the calendar was recreated.
+    """
+    try:
+        synced_events, skipped_events, report = await asyncio.to_thread(
+            _reconcile_calendar_batched, service, cal_id, request.events, synced_state
+        )
+        return cal_id, synced_events, skipped_events, report
+    except CalendarNotFoundError:
+        print(f"Calendar {cal_id} of {request.class_name} is gone, recreating it.")
+
+    new_cal_id = await asyncio.to_thread(_create_class_calendar, service, request)
+    try:
+        await clear_sync_state(email, cal_id)
+    except Exception as e:
+        print(f"Warning: failed to clear sync state for {email}: {e}")
+    await _forget_indexed_calendar(email, cal_id)
+    # Index the new calendar before filling it, so a failed insert doesn't orphan it
+    try:
+        await save_calendar_id(email, request.class_name, new_cal_id)
+    except Exception as e:
+        print(f"Warning: failed to index calendar {new_cal_id}: {e}")
+    synced_events = await asyncio.to_thread(_insert_events_batched, service, new_cal_id, request.events)
+    report = {"mode": "recreate", "inserted": len(synced_events), "replaced_calendar": cal_id}
+    return new_cal_id, synced_events, [], report
+
+
 @app.post('/calendar/sync', tags=['Syllabus to Calendar'])
-async def sync_class_calendar(email: str = Query(...), request: CalendarClassSyncRequest = Body(...)):
+async def sync_class_calendar(background_tasks: BackgroundTasks, email: str = Query(...),
+                              request: CalendarClassSyncRequest = Body(...)):
     """
     Idempotent sync of a class's events to a dedicated secondary Google Calendar.
 
-    - Creates the secondary calendar if it doesn't exist yet (find-or-create by name).
-    - Updates events that already have a google_event_id.
+    - Uses the request's google_calendar_id, else the one stored for (email, class_name);
+      only if neither exists is the calendar list scanned (find-or-create by name).
+      A known id is not checked up front: if the sync gets a 404 the calendar is
+      found or created again and the sync repeated.
+    - Updates events that already have a google_event_id, unless their content
+      hash matches what the last sync wrote (returned in skipped_events).
     - Inserts new events that have no google_event_id.
-    - Deletes events marked is_deleted=True (if they have a google_event_id).
-    - Falls back to a full rebuild if incremental sync fails.
+    - Deletes events marked is_deleted=True (if they have a google_event_id). Deletes
+      that fail are listed in failed_deletes and stay mapped, so they can be retried.
+    - Sends these mutations as batch requests; failed sub-requests are retried individually.
+    - Falls back to a rebuild if incremental sync fails: the calendar's events are
+      listed once and reconciled (matching events kept, others updated, inserted
+      or deleted in batches); if the calendar turns out to be gone, it is
+      recreated with a new id. The response then has a "rebuild" report.
+    - Answers 429 with a Retry-After, without a rebuild, when Google's rate limit
+      for the user or the project is reached (see calendar_quota.py).
+    - Stores the class's events and calendar id in the events/calendars tables.
+    - Events edited or deleted in Google Calendar since the client last synced
+      them are not overwritten if the client sends them unchanged: the server's
+      copy is kept and returned in remote_changes (deleted ones with is_deleted=True).
+    - Once answered, makes sure Google notifies the server of edits made to the
+      calendar in Google Calendar (see calendar_watch.py and /calendar/notifications).
 
     Returns the google_calendar_id and per-event mappings {local_id, google_event_id}.
     """
     try:
-        creds_json = fetch_user_creds(email)
+        creds_json = await fetch_user_creds(email)
         if not creds_json:
             return JSONResponse(status_code=401, content={"error": "User not authenticated."})
 
-        creds_data = json.loads(creds_json)
-        credentials = Credentials(
-            token=creds_data.get('token'),
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data.get('token_uri'),
-            client_id=creds_data.get('client_id'),
-            client_secret=creds_data.get('client_secret'),
-            scopes=creds_data.get('scopes')
-        )
-        service = build('calendar', 'v3', credentials=credentials)
+        # Calendar calls may wait for quota, so they run on worker threads with a service of their own
+        service = await asyncio.to_thread(calendar_credentials.service, email, creds_json)
 
         # ── Step 1: get or create the secondary calendar ──────────────────────
-        cal_id = None
-        if request.google_calendar_id:
-            try:
-                service.calendars().get(calendarId=request.google_calendar_id).execute()
-                cal_id = request.google_calendar_id
-                # Update colors for existing calendar if provided
-                if request.background_color or request.foreground_color:
-                    _set_calendar_colors(service, cal_id, request.background_color, request.foreground_color)
-            except Exception:
-                # Calendar was deleted externally — fall through to find-or-create
-                pass
-        if not cal_id:
-            cal_id = _find_or_create_calendar(service, request.class_name, request.background_color, request.foreground_color)
-
-        # ── Step 2: incremental sync ──────────────────────────────────────────
-        synced_events = []
+        # A known id is trusted; a calendar deleted externally shows up as a 404 during the sync
+        cal_id = request.google_calendar_id or await _indexed_calendar_id(email, request.class_name)
+        if cal_id:
+            # Update colors for existing calendar if provided
+            if request.background_color or request.foreground_color:
+                await asyncio.to_thread(_set_calendar_colors, service, cal_id, request.background_color, request.foreground_color)
+        else:
+            cal_id = await _find_or_create_indexed(service, email, request)
+
         try:
-            for event in request.events:
-                if event.is_deleted:
-                    if event.google_event_id:
-                        try:
-                            service.events().delete(
-                                calendarId=cal_id, eventId=event.google_event_id
-                            ).execute()
-                        except Exception:
-                            pass  # already deleted — that's fine
-                    # deleted events are not returned in synced_events
-                elif event.google_event_id:
-                    # Update existing event
-                    updated = service.events().update(
-                        calendarId=cal_id,
-                        eventId=event.google_event_id,
-                        body=_build_google_event_body(event)
-                    ).execute()
-                    synced_events.append({"local_id": event.local_id, "google_event_id": updated['id']})
-                else:
-                    # Insert new event
-                    created = service.events().insert(
-                        calendarId=cal_id,
-                        body=_build_google_event_body(event)
-                    ).execute()
-                    synced_events.append({"local_id": event.local_id, "google_event_id": created['id']})
-
-        except Exception as incremental_err:
-            # ── Fallback: rebuild the entire calendar ─────────────────────────
-            print(f"Incremental sync failed ({incremental_err}), falling back to full rebuild.")
-            # Delete all events in the calendar
-            page_token = None
-            while True:
-                events_result = service.events().list(
-                    calendarId=cal_id, pageToken=page_token
-                ).execute()
-                for ev in events_result.get('items', []):
-                    try:
-                        service.events().delete(calendarId=cal_id, eventId=ev['id']).execute()
-                    except Exception:
-                        pass
-                page_token = events_result.get('nextPageToken')
-                if not page_token:
-                    break
-
-            synced_events = []
-            for event in request.events:
-                if event.is_deleted:
-                    continue
-                created = service.events().insert(
-                    calendarId=cal_id,
-                    body=_build_google_event_body(event)
-                ).execute()
-                synced_events.append({"local_id": event.local_id, "google_event_id": created['id']})
+            result = await _sync_class(email, request, service, cal_id)
+        except CalendarNotFoundError:
+            print(f"Calendar {cal_id} of {request.class_name} is gone, finding or creating it again.")
+            await _forget_indexed_calendar(email, cal_id)
+            cal_id = await _find_or_create_indexed(service, email, request)
+            result = await _sync_class(email, request, service, cal_id)
+        background_tasks.add_task(watches.ensure, email, result["google_calendar_id"], request.class_name)
+        return JSONResponse(status_code=200, content=result)
+
+    except Exception as e:
+        print(f"Calendar sync error: {e}")
+        import traceback
+        traceback.print_exc()
+        return _calendar_error_response(e, "Sync failed")
+    finally:
+        await _save_refreshed_credentials(email)
+
+
+@app.post('/calendar/sync/all', tags=['Syllabus to Calendar'])
+async def sync_all_class_calendars(background_tasks: BackgroundTasks, email: str = Query(...),
+                                   request: CalendarSyncAllRequest = Body(...)):
+    """
+    /calendar/sync for every class of a user in one call.
+
+    Calendars come from the request or the calendar index; one calendarList
+    fetch covers all classes neither knows. The classes are then synced concurrently, at most
+    CALENDAR_SYNC_CONCURRENCY at a time per user. Returns one result per class,
+    in request order, with the status /calendar/sync would have answered.
+    """
+    class_names = [cls.class_name for cls in request.classes]
+    if len(set(class_names)) != len(class_names):
+        return JSONResponse(status_code=400, content={"error": "Each class can only appear once."})
 
+    try:
+        creds_json = await fetch_user_creds(email)
+        if not creds_json:
+            return JSONResponse(status_code=401, content={"error": "User not authenticated."})
+
+        # Onboarding syncs many classes at once; interactive /calendar/sync calls go first
+        with quota_lane(BULK):
+            known_ids = [cls.google_calendar_id or await _indexed_calendar_id(email, cls.class_name) for cls in request.classes]
+            cal_ids = list(known_ids)
+            if not all(known_ids):
+                # One calendarList scan covers every class the index doesn't know
+                service = await asyncio.to_thread(calendar_credentials.service, email, creds_json)
+                calendars = await asyncio.to_thread(_list_calendars, service)
+                for i, cls in enumerate(request.classes):
+                    if not cal_ids[i]:
+                        try:
+                            cal_ids[i] = await _find_or_create_indexed(service, email, cls, calendars)
+                        except Exception as e:
+                            cal_ids[i] = e
+
+            async def sync_one(cls: CalendarClassSyncRequest, cal_id, known: bool):
+                try:
+                    if isinstance(cal_id, Exception):
+                        raise cal_id
+                    async with user_sync_limits.slot(email):
+                        class_service = await asyncio.to_thread(calendar_credentials.service, email, creds_json)
+                        if known and (cls.background_color or cls.foreground_color):
+                            await asyncio.to_thread(_set_calendar_colors, class_service, cal_id, cls.background_color, cls.foreground_color)
+                        try:
+                            result = await _sync_class(email, cls, class_service, cal_id)
+                        except CalendarNotFoundError:
+                            await _forget_indexed_calendar(email, cal_id)
+                            cal_id = await _find_or_create_indexed(class_service, email, cls)
+                            result = await _sync_class(email, cls, class_service, cal_id)
+                    return {"class_name": cls.class_name, "status": 200, **result}
+                except Exception as e:
+                    print(f"Calendar sync error for {cls.class_name}: {e}")
+                    status, message, wait = _calendar_error(e, "Sync failed")
+                    result = {"class_name": cls.class_name, "status": status, "error": message}
+                    if wait is not None:
+                        result["retry_after"] = wait
+                    return result
+
+            results = await asyncio.gather(*(
+                sync_one(cls, cal_id, bool(known)) for cls, cal_id, known in zip(request.classes, cal_ids, known_ids)
+            ))
+        for result in results:
+            if result["status"] == 200:
+                background_tasks.add_task(watches.ensure, email, result["google_calendar_id"], result["class_name"])
         return JSONResponse(status_code=200, content={
-            "google_calendar_id": cal_id,
-            "synced_events": synced_events
+            "classes": results,
+            "succeeded": sum(1 for r in results if r["status"] == 200),
+            "failed": sum(1 for r in results if r["status"] != 200)
         })
 
     except Exception as e:
         print(f"Calendar sync error: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(status_code=400, content={"error": f"Sync failed: {str(e)}"})
+        return _calendar_error_response(e, "Sync failed")
+    finally:
+        await _save_refreshed_credentials(email)
 
 
 @app.delete('/calendar', tags=['Syllabus to Calendar'])
 async def delete_class_calendar(email: str = Query(...), google_calendar_id: str = Query(...)):
     """Delete a secondary Google Calendar by its ID."""
     try:
-        creds_json = fetch_user_creds(email)
+        creds_json = await fetch_user_creds(email)
         if not creds_json:
             return JSONResponse(status_code=401, content={"error": "User not authenticated."})
 
-        creds_data = json.loads(creds_json)
-        credentials = Credentials(
-            token=creds_data.get('token'),
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data.get('token_uri'),
-            client_id=creds_data.get('client_id'),
-            client_secret=creds_data.get('client_secret'),
-            scopes=creds_data.get('scopes')
-        )
-        service = build('calendar', 'v3', credentials=credentials)
-        service.calendars().delete(calendarId=google_calendar_id).execute()
+        service = await asyncio.to_thread(calendar_credentials.service, email, creds_json)
+        await asyncio.to_thread(service.calendars().delete(calendarId=google_calendar_id).execute)
+        try:
+            await clear_sync_state(email, google_calendar_id)
+        except Exception as e:
+            print(f"Warning: failed to clear sync state for {email}: {e}")
+        await _forget_indexed_calendar(email, google_calendar_id)
         return JSONResponse(status_code=200, content={"message": "Calendar deleted."})
 
     except Exception as e:
         print(f"Calendar delete error: {e}")
-        return JSONResponse(status_code=400, content={"error": f"Failed to delete calendar: {str(e)}"})
+        return _calendar_error_response(e, "Failed to delete calendar")
+    finally:
+        await _save_refreshed_credentials(email)
+
+
+@app.post('/calendar/notifications', tags=['Syllabus to Calendar'])
+async def calendar_notification(
+    background_tasks: BackgroundTasks,
+    x_goog_channel_id: str = Header(...),
+    x_goog_resource_state: str = Header(...),
+    x_goog_resource_id: Optional[str] = Header(None),
+    x_goog_channel_token: Optional[str] = Header(None)
+):
+    """
+    Webhook for Google Calendar push notifications on the watched class calendars.
+
+    Notifications only say that a calendar changed. They are checked against
+    the channel's secret token, answered straight away, and the changes are
+    then pulled incrementally with the channel's syncToken. 'sync' messages,
+    sent when a channel opens, need no pull.
+    """
+    if not await watches.accept(x_goog_channel_id, x_goog_channel_token, x_goog_resource_id):
+        return JSONResponse(status_code=404, content={"error": "Unknown channel."})
+    if x_goog_resource_state != 'sync':
+        background_tasks.add_task(watches.pull, x_goog_channel_id)
+    return Response(status_code=200)
+
+
+async def _watch_service(email: str):
+    """A Calendar service for background work on a worker thread, None if the user has signed out."""
+    creds_json = await fetch_user_creds(email)
+    if not creds_json:
+        return None
+    return await asyncio.to_thread(calendar_credentials.service, email, creds_json)
+
+
+def _google_event_fields(google_event: dict) -> Tuple[str, str, str]:
+    """(title, date, description) of a Google event, in the form _build_google_event_body writes them."""
+    start = google_event.get('start', {})
+    date = start.get('date') or start.get('dateTime', '')[:10]
+    return google_event.get('summary') or '', date, google_event.get('description') or ''
+
+
+async def _apply_calendar_changes(channel: dict, google_events: List[dict], full: bool) -> int:
+    """
+    Bring the stored events of a watched class calendar in line with edits made in Google Calendar.
+
+    Only events this server synced (found in sync_state) are considered. A
+    cancelled event is deleted; an edited one gets its new title, date and
+    description, and sync_state the new hash. Both are recorded as remote
+    changes, which the client's next sync returns to it instead of overwriting
+    them (see _take_remote_changes). An event whose content hash matches
+    sync_state is this server's own write coming back and is ignored. With
+    full=True, google_events is the whole calendar and synced events missing
+    from it were deleted.
+
+    Returns the number of local events changed.
+    """
+    email, cal_id, course = channel["email"], channel["calendar_id"], channel["course"]
+    synced_state = await fetch_sync_state(email, cal_id)
+    by_google_id = {google_id: (local_id, content_hash) for local_id, (google_id, content_hash) in synced_state.items()}
+    stored = {event["local_id"]: event for event in await fetch_events(email, course)}
+
+    updated, removed, synced, remote, seen = [], [], [], [], set()
+    for google_event in google_events:
+        known = by_google_id.get(google_event.get('id'))
+        if known is None:
+            continue  # not an event Plannr created
+        local_id, content_hash = known
+        seen.add(google_event['id'])
+        if google_event.get('status') == 'cancelled':
+            removed.append(local_id)
+            remote.append((local_id, content_hash, True))
+            continue
+        title, date, description = _google_event_fields(google_event)
+        event_type = stored.get(local_id, {}).get('type')
+        new_hash = event_content_hash(title, date, description, event_type)
+        if new_hash == content_hash:
+            continue
+        updated.append({"local_id": local_id, "title": title, "date": date, "type": event_type, "description": description})
+        synced.append((local_id, google_event['id'], new_hash))
+        remote.append((local_id, content_hash, False))
+    if full:
+        gone = [(local_id, content_hash) for local_id, (google_id, content_hash) in synced_state.items() if google_id not in seen]
+        removed += [local_id for local_id, _ in gone]
+        remote += [(local_id, content_hash, True) for local_id, content_hash in gone]
+
+    if updated or removed:
+        await save_course_events(email, course, updated, removed=removed)
+        await save_sync_state(email, cal_id, synced, removed=removed)
+        await save_remote_changes(email, cal_id, remote)
+    return len(updated) + len(removed)
+
+
+@app.get('/stats', tags=['Ops'])
+async def get_stats():
+    """In-process counters for caches and worker pools."""
+    return {
+        "parse_cache": parse_cache.cache_stats(),
+        "extraction_pool": extraction_pool.stats(),
+        "gemini": gemini_client.stats(),
+        "calendar_quota": calendar_quota.stats(),
+        "calendar_watch": {**watches.stats(), "channels": await database.read(channel_store.channel_count)},
+        "database": database.stats(),
+        "credentials": db_manager.credential_cache_stats(),
+        "syllabus_jobs": {**job_runner.stats(), **await database.read(job_store.job_counts)}
+    }
 
 
 @app.post('/export', tags=['Export'])
@@ -749,7 +1738,7 @@ async def export_events(
             content={"error": "format must be 'ics' or 'csv'"}
         )
 
-    creds_json = fetch_user_creds(email)
+    creds_json = await fetch_user_creds(email)
     if not creds_json:
         return JSONResponse(
             status_code=401,
@@ -763,6 +1752,9 @@ async def export_events(
         )
 
     try:
+        # Validate up front: once streaming has started the status can't change to 400
+        for ev in request.events:
+            date_type.fromisoformat(ev.date)
         if format.lower() == 'ics':
             return _build_ics_response(request.events)
         else:
@@ -777,38 +1769,96 @@ async def export_events(
         )
 
 
+@app.post('/export/feed/token', tags=['Export'])
+async def export_feed_token(email: str = Query(...), rotate: bool = Query(False)):
+    """
+    The secret token for the user's /export/feed URL; rotate=true replaces it,
+    so calendar apps subscribed with the old URL stop receiving the feed.
+    """
+    creds_json = await fetch_user_creds(email)
+    if not creds_json:
+        return JSONResponse(
+            status_code=401,
+            content={"error": "User not authenticated. Please sign in with Google first."}
+        )
+    token = await issue_feed_token(email, rotate)
+    return JSONResponse(status_code=200, content={"token": token, "path": f"/export/feed?token={token}"})
+
+
+@app.get('/export/feed', tags=['Export'])
+async def export_feed(
+    token: str = Query(...),
+    format: str = Query('ics'),
+    course: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """
+    Subscribable .ics (or .csv) feed of every event stored for the user, or one course.
+
+    The user is identified by the secret token from POST /export/feed/token,
+    since calendar apps can't sign in. Built from the events saved by
+    /calendar/sync, so the client doesn't upload anything. Responses carry an
+    ETag and Last-Modified; a poll with a matching If-None-Match /
+    If-Modified-Since gets an empty 304 without the feed being rebuilt.
+    """
+    format = format.lower()
+    if format not in ['ics', 'csv']:
+        return JSONResponse(status_code=400, content={"error": "format must be 'ics' or 'csv'"})
+
+    email = await fetch_feed_owner(token)
+    if email is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown feed."})
+
+    count, last_modified = await fetch_events_version(email, course)
+    etag = '"' + hashlib.sha256(f"{format}|{course}|{count}|{last_modified}".encode()).hexdigest()[:32] + '"'
+    cache_headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(int(last_modified), usegmt=True),
+        'Cache-Control': 'private, no-cache'
+    }
+    if _feed_not_modified(etag, int(last_modified), if_none_match, if_modified_since):
+        return Response(status_code=304, headers=cache_headers)
+
+    events = await fetch_events(email, course)
+    # Same DTSTAMP for the same ETag, so an unchanged feed is byte-identical
+    dtstamp = datetime.fromtimestamp(last_modified, timezone.utc)
+    for event in events:
+        event['uid'] = event_uid(email, event['Class'], event['local_id'])
+        event['dtstamp'] = dtstamp
+    if format == 'ics':
+        response = _build_ics_response(events)
+    else:
+        response = _build_csv_response(events)
+    response.headers.update(cache_headers)
+    return response
+
+
+def _feed_not_modified(etag: str, last_modified: int, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if if_modified_since is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 def _build_ics_response(events: List[CalendarEvent]) -> StreamingResponse:
-    """Build a valid RFC 5545 iCalendar response from the given events."""
-    cal = ICalendar()
-    cal.add('prodid', '-//Plannr//Syllabus Export//EN')
-    cal.add('version', '2.0')
-    for ev in events:
-        vevent = ICalEvent()
-        vevent.add('summary', ev.title)
-        vevent.add('dtstart', date_type.fromisoformat(ev.date))
-        vevent.add('dtend', date_type.fromisoformat(ev.date))
-        if ev.description:
-            vevent.add('description', ev.description)
-        if ev.type:
-            vevent.add('categories', [ev.type])
-        cal.add_component(vevent)
-    buf = io.BytesIO(cal.to_ical())
+    """Stream a valid RFC 5545 iCalendar file, serialized one event at a time."""
     return StreamingResponse(
-        buf,
+        iter_ics(events),
         media_type='text/calendar',
         headers={'Content-Disposition': 'attachment; filename="events.ics"'}
     )
 
 
 def _build_csv_response(events: List[CalendarEvent]) -> StreamingResponse:
-    """Build a CSV response with columns: Title, Date, Type, Description."""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Title', 'Date', 'Type', 'Description'])
-    for ev in events:
-        writer.writerow([ev.title, ev.date, ev.type or '', ev.description or ''])
+    """Stream a CSV file with columns: Title, Date, Type, Description."""
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+        iter_csv(events),
         media_type='text/csv',
         headers={'Content-Disposition': 'attachment; filename="events.csv"'}
     )
@@ -0,0 +1,303 @@
+"""
+Client-side scheduling of Google Calendar API calls against Google's quotas.
+
+Every Calendar service handed out by CalendarCredentialsCache is wrapped by
+CalendarQuota.wrap, so each execute() and each batch takes tokens from two
+token buckets before it is sent: one for the user (Google's per-user
+per-minute quota) and one for the whole project. A batch costs one token per
+sub-request, which is how Google counts it. Callers that find the buckets empty
+wait on their worker thread instead of sending a request that would come back
+as rateLimitExceeded.
+
+Callers run in one of three lanes (quota_lane): interactive syncs take tokens
+first, bulk work (/calendar/sync/all) next, and background work only while no
+more urgent caller is waiting and some headroom is left in the buckets.
+
+A throttled response (429, or 403 with a rate-limit reason) pauses the user's
+or the project's bucket for its Retry-After, so the retry and every other
+caller sharing the bucket wait until Google accepts requests again. Single
+requests are resent; throttled batch sub-requests are retried by execute_batch.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from googleapiclient.errors import HttpError
+
+from google_calendar import BATCH_SIZE, PROJECT_SCOPE, USER_SCOPE, CalendarQuotaError, rate_limit_scope, retry_after
+
+INTERACTIVE, BULK, BACKGROUND = 'interactive', 'bulk', 'background'
+LANES = (INTERACTIVE, BULK, BACKGROUND)
+
+# Share of each bucket that background work leaves for the other lanes
+BACKGROUND_RESERVE = 0.25
+# Pause when a throttled response carries no Retry-After
+DEFAULT_THROTTLE_PAUSE = 1.0  # seconds
+# Throttled single requests are resent this many times before the error is raised
+THROTTLE_MAX_RETRIES = 3
+# Full buckets are dropped once more than this many users are tracked
+MAX_TRACKED_USERS = 1024
+
+_lane = contextvars.ContextVar('calendar_quota_lane', default=INTERACTIVE)
+
+
+@contextmanager
+def quota_lane(lane: str):
+    """Run the Calendar calls made inside the block (and in threads started from it) in lane."""
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class _TokenBucket:
+    """
+    Refills at (per_minute - burst) / 60 tokens a second up to burst tokens.
+
+    A full bucket plus a minute of refill is exactly per_minute requests, so
+    no sliding minute can go over the quota, even one that starts with a burst.
+    """
+
+    def __init__(self, per_minute: float, burst: int):
+        self.capacity = max(1, min(burst, int(per_minute)))
+        self.rate = max(per_minute - self.capacity, 1) / 60
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()  # may lie in the future while the bucket is paused
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost: int, now: float, reserve: float = 0) -> float:
+        """Seconds until cost tokens can be taken with reserve tokens left over."""
+        self._refill(now)
+        missing = cost + min(reserve, self.capacity - cost) - self.tokens
+        return max(0.0, self.updated - now) + max(0.0, missing) / self.rate
+
+    def take(self, cost: int) -> None:
+        self.tokens -= cost
+
+    def pause(self, until: float) -> None:
+        """Empty the bucket and hold off refilling until the given monotonic time."""
+        self.tokens = 0.0
+        self.updated = max(self.updated, until)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class CalendarQuota:
+    """
+    Per-user and per-project token buckets shared by all threads of the process.
+
+    acquire() blocks the calling thread, so Calendar calls that may wait for
+    quota must run on worker threads (asyncio.to_thread), never on the event loop.
+    A caller that would wait longer than max_wait gets CalendarQuotaError, which
+    the endpoints answer with 429 and a Retry-After.
+    """
+
+    def __init__(self, user_per_minute: float, project_per_minute: float, max_wait: float,
+                 user_burst: int = BATCH_SIZE, project_burst: Optional[int] = None):
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self._project = _TokenBucket(project_per_minute, project_burst or max(BATCH_SIZE, int(project_per_minute) // 6))
+        self._users: Dict[str, _TokenBucket] = {}
+        self._cond = threading.Condition()
+        self._waiting = {lane: 0 for lane in LANES}
+        self._lanes = {
+            lane: {"calls": 0, "requests": 0, "waited": 0, "wait_seconds": 0.0, "rejected": 0}
+            for lane in LANES
+        }
+        self._throttled = {USER_SCOPE: 0, PROJECT_SCOPE: 0}
+
+    def wrap(self, service, email: str):
+        """A proxy of service whose requests and batches go through this quota as email."""
+        return _QuotaService(service, self, email)
+
+    def _user_bucket(self, email: str) -> _TokenBucket:
+        bucket = self._users.get(email)
+        if bucket is None:
+            if len(self._users) >= MAX_TRACKED_USERS:
+                # A full bucket behaves exactly like a new one, so dropping it loses nothing
+                now = time.monotonic()
+                for idle in [e for e, b in self._users.items() if b.is_full(now)]:
+                    del self._users[idle]
+            bucket = self._users[email] = _TokenBucket(self.user_per_minute, self.user_burst)
+        return bucket
+
+    def _more_urgent_waiting(self, lane: str) -> bool:
+        return any(self._waiting[other] for other in LANES[:LANES.index(lane)])
+
+    def acquire(self, email: str, cost: int = 1, lane: Optional[str] = None) -> None:
+        """
+        Take cost tokens from email's bucket and the project bucket, waiting if needed.
+
+        Raises:
+            CalendarQuotaError: the tokens would not be available within max_wait
+        """
+        lane = lane or current_lane()
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._cond:
+            user = self._user_bucket(email)
+            cost = max(1, min(cost, user.capacity, self._project.capacity))
+            reserve = BACKGROUND_RESERVE if lane == BACKGROUND else 0
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    user_wait = user.wait_time(cost, now, reserve * user.capacity)
+                    project_wait = self._project.wait_time(cost, now, reserve * self._project.capacity)
+                    delay = max(user_wait, project_wait)
+                    if delay == 0 and not self._more_urgent_waiting(lane):
+                        user.take(cost)
+                        self._project.take(cost)
+                        break
+                    if now + delay > deadline or now >= deadline:
+                        self._lanes[lane]["rejected"] += 1
+                        scope = USER_SCOPE if user_wait >= project_wait else PROJECT_SCOPE
+                        raise CalendarQuotaError(
+                            f"Google Calendar {scope} quota is saturated", retry_after=max(delay, 1.0), scope=scope
+                        )
+                    # With tokens free but a more urgent lane waiting, recheck once it has gone
+                    self._cond.wait(delay or deadline - now)
+            finally:
+                self._waiting[lane] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            stats = self._lanes[lane]
+            stats["calls"] += 1
+            stats["requests"] += cost
+            if waited > 0.001:
+                stats["waited"] += 1
+                stats["wait_seconds"] += waited
+
+    def throttled(self, email: str, seconds: Optional[float], scope: str = USER_SCOPE) -> None:
+        """Google answered a request for email with a rate-limit error: pause the bucket it applies to."""
+        with self._cond:
+            bucket = self._project if scope == PROJECT_SCOPE else self._user_bucket(email)
+            bucket.pause(time.monotonic() + (seconds if seconds is not None else DEFAULT_THROTTLE_PAUSE))
+            self._throttled[scope] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._project._refill(now)
+            capacity = self._project.capacity
+            return {
+                "lanes": {lane: dict(stats, waiting=self._waiting[lane]) for lane, stats in self._lanes.items()},
+                "throttled": dict(self._throttled),
+                "users": len(self._users),
+                "paused_users": sum(1 for bucket in self._users.values() if bucket.updated > now),
+                "project_tokens": round(self._project.tokens, 1),
+                "project_capacity": capacity,
+                # Share of the project's burst currently used up; 1.0 means callers are waiting on refill
+                "saturation": round(1 - self._project.tokens / capacity, 3),
+            }
+
+
+class _QuotaProxy:
+    def __init__(self, target, quota: CalendarQuota, email: str):
+        self._target = target
+        self._quota = quota
+        self._email = email
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if callable(getattr(type(result), 'execute', None)):  # an HttpRequest
+                return _QuotaRequest(result, self._quota, self._email)
+            if result is None or isinstance(result, (dict, list, str, bytes, int, float, bool)):
+                return result
+            return _QuotaProxy(result, self._quota, self._email)
+
+        return call
+
+
+class _QuotaService(_QuotaProxy):
+    """Resources (service.events() ...) and batches of a service, metered by a CalendarQuota."""
+
+    def new_batch_http_request(self, callback=None, **kwargs):
+        return _QuotaBatch(self._target, callback, self._quota, self._email, **kwargs)
+
+
+class _QuotaRequest:
+    def __init__(self, request, quota: CalendarQuota, email: str):
+        self.request = request
+        self._quota = quota
+        self._email = email
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+    def execute(self, *args, **kwargs):
+        for attempt in range(THROTTLE_MAX_RETRIES + 1):
+            self._quota.acquire(self._email)
+            try:
+                return self.request.execute(*args, **kwargs)
+            except HttpError as e:
+                scope = rate_limit_scope(e)
+                if scope is None:
+                    raise
+                self._quota.throttled(self._email, retry_after(e), scope)
+                if attempt == THROTTLE_MAX_RETRIES:
+                    raise
+                print(f"Calendar request throttled ({e}); retrying")
+
+
+class _QuotaBatch:
+    """A batch whose execute() takes one token per sub-request and reports throttled sub-requests."""
+
+    def __init__(self, service, callback, quota: CalendarQuota, email: str, **kwargs):
+        self._quota = quota
+        self._email = email
+        self._callback = callback
+        self._count = 0
+        self._throttle = None  # (retry_after, scope) of a throttled sub-request
+        self._batch = service.new_batch_http_request(callback=self._on_response, **kwargs)
+
+    def add(self, request, callback=None, request_id=None):
+        if isinstance(request, _QuotaRequest):
+            request = request.request
+        self._count += 1
+        self._batch.add(request, callback=callback, request_id=request_id)
+
+    def _on_response(self, request_id, response, exception):
+        if exception is not None:
+            scope = rate_limit_scope(exception)
+            if scope is not None:
+                seconds = retry_after(exception)
+                if self._throttle is None or (seconds or 0) > (self._throttle[0] or 0):
+                    self._throttle = (seconds, scope)
+        if self._callback is not None:
+            self._callback(request_id, response, exception)
+
+    def execute(self, *args, **kwargs):
+        self._quota.acquire(self._email, self._count)
+        self._throttle = None
+        try:
+            return self._batch.execute(*args, **kwargs)
+        except HttpError as e:
+            # The batch request as a whole was throttled
+            scope = rate_limit_scope(e)
+            if scope is not None:
+                self._throttle = (retry_after(e), scope)
+            raise
+        finally:
+            if self._throttle is not None:
+                self._quota.throttled(self._email, *self._throttle)
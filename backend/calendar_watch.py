@@ -0,0 +1,288 @@
+"""
+Push notifications (watch channels) for the class calendars.
+
+After a class calendar is synced, WatchManager.ensure asks Google to watch its
+events (events().watch) with CALENDAR_WEBHOOK_URL, which points at
+POST /calendar/notifications. A notification carries no event data; it only
+says the calendar changed. The manager then pulls what changed since the last
+pull with the stored syncToken (events().list(syncToken=...)), so an edit
+made in Google Calendar costs one small list call instead of a client-driven
+reconciliation of the whole calendar. A 410 means Google dropped the token; the
+calendar is then pulled in full once and incremental pulls resume from there.
+
+Google ends every channel at its expiration, so a renewal task replaces each
+channel WATCH_RENEW_BEFORE ahead of time. Channels and sync tokens are kept in
+the watch_channels table (database/channel_store.py). All Calendar calls made
+here run in the background quota lane, behind interactive syncs.
+"""
+import asyncio
+import hmac
+import os
+import secrets
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from calendar_quota import quota_lane, BACKGROUND
+from database import channel_store
+from database.async_db import database
+from google_calendar import error_status, GONE_STATUS_CODES
+
+# Public HTTPS URL of POST /calendar/notifications; calendars are not watched without one
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL") or None
+WATCH_TTL = int(os.getenv("WATCH_TTL", str(7 * 24 * 3600)))  # channel lifetime asked of Google, seconds
+WATCH_RENEW_BEFORE = 24 * 3600  # channels are replaced this long before they expire
+WATCH_RENEW_INTERVAL = 3600  # seconds between renewal sweeps
+
+
+class SyncTokenExpiredError(Exception):
+    """Google no longer accepts the stored syncToken (410); the calendar must be pulled in full."""
+
+
+def start_watch(service, calendar_id: str, channel_id: str, address: str, token: str, ttl: int) -> dict:
+    """Open a web_hook channel on a calendar's events. Returns Google's channel resource."""
+    return service.events().watch(calendarId=calendar_id, body={
+        'id': channel_id,
+        'type': 'web_hook',
+        'address': address,
+        'token': token,
+        'params': {'ttl': str(ttl)},
+    }).execute()
+
+
+def stop_watch(service, channel_id: str, resource_id: str) -> None:
+    """Stop a channel; one Google has already dropped is not an error."""
+    try:
+        service.channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
+    except Exception as e:
+        if error_status(e) not in GONE_STATUS_CODES:
+            raise
+
+
+def list_changes(service, calendar_id: str, sync_token: Optional[str] = None) -> Tuple[List[dict], str]:
+    """
+    Events changed since sync_token, deleted ones with status 'cancelled', or every
+    event of the calendar if sync_token is None.
+
+    Returns (events, next_sync_token). Raises SyncTokenExpiredError if Google
+    answers 410; other errors (404 for a deleted calendar) are raised as they are.
+    """
+    events = []
+    page_token = None
+    while True:
+        try:
+            result = service.events().list(
+                calendarId=calendar_id, syncToken=sync_token, pageToken=page_token,
+                showDeleted=sync_token is not None, maxResults=2500
+            ).execute()
+        except Exception as e:
+            if sync_token is not None and error_status(e) == 410:
+                raise SyncTokenExpiredError(calendar_id) from e
+            raise
+        events.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return events, result.get('nextSyncToken')
+
+
+class WatchManager:
+    """
+    Opens, renews and stops watch channels, and pulls the changes they announce.
+
+    service_for(email) returns a Calendar service for a worker thread, or None if
+    the user is gone. apply_changes(channel, events, full) stores pulled events
+    and returns how many local events changed; full means events is the whole
+    calendar, so anything missing from it was deleted. after_use(email) runs
+    after each use of a user's service (e.g. to save a refreshed token).
+    """
+
+    def __init__(self, service_for: Callable[[str], Awaitable[object]],
+                 apply_changes: Callable[[dict, List[dict], bool], Awaitable[int]],
+                 after_use: Optional[Callable[[str], Awaitable[None]]] = None,
+                 address: Optional[str] = CALENDAR_WEBHOOK_URL, ttl: int = WATCH_TTL):
+        self.service_for = service_for
+        self.apply_changes = apply_changes
+        self.after_use = after_use
+        self.address = address
+        self.ttl = ttl
+        self._pulling = set()
+        self._dirty = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"notifications": 0, "pulls": 0, "full_pulls": 0, "tokens_expired": 0, "changes_applied": 0,
+                       "opened": 0, "renewed": 0, "dropped": 0, "errors": 0}
+
+    def start(self) -> None:
+        """Start the renewal task on the running loop; nothing to renew without a webhook URL."""
+        if not self.address:
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = asyncio.create_task(self._renewals(), name="calendar-watch-renewal")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def ensure(self, email: str, calendar_id: str, course: str) -> None:
+        """Watch a class calendar unless a channel that isn't about to expire already does."""
+        if not self.address:
+            return
+        try:
+            channel = await database.read(channel_store.channel_for_calendar, email, calendar_id)
+            if channel is not None and channel["expiration"] > time.time() + WATCH_RENEW_BEFORE:
+                return
+            await self._open(email, calendar_id, course, channel)
+        except Exception as e:
+            print(f"Warning: could not watch calendar {calendar_id} of {email}: {e}")
+            self._count("errors")
+
+    async def forget(self, email: str, calendar_id: str) -> None:
+        """Stop watching a calendar that was deleted or replaced."""
+        try:
+            channel = await database.read(channel_store.channel_for_calendar, email, calendar_id)
+            if channel is None:
+                return
+            await database.write(channel_store.delete_channel, channel["id"])
+            service = await self.service_for(email)
+            if service is None:
+                return
+            try:
+                with quota_lane(BACKGROUND):
+                    await asyncio.to_thread(stop_watch, service, channel["id"], channel["resource_id"])
+            finally:
+                if self.after_use is not None:
+                    await self.after_use(email)
+        except Exception as e:
+            print(f"Warning: could not stop watching calendar {calendar_id} of {email}: {e}")
+
+    async def _open(self, email: str, calendar_id: str, course: str, previous: Optional[dict] = None) -> None:
+        """Open a channel for the calendar, replacing previous (whose sync token carries over)."""
+        service = await self.service_for(email)
+        if service is None:
+            if previous is not None:
+                await database.write(channel_store.delete_channel, previous["id"])
+                self._count("dropped")
+            return
+        try:
+            channel_id, token = str(uuid.uuid4()), secrets.token_urlsafe(24)
+            with quota_lane(BACKGROUND):
+                response = await asyncio.to_thread(
+                    start_watch, service, calendar_id, channel_id, self.address, token, self.ttl
+                )
+            # Google reports the expiration in milliseconds
+            expiration = int(response.get("expiration") or 0) / 1000 or time.time() + self.ttl
+            sync_token = previous["sync_token"] if previous is not None else None
+            await database.write(channel_store.save_channel, channel_id, email, calendar_id, course,
+                                 response["resourceId"], token, expiration, sync_token)
+            self._count("renewed" if previous is not None else "opened")
+            if previous is not None:
+                try:
+                    with quota_lane(BACKGROUND):
+                        await asyncio.to_thread(stop_watch, service, previous["id"], previous["resource_id"])
+                except Exception as e:
+                    print(f"Warning: could not stop replaced watch channel {previous['id']}: {e}")
+        finally:
+            if self.after_use is not None:
+                await self.after_use(email)
+        if sync_token is None:
+            # The first pull is a full one; it yields the token later pulls start from
+            await self.pull(channel_id)
+
+    async def accept(self, channel_id: str, token: Optional[str], resource_id: Optional[str]) -> bool:
+        """True if a notification comes from one of our channels (its token and resource match)."""
+        channel = await database.read(channel_store.get_channel, channel_id)
+        if channel is None or not hmac.compare_digest(channel["token"], token or "") \
+                or channel["resource_id"] != resource_id:
+            return False
+        self._count("notifications")
+        return True
+
+    async def pull(self, channel_id: str) -> None:
+        """
+        Pull the changes of a channel's calendar.
+
+        Notifications that arrive while a pull for the same channel is running
+        don't start another one; they make the running one go round once more.
+        """
+        if channel_id in self._pulling:
+            self._dirty.add(channel_id)
+            return
+        self._pulling.add(channel_id)
+        try:
+            while True:
+                self._dirty.discard(channel_id)
+                await self._pull(channel_id)
+                if channel_id not in self._dirty:
+                    break
+        except Exception as e:
+            print(f"Warning: pulling changes of watch channel {channel_id} failed: {e}")
+            self._count("errors")
+        finally:
+            self._pulling.discard(channel_id)
+
+    async def _pull(self, channel_id: str) -> None:
+        channel = await database.read(channel_store.get_channel, channel_id)
+        if channel is None:
+            return
+        email, calendar_id, sync_token = channel["email"], channel["calendar_id"], channel["sync_token"]
+        service = await self.service_for(email)
+        if service is None:
+            return
+        try:
+            with quota_lane(BACKGROUND):
+                try:
+                    events, next_token = await asyncio.to_thread(list_changes, service, calendar_id, sync_token)
+                except SyncTokenExpiredError:
+                    print(f"Sync token of calendar {calendar_id} expired, pulling it in full.")
+                    self._count("tokens_expired")
+                    sync_token = None
+                    events, next_token = await asyncio.to_thread(list_changes, service, calendar_id, None)
+        except Exception as e:
+            if error_status(e) not in GONE_STATUS_CODES:
+                raise
+            # The calendar was deleted in Google Calendar; nothing left to watch
+            await database.write(channel_store.delete_channel, channel_id)
+            self._count("dropped")
+            return
+        finally:
+            if self.after_use is not None:
+                await self.after_use(email)
+
+        changed = await self.apply_changes(channel, events, sync_token is None)
+        # Only advance the token once the changes are stored, so a failed pull is repeated
+        await database.write(channel_store.set_sync_token, channel_id, next_token)
+        self._count("pulls")
+        self._count("full_pulls", int(sync_token is None))
+        self._count("changes_applied", changed)
+
+    async def renew_expiring(self) -> int:
+        """Replace every channel that expires within WATCH_RENEW_BEFORE. Returns how many were due."""
+        channels = await database.read(channel_store.expiring_channels, time.time() + WATCH_RENEW_BEFORE)
+        for channel in channels:
+            try:
+                await self._open(channel["email"], channel["calendar_id"], channel["course"], channel)
+            except Exception as e:
+                if error_status(e) in GONE_STATUS_CODES:
+                    await database.write(channel_store.delete_channel, channel["id"])
+                    self._count("dropped")
+                else:
+                    print(f"Warning: could not renew watch channel {channel['id']}: {e}")
+                    self._count("errors")
+        return len(channels)
+
+    async def _renewals(self) -> None:
+        while True:
+            try:
+                await self.renew_expiring()
+            except Exception as e:
+                print(f"Warning: watch channel renewal failed: {e}")
+            await asyncio.sleep(WATCH_RENEW_INTERVAL)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        self._stats[name] += n
+
+    def stats(self) -> dict:
+        return {"enabled": bool(self.address), "pulling": len(self._pulling), **self._stats}
@@ -0,0 +1,221 @@
+"""
+Async facade over db_manager for the FastAPI handlers.
+
+db_manager is synchronous; calling it from an async endpoint blocks the event
+loop for the whole disk wait. Here reads run on a small thread pool (WAL lets
+them proceed while a write is in progress) and writes go to one dedicated
+writer thread. Writes that arrive within DB_WRITE_BATCH_WINDOW_MS of each other
+are committed together in one transaction (db_manager.write_batch), and each
+caller is only answered once its batch has been committed.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import db_manager
+
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "2"))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ("fn", "args", "loop", "future")
+
+    def __init__(self, fn, args, loop, future):
+        self.fn = fn
+        self.args = args
+        self.loop = loop
+        self.future = future
+
+
+def _resolve(future, result=None, error=None):
+    if future.done():  # the awaiting handler was cancelled
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncDB:
+    """
+    Runs db_manager functions off the event loop.
+
+    Reads share a thread pool; writes are serialized on one thread and batched
+    into a single transaction when several arrive within batch_window seconds.
+    A write that fails only fails its own caller.
+    """
+
+    def __init__(self, read_workers: int, batch_window: float, batch_max: int):
+        self.read_workers = read_workers
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self._readers = None
+        self._writes = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._stats = {"reads": 0, "writes": 0, "batches": 0, "largest_batch": 0, "failed_batches": 0}
+
+    async def read(self, fn, *args):
+        """Run a db_manager read on the reader pool and return its result."""
+        with self._lock:
+            if self._readers is None:
+                self._readers = ThreadPoolExecutor(max_workers=self.read_workers, thread_name_prefix="db-read")
+            self._stats["reads"] += 1
+            readers = self._readers
+        return await asyncio.get_running_loop().run_in_executor(readers, fn, *args)
+
+    async def write(self, fn, *args):
+        """Queue a db_manager write for the writer thread; returns once it has been committed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="db-write", daemon=True)
+                self._writer.start()
+            self._stats["writes"] += 1
+        self._writes.put(_Write(fn, args, loop, future))
+        return await future
+
+    def _next_batch(self):
+        first = self._writes.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_max:
+            try:
+                item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._writes.put(_STOP)  # finish this batch, then stop
+                break
+            batch.append(item)
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            outcomes = []
+            try:
+                with db_manager.write_batch() as run:
+                    for write in batch:
+                        try:
+                            outcomes.append((write, run(write.fn, *write.args), None))
+                        except Exception as e:
+                            outcomes.append((write, None, e))
+            except Exception as e:
+                # The commit itself failed: none of the batch was written
+                print(f"Database write batch of {len(batch)} failed: {e}")
+                outcomes = [(write, None, e) for write in batch]
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            for write, result, error in outcomes:
+                try:
+                    write.loop.call_soon_threadsafe(_resolve, write.future, result, error)
+                except RuntimeError:
+                    pass  # the caller's event loop is gone
+        db_manager.close_connection()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued_writes"] = self._writes.qsize()
+        stats["mean_batch"] = stats["writes"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            writer, self._writer = self._writer, None
+            readers, self._readers = self._readers, None
+        if writer is not None:
+            self._writes.put(_STOP)
+            writer.join()
+        if readers is not None:
+            readers.shutdown(wait=True)
+
+
+database = AsyncDB(DB_READ_WORKERS, DB_WRITE_BATCH_WINDOW_MS / 1000, DB_WRITE_BATCH_MAX)
+
+
+# Async versions of the db_manager functions used by the API, same names and arguments
+
+async def fetch_user_creds(email):
+    # Cache hits are a dictionary lookup; don't pay for a thread hop
+    hit, creds = db_manager.cached_user_creds(email)
+    if hit:
+        return creds
+    return await database.read(db_manager.fetch_user_creds, email)
+
+
+async def update_creds(email, new_creds):
+    return await database.write(db_manager.update_creds, email, new_creds)
+
+
+async def fetch_sync_state(email, calendar_id):
+    return await database.read(db_manager.fetch_sync_state, email, calendar_id)
+
+
+async def save_sync_state(email, calendar_id, synced, removed=(), replace=False):
+    return await database.write(db_manager.save_sync_state, email, calendar_id, synced, removed, replace)
+
+
+async def clear_sync_state(email, calendar_id):
+    return await database.write(db_manager.clear_sync_state, email, calendar_id)
+
+
+async def fetch_remote_changes(email, calendar_id):
+    return await database.read(db_manager.fetch_remote_changes, email, calendar_id)
+
+
+async def save_remote_changes(email, calendar_id, changes):
+    return await database.write(db_manager.save_remote_changes, email, calendar_id, changes)
+
+
+async def clear_remote_changes(email, calendar_id, local_ids=None):
+    return await database.write(db_manager.clear_remote_changes, email, calendar_id, local_ids)
+
+
+async def save_course_events(email, course, events, removed=(), google_calendar_id=None):
+    return await database.write(db_manager.save_course_events, email, course, events, removed, google_calendar_id)
+
+
+async def fetch_calendar_id(email, course):
+    return await database.read(db_manager.fetch_calendar_id, email, course)
+
+
+async def save_calendar_id(email, course, google_calendar_id):
+    return await database.write(db_manager.save_calendar_id, email, course, google_calendar_id)
+
+
+async def forget_calendar(email, google_calendar_id):
+    return await database.write(db_manager.forget_calendar, email, google_calendar_id)
+
+
+async def fetch_events(email, course=None, start=None, end=None):
+    return await database.read(db_manager.fetch_events, email, course, start, end)
+
+
+async def fetch_events_version(email, course=None):
+    return await database.read(db_manager.fetch_events_version, email, course)
+
+
+async def issue_feed_token(email, rotate=False):
+    return await database.write(db_manager.issue_feed_token, email, rotate)
+
+
+async def fetch_feed_owner(token):
+    return await database.read(db_manager.fetch_feed_owner, token)
@@ -0,0 +1,179 @@
+import sqlite3
+import time
+from database import db_manager
+
+_COLUMNS = ('id', 'email', 'calendar_id', 'course', 'resource_id', 'token', 'expiration',
+            'sync_token', 'created_at', 'updated_at')
+
+
+def init_channel_store():
+    '''
+    Initialize the 'watch_channels' table if none exists.
+
+    Table Attributes:
+        id: channel id we chose when asking Google to watch the calendar, primary key to the table
+        email, calendar_id: the user and the class calendar being watched, one channel per pair
+        course: course name the calendar belongs to
+        resource_id: Google's id of the watched resource, needed to stop the channel
+        token: secret Google echoes in X-Goog-Channel-Token with every notification
+        expiration: unix time at which Google stops sending notifications
+        sync_token: nextSyncToken of the last pull, None until the first full pull
+        created_at, updated_at: unix times
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                create table if not exists watch_channels(
+                    id text primary key,
+                    email text not null,
+                    calendar_id text not null,
+                    course text not null,
+                    resource_id text not null,
+                    token text not null,
+                    expiration real not null,
+                    sync_token text,
+                    created_at real not null,
+                    updated_at real not null,
+                    unique (email, calendar_id)
+                )
+            ''')
+            cursor.execute('create index if not exists idx_watch_channels_expiration on watch_channels(expiration)')
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Channel Store Initialization Error: {e}")
+
+
+def _fetch(where, params):
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'select {", ".join(_COLUMNS)} from watch_channels where {where}', params)
+        return [dict(zip(_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def save_channel(channel_id, email, calendar_id, course, resource_id, token, expiration, sync_token=None):
+    '''
+    Record a new watch channel, replacing the previous channel of the same calendar.
+
+    Args:
+        channel_id, resource_id, token, expiration: as sent to and returned by events().watch
+        email, calendar_id, course: the watched class calendar
+        sync_token: carried over from the channel being replaced, if any
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            conn.execute('delete from watch_channels where email = ? and calendar_id = ?', (email, calendar_id))
+            conn.execute('''
+                insert into watch_channels(id, email, calendar_id, course, resource_id, token, expiration,
+                                           sync_token, created_at, updated_at)
+                values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (channel_id, email, calendar_id, course, resource_id, token, expiration, sync_token, now, now))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to save watch channel {channel_id}: {e}")
+
+
+def get_channel(channel_id):
+    '''
+    Fetch a channel by id.
+
+    Returns:
+        dict of the channel's columns, None if there is no such channel
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        channels = _fetch('id = ?', (channel_id,))
+        return channels[0] if channels else None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch watch channel {channel_id}: {e}")
+
+
+def channel_for_calendar(email, calendar_id):
+    '''
+    Fetch the channel watching one of a user's calendars.
+
+    Returns:
+        dict of the channel's columns, None if the calendar is not watched
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        channels = _fetch('email = ? and calendar_id = ?', (email, calendar_id))
+        return channels[0] if channels else None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s watch channel for {calendar_id}: {e}")
+
+
+def expiring_channels(before):
+    '''
+    Fetch the channels that expire before a unix time, soonest first.
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        return _fetch('expiration < ? order by expiration', (before,))
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch expiring watch channels: {e}")
+
+
+def set_sync_token(channel_id, sync_token):
+    '''
+    Store the nextSyncToken of a pull, the starting point of the next one.
+
+    Args:
+        channel_id: the channel's id
+        sync_token: the token, or None to make the next pull a full one
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            conn.execute('''
+                update watch_channels set sync_token = ?, updated_at = ? where id = ?
+            ''', (sync_token, time.time(), channel_id))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to update watch channel {channel_id}: {e}")
+
+
+def delete_channel(channel_id):
+    '''
+    Forget a channel, e.g. once it was stopped or its calendar was deleted.
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            conn.execute('delete from watch_channels where id = ?', (channel_id,))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to delete watch channel {channel_id}: {e}")
+
+
+def channel_count():
+    '''
+    Returns:
+        Number of channels currently recorded
+    '''
+    with db_manager.get_connection() as conn:
+        return conn.execute('select count(*) from watch_channels').fetchone()[0]
@@ -2,31 +2,269 @@ import sqlite3
 import json # I assume we are gonna use json for calendar info storage
 import os
 import pathlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 current_dir = pathlib.Path(__file__).parent.resolve()
 env_path = current_dir.parent / '.env'
 load_dotenv(dotenv_path=env_path)
-DB_NAME = current_dir / os.getenv("DB_FILEPATH", "SAMPLE.db")
+# init_db migrates the file in place, so the default is an untracked one; SAMPLE.db is only a template
+DB_NAME = current_dir / os.getenv("DB_FILEPATH", "plannr.db")
+# Bumped whenever init_db needs to migrate existing data
+SCHEMA_VERSION = 2
+# How long a statement waits for another writer's lock before "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per connection, in KiB
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+
+# Short enough that a token written by another worker process is picked up quickly
+CREDENTIALS_CACHE_TTL = float(os.getenv("CREDENTIALS_CACHE_TTL", "30"))
+CREDENTIALS_CACHE_SIZE = int(os.getenv("CREDENTIALS_CACHE_SIZE", "1024"))
+
+_local = threading.local()
+
+
+class _CredentialCache:
+    '''
+    Bounded LRU of users' stored credentials JSON with a TTL, keyed by (database, email).
+
+    Every invalidation bumps a per-key version; a fill is dropped if the key was
+    invalidated after its read began, so a slow reader can't put back a value
+    that an update_creds has already replaced.
+    '''
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, count_miss=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if count_miss:
+                self.misses += 1
+            return False, None
+
+    def version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def put(self, key, value, version):
+        with self._lock:
+            if self._versions.get(key, 0) != version:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                old_key, _ = self._entries.popitem(last=False)
+                self._versions.pop(old_key, None)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_creds_cache = _CredentialCache(CREDENTIALS_CACHE_SIZE, CREDENTIALS_CACHE_TTL)
+
+
+def get_connection():
+    '''
+    Return this thread's connection to DB_NAME, opening it on first use.
+
+    Connections are reused for the life of the thread instead of being opened per
+    call, which also keeps sqlite3's prepared statement cache warm. Each one runs
+    in WAL mode so readers don't block the writer, with synchronous=NORMAL (safe
+    in WAL), a larger page cache and a busy timeout. Write transactions begin
+    IMMEDIATE so a writer waits for the lock up front instead of failing halfway.
+    Use it as "with get_connection() as conn:", which commits or rolls back
+    but leaves the connection open.
+
+    Returns:
+        sqlite3.Connection owned by the calling thread
+
+    Raise:
+        sqlite3.Error: if the database can't be opened
+    '''
+    batch = getattr(_local, 'batch', None)
+    if batch is not None:
+        return batch
+
+    path = str(DB_NAME)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == path:
+        return conn
+
+    close_connection()
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           isolation_level='IMMEDIATE', cached_statements=256)
+    conn.execute('pragma journal_mode = WAL')
+    conn.execute('pragma synchronous = NORMAL')
+    conn.execute(f'pragma cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'pragma busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('pragma temp_store = MEMORY')
+    _local.conn, _local.path = conn, path
+    return conn
+
+def close_connection():
+    '''
+    Close the calling thread's connection, if it has one.
+    '''
+    conn = getattr(_local, 'conn', None)
+    _local.conn = _local.path = None
+    _local.batch = None
+    if conn is not None:
+        conn.close()
+
+class _BatchConnection:
+    '''
+    What get_connection() hands out inside write_batch(): the same connection,
+    but commits are left to the batch so its writes share one transaction.
+    '''
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+@contextmanager
+def write_batch():
+    '''
+    Run several db_manager writes on this thread as a single transaction.
+
+    Yields a run(fn, *args) function. Each call runs inside its own savepoint,
+    so a write that raises is undone on its own and the exception is re-raised
+    to the caller of run() without affecting the rest of the batch.
+
+    Raise:
+        sqlite3.Error: if the batch can't be committed; nothing in it was written
+    '''
+    conn = get_connection()
+    conn.execute('begin immediate')
+    _local.batch = _BatchConnection(conn)
+    _local.after_commit = []
+
+    def run(fn, *args):
+        conn.execute('savepoint batch_write')
+        try:
+            result = fn(*args)
+        except BaseException:
+            conn.execute('rollback to batch_write')
+            conn.execute('release batch_write')
+            raise
+        conn.execute('release batch_write')
+        return result
+
+    try:
+        yield run
+        _local.batch = None
+        conn.commit()
+    except BaseException:
+        _local.batch = None
+        conn.rollback()
+        raise
+    finally:
+        # Cache invalidations are safe to run whether or not the batch committed
+        callbacks, _local.after_commit = _local.after_commit, None
+        for callback in callbacks:
+            callback()
+
+def _after_commit(callback):
+    '''
+    Run callback once the current write is committed: now, or at the end of a write_batch().
+    '''
+    pending = getattr(_local, 'after_commit', None)
+    if getattr(_local, 'batch', None) is not None and pending is not None:
+        pending.append(callback)
+    else:
+        callback()
+
+def _creds_key(email):
+    return (str(DB_NAME), email)
+
+def cached_user_creds(email):
+    '''
+    Look up a user's credentials in the in-process cache only.
+
+    Args:
+        email: user's email
+
+    Returns:
+        (True, credentials JSON or None) on a hit, (False, None) on a miss
+    '''
+    # A miss here is followed by fetch_user_creds, which counts it
+    return _creds_cache.get(_creds_key(email), count_miss=False)
+
+def credential_cache_stats():
+    '''
+    Returns:
+        Size and hit/miss counters of the credentials cache
+    '''
+    return _creds_cache.stats()
 
 
 def init_db():
     '''
-    Initialize a new 'users' table if none exists.
+    Initialize the tables if none exist, and migrate old JSON blobs into them.
     Can be also used for database connection testing.
 
     Table Attributes:
-        email: user's email address, primary key to the table
-        google_credentials: tokens used for OAuth, stored as text in json format
-        calendar: user's calendar data, stored as text in json format
-        syllabi: user's parsed syllabi data, stored as text in json format
-
+        users:
+            email: user's email address, primary key to the table
+            google_credentials: tokens used for OAuth, stored as text in json format
+            calendar, syllabi: legacy JSON blobs, emptied once migrated (see _migrate_blobs)
+        courses: one row per (email, course name); updated_at changes whenever its events do
+        events: one row per deliverable of a course, keyed by (course_id, local_id)
+        calendars: the secondary google calendar each course is synced to
+        sync_state: google event id and content hash of every event last synced
+            to a user's class calendar
+        remote_changes: events edited or deleted in Google Calendar that the client
+            hasn't been sent yet, with the content hash the client last synced
+        feed_tokens: the secret in a user's /export/feed URL, one per user
 
     Raise:
         Exception: if failed to connect to the database
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        # Reopen so a configuration or file problem surfaces here, at startup
+        close_connection()
+        _creds_cache.clear()
+        with get_connection() as conn:
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -37,17 +275,123 @@ def init_db():
                     syllabi text
                 )
             ''')
-            
+
+            cursor.execute('''
+                create table if not exists courses(
+                    id integer primary key,
+                    email text not null,
+                    name text not null,
+                    updated_at real not null default 0,
+                    unique (email, name)
+                )
+            ''')
+
+            cursor.execute('''
+                create table if not exists events(
+                    id integer primary key,
+                    course_id integer not null references courses(id),
+                    email text not null,
+                    local_id text not null,
+                    title text not null,
+                    date text not null,
+                    type text,
+                    description text,
+                    updated_at real not null,
+                    unique (course_id, local_id)
+                )
+            ''')
+            cursor.execute('create index if not exists idx_events_email_date on events(email, date)')
+            cursor.execute('create index if not exists idx_events_course_date on events(course_id, date)')
+
+            cursor.execute('''
+                create table if not exists calendars(
+                    course_id integer primary key references courses(id),
+                    email text not null,
+                    google_calendar_id text not null
+                )
+            ''')
+            cursor.execute('create index if not exists idx_calendars_google_id on calendars(google_calendar_id)')
+
+            cursor.execute('''
+                create table if not exists sync_state(
+                    email text not null,
+                    calendar_id text not null,
+                    local_id text not null,
+                    google_event_id text not null,
+                    content_hash text not null,
+                    primary key (email, calendar_id, local_id)
+                )
+            ''')
+
+            cursor.execute('''
+                create table if not exists remote_changes(
+                    email text not null,
+                    calendar_id text not null,
+                    local_id text not null,
+                    base_hash text not null,
+                    deleted integer not null default 0,
+                    primary key (email, calendar_id, local_id)
+                )
+            ''')
+
+            cursor.execute('''
+                create table if not exists feed_tokens(
+                    email text primary key,
+                    token text unique not null,
+                    created_at real not null
+                )
+            ''')
+
+            cursor.execute('pragma user_version')
+            version = cursor.fetchone()[0]
+            if version < 1:
+                _migrate_blobs(cursor)
+            if version < 2:
+                cursor.execute('pragma table_info(courses)')
+                if 'updated_at' not in [column[1] for column in cursor.fetchall()]:
+                    cursor.execute('alter table courses add column updated_at real not null default 0')
+            if version < SCHEMA_VERSION:
+                cursor.execute(f'pragma user_version = {SCHEMA_VERSION}')
+
             conn.commit()
             print(f"Database Initialization Successful.")
 
     except sqlite3.Error as e:
         raise Exception(f"Database Connection Error: {e}")
 
+def _migrate_blobs(cursor):
+    '''
+    Move the legacy users.syllabi / users.calendar JSON blobs into the normalized tables.
+    A blob is emptied only once it has been moved; blobs in a shape we don't
+    recognize are left untouched and reported.
+    '''
+    cursor.execute('select email, syllabi, calendar from users where syllabi is not null or calendar is not null')
+    for email, syllabi_json, calendar_json in cursor.fetchall():
+        for column, blob, parse, store in (
+            ('syllabi', syllabi_json, _courses_from_syllabi, _store_courses),
+            ('calendar', calendar_json, _calendars_from_blob, _store_calendars),
+        ):
+            if blob is None:
+                continue
+            cursor.execute('savepoint migrate_blob')
+            try:
+                store(cursor, email, parse(json.loads(blob)))
+            except (ValueError, TypeError, AttributeError, KeyError) as e:
+                cursor.execute('rollback to migrate_blob')
+                cursor.execute('release migrate_blob')
+                print(f"Skipping migration of {email}'s {column}: {e}")
+                continue
+            cursor.execute('release migrate_blob')
+            cursor.execute(f'update users set {column} = NULL where email = ?', (email,))
+            print(f"Migrated {email}'s {column} into normalized tables.")
+
 def fetch_user_creds(email):
     '''
     Fetch user's google credentials based on their email.
     If the user already exist, auto-create a new user profile in the database.
+    Served from an in-process cache for up to CREDENTIALS_CACHE_TTL seconds;
+    update_creds and remove_user invalidate it. Only stored credentials are
+    cached, so a user who just signed in through another worker is seen at once.
 
     Args:
         email: user's email
@@ -58,8 +402,14 @@ def fetch_user_creds(email):
     Raise:
         Exception: if failed to connect to the database
     '''
+    key = _creds_key(email)
+    hit, creds = _creds_cache.get(key)
+    if hit:
+        return creds
+
+    version = _creds_cache.version(key)
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
 
             cursor.execute("select google_credentials from users where email = ?", (email,))
@@ -70,6 +420,8 @@ def fetch_user_creds(email):
             print(f"New user auto-created. No credentials acquired.")
             return None
         print(f"User {email} credentials acquired.")
+        if row[0] is not None:
+            _creds_cache.put(key, row[0], version)
         return row[0]
     
     except sqlite3.Error as e:
@@ -86,7 +438,7 @@ def add_user(email):
         Exception: if failed to connect to the database, or if the user already exists
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -113,13 +465,16 @@ def remove_user(email):
         Exception: if failed to connect to the database, or if the user does not exist
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
 
             cursor.execute('delete from users where email = ?', (email,))
-            
+
             if cursor.rowcount > 0:
+                for table in ('events', 'calendars', 'courses', 'sync_state', 'remote_changes', 'feed_tokens'):
+                    cursor.execute(f'delete from {table} where email = ?', (email,))
                 conn.commit()
+                _after_commit(lambda: _creds_cache.invalidate(_creds_key(email)))
                 print(f"User {email} removed.")
             else:
                 raise Exception(f"Failed to remove the user as user {email} does not exist.")
@@ -141,19 +496,18 @@ def update_creds(email, new_creds):
         Exception: if failed to connect to the database, or if the user does not exist
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('select syllabi from users where email = ?', (email,))
-            row = cursor.fetchone()
-            
-            if row:
-                new_data_json = json.dumps(new_creds)
-                cursor.execute('''
-                    update users 
-                    set google_credentials = ?
-                    where email = ?
-                ''', (new_data_json,email))
+            new_data_json = json.dumps(new_creds)
+            cursor.execute('''
+                update users 
+                set google_credentials = ?
+                where email = ?
+            ''', (new_data_json, email))
+
+            if cursor.rowcount > 0:
                 conn.commit()
+                _after_commit(lambda: _creds_cache.invalidate(_creds_key(email)))
                 print(f"Google Credentials updated for {email}.")
             else:
                 raise Exception(f"Failed to update user {email} credentials as the user does not exist.")
@@ -162,69 +516,569 @@ def update_creds(email, new_creds):
         raise Exception(f"Failed to update user {email}'s credentials: {e}")
 
 
+def _courses_from_syllabi(data):
+    '''
+    Normalize the shapes syllabi data has been stored in to [(course name, [event dicts])].
+
+    Accepts a list of {"course": ..., "events": [...]} entries, a single such entry,
+    or the flat {"events": [...]} / [event, ...] output of /syllabus where each
+    event names its course under "Class".
+    '''
+    if isinstance(data, dict):
+        data = [data] if 'course' in data else data.get('events', [])
+    courses = {}
+    for entry in data:
+        if 'course' in entry:
+            courses.setdefault(entry['course'], []).extend(entry.get('events', []))
+        else:
+            courses.setdefault(entry.get('Class') or 'unknown', []).append(entry)
+    return list(courses.items())
+
+def _calendars_from_blob(data):
+    '''
+    Normalize calendar data to [(course name, google calendar id)].
+
+    Accepts a {course name: calendar id} dict or a list of entries naming the
+    course ("course"/"class_name") and its "google_calendar_id".
+    '''
+    if isinstance(data, dict):
+        return [(course, cal_id) for course, cal_id in data.items() if isinstance(cal_id, str)]
+    return [
+        (entry.get('course') or entry['class_name'], entry['google_calendar_id'])
+        for entry in data
+    ]
+
+def _course_id(cursor, email, course):
+    cursor.execute('insert or ignore into courses(email, name) values (?, ?)', (email, course))
+    cursor.execute('select id from courses where email = ? and name = ?', (email, course))
+    return cursor.fetchone()[0]
+
+def _event_row(course_id, email, event):
+    # Parsed events carry no local_id; derive a stable one so re-imports replace instead of duplicating
+    local_id = event.get('local_id') or f"{event['title']}|{event['date']}"
+    return (course_id, email, local_id, event['title'], event['date'],
+            event.get('type'), event.get('description'), time.time())
+
+def _upsert_events(cursor, course_id, email, events):
+    # Rows whose content is unchanged are left alone, so re-saving the same events is not a change
+    cursor.executemany('''
+        insert into events(course_id, email, local_id, title, date, type, description, updated_at)
+        values (?, ?, ?, ?, ?, ?, ?, ?)
+        on conflict(course_id, local_id) do update set
+            title = excluded.title, date = excluded.date, type = excluded.type,
+            description = excluded.description, updated_at = excluded.updated_at
+        where title is not excluded.title or date is not excluded.date
+            or type is not excluded.type or description is not excluded.description
+    ''', [_event_row(course_id, email, event) for event in events])
+
+def _touch_course(cursor, course_id):
+    cursor.execute('update courses set updated_at = ? where id = ?', (time.time(), course_id))
+
+def _store_courses(cursor, email, courses):
+    for course, events in courses:
+        course_id = _course_id(cursor, email, course)
+        cursor.execute('delete from events where course_id = ?', (course_id,))
+        _upsert_events(cursor, course_id, email, events)
+        _touch_course(cursor, course_id)
+
+def _store_calendars(cursor, email, calendars):
+    cursor.executemany('''
+        insert or replace into calendars(course_id, email, google_calendar_id) values (?, ?, ?)
+    ''', [(_course_id(cursor, email, course), email, cal_id) for course, cal_id in calendars])
+
+def _require_user(cursor, email, what):
+    cursor.execute('select 1 from users where email = ?', (email,))
+    if cursor.fetchone() is None:
+        raise Exception(f"Failed to update user {email} {what} as the user does not exist.")
+
 def update_syllabi(email, new_syllabus_data):
     '''
-    Update the syllabi info of an existing user.
+    Replace the events of every course in new_syllabus_data; other courses are untouched.
 
     Args:
         email: user's email
-        new_syllabus_data: parsed syllabi text of that user
+        new_syllabus_data: parsed syllabi of that user, see _courses_from_syllabi for accepted shapes
     
     Raise:
         Exception: if failed to connect to the database, or if the user does not exist
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('select syllabi from users where email = ?', (email,))
-            row = cursor.fetchone()
-            
-            if row:
-                new_data_json = json.dumps(new_syllabus_data)
-                cursor.execute('''
-                    update users 
-                    set syllabi = ? 
-                    where email = ?
-                ''', (new_data_json, email))
-                conn.commit()
-                print(f"Syllabi updated for {email}.")
-            else:
-                raise Exception(f"Failed to update user {email} credentials as the user does not exist.")
+            _require_user(cursor, email, 'syllabi')
+            _store_courses(cursor, email, _courses_from_syllabi(new_syllabus_data))
+            conn.commit()
+            print(f"Syllabi updated for {email}.")
 
     except sqlite3.Error as e:
         raise Exception(f"Failed to update user {email}'s syllabi: {e}")
     
 def update_calendar(email, new_calendar):
     '''
-    Update the calendar info of an existing user.
+    Set the google calendar of one or more of a user's courses.
 
     Args:
         email: user's email
-        new_calendar: calendar info of that user
+        new_calendar: {course name: google calendar id}, or a list of
+            {"course"/"class_name", "google_calendar_id"} entries
     
     Raise:
         Exception: if failed to connect to the database, or if the user does not exist
     '''
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('select calendar from users where email = ?', (email,))
+            _require_user(cursor, email, 'calendar')
+            _store_calendars(cursor, email, _calendars_from_blob(new_calendar))
+            conn.commit()
+            print(f"Calendar updated for {email}.")
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to update user {email}'s calendar: {e}")
+
+def fetch_courses(email):
+    '''
+    Fetch a user's courses and the google calendar each one is synced to.
+
+    Args:
+        email: user's email
+
+    Returns:
+        List of {"name", "google_calendar_id"} sorted by name; google_calendar_id is None if never synced
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                select courses.name, calendars.google_calendar_id from courses
+                left join calendars on calendars.course_id = courses.id
+                where courses.email = ? order by courses.name
+            ''', (email,))
+            return [{"name": name, "google_calendar_id": cal_id} for name, cal_id in cursor.fetchall()]
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s courses: {e}")
+
+def fetch_calendar_id(email, course):
+    '''
+    Look up the google calendar a course was last synced to.
+
+    Args:
+        email: user's email
+        course: course name
+
+    Returns:
+        The google calendar id, None if the course has none recorded
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                select calendars.google_calendar_id from courses
+                join calendars on calendars.course_id = courses.id
+                where courses.email = ? and courses.name = ?
+            ''', (email, course))
             row = cursor.fetchone()
-            
-            if row:
-                new_data_json = json.dumps(new_calendar)
+            return row[0] if row is not None else None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s calendar for {course}: {e}")
+
+def save_calendar_id(email, course, google_calendar_id):
+    '''
+    Record the google calendar of a course, e.g. right after it was created.
+
+    Args:
+        email: user's email
+        course: course name, created if new
+        google_calendar_id: the calendar's id
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            _store_calendars(cursor, email, [(course, google_calendar_id)])
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to save user {email}'s calendar for {course}: {e}")
+
+def forget_calendar(email, google_calendar_id):
+    '''
+    Drop a google calendar from a user's courses, e.g. after it was deleted. The courses and events are kept.
+
+    Args:
+        email: user's email
+        google_calendar_id: the calendar's id
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            conn.execute('delete from calendars where email = ? and google_calendar_id = ?', (email, google_calendar_id))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to forget user {email}'s calendar {google_calendar_id}: {e}")
+
+def fetch_events(email, course=None, start=None, end=None):
+    '''
+    Fetch a user's events, optionally for one course and/or a date range.
+
+    Args:
+        email: user's email
+        course: course name, or None for every course
+        start, end: inclusive YYYY-MM-DD bounds, or None
+
+    Returns:
+        List of {"local_id", "title", "date", "type", "description", "Class"} sorted by date
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    query = '''
+        select events.local_id, events.title, events.date, events.type, events.description, courses.name
+        from events join courses on courses.id = events.course_id
+        where events.email = ?
+    '''
+    params = [email]
+    if course is not None:
+        query += ' and courses.name = ?'
+        params.append(course)
+    if start is not None:
+        query += ' and events.date >= ?'
+        params.append(start)
+    if end is not None:
+        query += ' and events.date <= ?'
+        params.append(end)
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query + ' order by events.date, events.id', params)
+            return [
+                {"local_id": local_id, "title": title, "date": date, "type": event_type,
+                 "description": description, "Class": course_name}
+                for local_id, title, date, event_type, description, course_name in cursor.fetchall()
+            ]
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s events: {e}")
+
+def save_course_events(email, course, events, removed=(), google_calendar_id=None):
+    '''
+    Insert or update individual events of one course without touching the others.
+
+    Args:
+        email: user's email
+        course: course name, created if new
+        events: event dicts with local_id, title, date and optionally type and description
+        removed: local_ids of events to delete
+        google_calendar_id: if given, record it as the course's google calendar
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            changes_before = conn.total_changes
+            course_id = _course_id(cursor, email, course)
+            _upsert_events(cursor, course_id, email, events)
+            cursor.executemany('delete from events where course_id = ? and local_id = ?',
+                               [(course_id, local_id) for local_id in removed])
+            if conn.total_changes != changes_before:
+                _touch_course(cursor, course_id)
+            if google_calendar_id:
+                _store_calendars(cursor, email, [(course, google_calendar_id)])
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to save user {email}'s events for {course}: {e}")
+
+def delete_course_event(email, course, local_id):
+    '''
+    Delete one event of a course.
+
+    Args:
+        email: user's email
+        course: course name
+        local_id: the event's local id
+
+    Returns:
+        True if an event was deleted
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                delete from events where local_id = ? and course_id =
+                    (select id from courses where email = ? and name = ?)
+            ''', (local_id, email, course))
+            deleted = cursor.rowcount > 0
+            if deleted:
                 cursor.execute('''
-                    update users 
-                    set calendar = ? 
-                    where email = ?
-                ''', (new_data_json, email))
-                conn.commit()
-                print(f"Calendar updated for {email}.")
+                    update courses set updated_at = ? where email = ? and name = ?
+                ''', (time.time(), email, course))
+            conn.commit()
+            return deleted
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to delete user {email}'s event {local_id}: {e}")
+
+def fetch_events_version(email, course=None):
+    '''
+    Cheap fingerprint of a user's events, for HTTP caching of exports.
+
+    Args:
+        email: user's email
+        course: course name, or None for every course
+
+    Returns:
+        (number of events, unix time of the last change to them, 0 if never)
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    course_filter = ' and courses.name = ?' if course is not None else ''
+    params = (email, course) if course is not None else (email,)
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('select coalesce(max(updated_at), 0) from courses where email = ?' + course_filter, params)
+            last_modified = cursor.fetchone()[0]
+            cursor.execute('''
+                select count(*) from events join courses on courses.id = events.course_id
+                where events.email = ?''' + course_filter, params)
+            count = cursor.fetchone()[0]
+            return count, last_modified
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s events version: {e}")
+
+def issue_feed_token(email, rotate=False):
+    '''
+    The secret token of a user's calendar feed URL, created on first use.
+
+    Args:
+        email: user's email
+        rotate: replace the token, so URLs handed out before stop working
+
+    Returns:
+        The token
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if not rotate:
+                cursor.execute('select token from feed_tokens where email = ?', (email,))
+                row = cursor.fetchone()
+                if row is not None:
+                    return row[0]
+            token = secrets.token_urlsafe(32)
+            cursor.execute('''
+                insert into feed_tokens(email, token, created_at) values (?, ?, ?)
+                on conflict(email) do update set token = excluded.token, created_at = excluded.created_at
+            ''', (email, token, time.time()))
+            conn.commit()
+            return token
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to issue user {email}'s feed token: {e}")
+
+def fetch_feed_owner(token):
+    '''
+    Look up whose calendar feed a token opens.
+
+    Args:
+        token: value returned by issue_feed_token
+
+    Returns:
+        The user's email, None if the token is unknown or was rotated
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('select email from feed_tokens where token = ?', (token,))
+            row = cursor.fetchone()
+            return row[0] if row is not None else None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to look up feed token: {e}")
+
+def fetch_sync_state(email, calendar_id):
+    '''
+    Fetch what was last synced to one of a user's class calendars.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+
+    Returns:
+        Dict of local_id -> (google_event_id, content_hash), empty if nothing was synced yet
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                select local_id, google_event_id, content_hash from sync_state
+                where email = ? and calendar_id = ?
+            ''', (email, calendar_id))
+            rows = cursor.fetchall()
+
+        return {local_id: (google_event_id, content_hash) for local_id, google_event_id, content_hash in rows}
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s sync state: {e}")
+
+def save_sync_state(email, calendar_id, synced, removed=(), replace=False):
+    '''
+    Record the result of a calendar sync.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+        synced: list of (local_id, google_event_id, content_hash) now in the calendar
+        removed: local_ids whose events were deleted from the calendar
+        replace: if True, forget every other event previously recorded for this calendar
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if replace:
+                cursor.execute('''
+                    delete from sync_state where email = ? and calendar_id = ?
+                ''', (email, calendar_id))
+            cursor.executemany('''
+                delete from sync_state where email = ? and calendar_id = ? and local_id = ?
+            ''', [(email, calendar_id, local_id) for local_id in removed])
+            cursor.executemany('''
+                insert or replace into sync_state(email, calendar_id, local_id, google_event_id, content_hash)
+                values (?, ?, ?, ?, ?)
+            ''', [(email, calendar_id, *row) for row in synced])
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to save user {email}'s sync state: {e}")
+
+def clear_sync_state(email, calendar_id):
+    '''
+    Forget everything synced to a class calendar, e.g. after the calendar is deleted.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    save_sync_state(email, calendar_id, [], replace=True)
+    clear_remote_changes(email, calendar_id)
+
+def fetch_remote_changes(email, calendar_id):
+    '''
+    Fetch the events of a class calendar changed in Google Calendar since the client last synced them.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+
+    Returns:
+        Dict of local_id -> (base_hash, deleted), where base_hash is the content hash the client last synced
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                select local_id, base_hash, deleted from remote_changes
+                where email = ? and calendar_id = ?
+            ''', (email, calendar_id))
+            rows = cursor.fetchall()
+
+        return {local_id: (base_hash, bool(deleted)) for local_id, base_hash, deleted in rows}
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch user {email}'s remote changes: {e}")
+
+def save_remote_changes(email, calendar_id, changes):
+    '''
+    Record events edited or deleted in Google Calendar. An event already recorded keeps
+    its base_hash, since the client still holds the content it synced before the first change.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+        changes: list of (local_id, base_hash, deleted)
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                insert into remote_changes(email, calendar_id, local_id, base_hash, deleted)
+                values (?, ?, ?, ?, ?)
+                on conflict (email, calendar_id, local_id) do update set deleted = excluded.deleted
+            ''', [(email, calendar_id, local_id, base_hash, int(deleted)) for local_id, base_hash, deleted in changes])
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to save user {email}'s remote changes: {e}")
+
+def clear_remote_changes(email, calendar_id, local_ids=None):
+    '''
+    Forget remote changes once the client's sync has resolved them.
+
+    Args:
+        email: user's email
+        calendar_id: google calendar id of the class calendar
+        local_ids: the events to forget, or None for every event of the calendar
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if local_ids is None:
+                cursor.execute('''
+                    delete from remote_changes where email = ? and calendar_id = ?
+                ''', (email, calendar_id))
             else:
-                raise Exception(f"Failed to update user {email} calendar as the user does not exist.")
+                cursor.executemany('''
+                    delete from remote_changes where email = ? and calendar_id = ? and local_id = ?
+                ''', [(email, calendar_id, local_id) for local_id in local_ids])
+            conn.commit()
 
     except sqlite3.Error as e:
-        raise Exception(f"Failed to update user {email}'s calendar: {e}")
+        raise Exception(f"Failed to clear user {email}'s remote changes: {e}")
 
 
 # --- Verification Block ---
@@ -250,13 +1104,10 @@ if __name__ == "__main__":
     ]
     update_syllabi("student@test.edu", syllabus_data)
 
-    # 3. Verify Data was Stored as JSON
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT syllabi FROM users WHERE email='student@test.edu'")
-    stored_json = c.fetchone()[0]
-    print("\n--- Raw Stored JSON ---")
-    print(stored_json)
+    # 3. Verify the events were stored as rows
+    print("\n--- Stored Events ---")
+    for event in fetch_events("student@test.edu"):
+        print(event)
     
     # 4. Remove User
     #remove_user("student@test.edu")
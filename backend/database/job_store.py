@@ -0,0 +1,335 @@
+import sqlite3
+import json
+import os
+import time
+from database import db_manager
+
+# Finished jobs (and their stored PDFs) are purged after this long
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))  # 1 day
+# Automatic attempts per job for transient failures (worker pool full, timeouts)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A job still 'running' after this long belongs to a worker that died; it is queued again
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "600"))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_COLUMNS = ('id', 'status', 'filename', 'pdf_path', 'size', 'events', 'cached', 'error',
+            'attempts', 'not_before', 'created_at', 'updated_at')
+
+
+def init_job_store():
+    '''
+    Initialize the 'syllabus_jobs' table if none exists.
+
+    Table Attributes:
+        id: random job id returned to the client, primary key to the table
+        status: one of queued, running, done, failed
+        filename, size: of the uploaded PDF
+        pdf_path: where the upload is kept so the job can be retried without a re-upload
+        events: parsed events once done, stored as text in json format
+        cached: 1 if the events came from the parse cache
+        error: message of the last failure
+        attempts: how many times a worker has picked the job up
+        not_before: unix time before which a queued job is not picked up (retry backoff)
+        created_at, updated_at: unix times
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                create table if not exists syllabus_jobs(
+                    id text primary key,
+                    status text not null,
+                    filename text,
+                    pdf_path text not null,
+                    size integer not null,
+                    events text,
+                    cached integer not null default 0,
+                    error text,
+                    attempts integer not null default 0,
+                    not_before real not null default 0,
+                    created_at real not null,
+                    updated_at real not null
+                )
+            ''')
+            cursor.execute('create index if not exists idx_syllabus_jobs_status on syllabus_jobs(status, created_at)')
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Job Store Initialization Error: {e}")
+
+
+def _row_to_job(row):
+    job = dict(zip(_COLUMNS, row))
+    job['events'] = json.loads(job['events']) if job['events'] is not None else None
+    job['cached'] = bool(job['cached'])
+    return job
+
+
+def create_job(job_id, filename, pdf_path, size):
+    '''
+    Queue a new parse job for an uploaded PDF.
+
+    Args:
+        job_id: random id for the job
+        filename: name of the uploaded file
+        pdf_path: path the upload was saved to
+        size: upload size in bytes
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            conn.execute('''
+                insert into syllabus_jobs(id, status, filename, pdf_path, size, created_at, updated_at)
+                values (?, ?, ?, ?, ?, ?, ?)
+            ''', (job_id, QUEUED, filename, str(pdf_path), size, now, now))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to create job {job_id}: {e}")
+
+
+def get_job(job_id):
+    '''
+    Fetch a job by id.
+
+    Args:
+        job_id: the job's id
+
+    Returns:
+        dict of the job's columns (events decoded), None if there is no such job
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'select {", ".join(_COLUMNS)} from syllabus_jobs where id = ?', (job_id,))
+            row = cursor.fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to fetch job {job_id}: {e}")
+
+
+def claim_next_job():
+    '''
+    Atomically move the oldest ready queued job to running and count the attempt.
+
+    Returns:
+        The claimed job as a dict, None if no job is ready
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute('''
+                    select id from syllabus_jobs where status = ? and not_before <= ?
+                    order by created_at limit 1
+                ''', (QUEUED, now))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                # Only one worker's update can see the job still queued
+                cursor.execute('''
+                    update syllabus_jobs set status = ?, attempts = attempts + 1, updated_at = ?
+                    where id = ? and status = ?
+                ''', (RUNNING, now, row[0], QUEUED))
+                claimed = cursor.rowcount > 0
+                conn.commit()
+                if claimed:
+                    break
+        return get_job(row[0])
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to claim a job: {e}")
+
+
+def _set_status(job_id, status, **fields):
+    assignments = ''.join(f', {column} = ?' for column in fields)
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                update syllabus_jobs set status = ?, updated_at = ?{assignments} where id = ?
+            ''', (status, time.time(), *fields.values(), job_id))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to update job {job_id}: {e}")
+
+
+def touch_job(job_id):
+    '''
+    Refresh a running job's updated_at so requeue_stale_jobs leaves it alone.
+
+    Returns:
+        True if the job is still running
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                update syllabus_jobs set updated_at = ? where id = ? and status = ?
+            ''', (time.time(), job_id, RUNNING))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to refresh job {job_id}: {e}")
+
+
+def finish_job(job_id, events, cached=False):
+    '''
+    Mark a job done with its parsed events.
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    _set_status(job_id, DONE, events=json.dumps(events), cached=int(cached), error=None)
+
+
+def fail_job(job_id, error, retry_in=None):
+    '''
+    Record a failed attempt.
+
+    Args:
+        job_id: the job's id
+        error: message shown to the client
+        retry_in: seconds after which to queue the job again, or None to mark it failed
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    if retry_in is None:
+        _set_status(job_id, FAILED, error=error)
+    else:
+        _set_status(job_id, QUEUED, error=error, not_before=time.time() + retry_in)
+
+
+def retry_job(job_id):
+    '''
+    Queue a failed job again, reusing the stored upload.
+
+    Returns:
+        True if the job was failed and is now queued
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                update syllabus_jobs set status = ?, attempts = 0, not_before = 0, updated_at = ?
+                where id = ? and status = ?
+            ''', (QUEUED, time.time(), job_id, FAILED))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to retry job {job_id}: {e}")
+
+
+def release_job(job_id):
+    '''
+    Put back a job that was claimed but never started (its worker was stopping).
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            conn.execute('''
+                update syllabus_jobs set status = ?, attempts = attempts - 1, updated_at = ?
+                where id = ? and status = ?
+            ''', (QUEUED, time.time(), job_id, RUNNING))
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to release job {job_id}: {e}")
+
+
+def requeue_stale_jobs():
+    '''
+    Queue again jobs left 'running' by a worker process that died or was restarted.
+
+    A job that has already been picked up JOB_MAX_ATTEMPTS times is failed
+    instead, so a PDF that takes its worker down isn't retried forever.
+
+    Returns:
+        Number of jobs queued again
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                update syllabus_jobs set status = ?, error = ?, updated_at = ?
+                where status = ? and updated_at < ? and attempts >= ?
+            ''', (FAILED, "Parsing was interrupted too many times", now, RUNNING, now - JOB_STALE_AFTER,
+                  JOB_MAX_ATTEMPTS))
+            if cursor.rowcount:
+                print(f"Failed {cursor.rowcount} stale syllabus job(s) that ran out of attempts.")
+            cursor.execute('''
+                update syllabus_jobs set status = ?, updated_at = ? where status = ? and updated_at < ?
+            ''', (QUEUED, now, RUNNING, now - JOB_STALE_AFTER))
+            conn.commit()
+            return cursor.rowcount
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to requeue stale jobs: {e}")
+
+
+def purge_expired_jobs():
+    '''
+    Delete finished jobs older than JOB_TTL.
+
+    Returns:
+        pdf_path of every purged job, for the caller to delete
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    cutoff = time.time() - JOB_TTL
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                select id, pdf_path from syllabus_jobs where status in (?, ?) and updated_at < ?
+            ''', (DONE, FAILED, cutoff))
+            expired = cursor.fetchall()
+            cursor.executemany('delete from syllabus_jobs where id = ?', [(job_id,) for job_id, _ in expired])
+            conn.commit()
+        return [pdf_path for _, pdf_path in expired]
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to purge jobs: {e}")
+
+
+def job_counts():
+    '''
+    Returns:
+        Number of jobs per status
+    '''
+    with db_manager.get_connection() as conn:
+        rows = conn.execute('select status, count(*) from syllabus_jobs group by status').fetchall()
+    return {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)} | dict(rows)
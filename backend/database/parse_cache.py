@@ -0,0 +1,229 @@
+import sqlite3
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from database import db_manager
+
+# Entries older than this are treated as misses and purged on the next write
+PARSE_CACHE_TTL = int(os.getenv("PARSE_CACHE_TTL", str(7 * 24 * 3600)))  # 7 days
+# Least recently used entries beyond this count are evicted
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "1000"))
+
+_stats_lock = threading.Lock()
+_stats = {"pdf_hits": 0, "text_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+# pdf_hash -> unix time of hits not yet written to last_used (see apply_touches)
+_touches = {}
+
+
+def pdf_hash(pdf_bytes):
+    '''
+    SHA-256 of the raw uploaded bytes, used as the primary cache key.
+    '''
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def text_hash(text):
+    '''
+    SHA-256 of the extracted text with whitespace collapsed, so that the same
+    syllabus exported twice (different PDF bytes, same content) shares an entry.
+    '''
+    normalized = re.sub(r'\s+', ' ', text).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def init_parse_cache():
+    '''
+    Initialize the 'parse_cache' table if none exists.
+
+    Table Attributes:
+        pdf_hash: SHA-256 of the uploaded PDF bytes, primary key to the table
+        text_hash: SHA-256 of the normalized extracted text
+        events: parsed events, stored as text in json format
+        created_at: unix time the entry was stored, used for TTL expiry
+        last_used: unix time of the last hit, used for LRU eviction
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                create table if not exists parse_cache(
+                    pdf_hash text primary key,
+                    text_hash text not null,
+                    events text not null,
+                    created_at real not null,
+                    last_used real not null
+                )
+            ''')
+            cursor.execute('create index if not exists idx_parse_cache_text_hash on parse_cache(text_hash)')
+            cursor.execute('create index if not exists idx_parse_cache_last_used on parse_cache(last_used)')
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Parse Cache Initialization Error: {e}")
+
+
+def _lookup(column, key, stat):
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                select pdf_hash, events from parse_cache
+                where {column} = ? and created_at > ?
+                order by last_used desc limit 1
+            ''', (key, now - PARSE_CACHE_TTL))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to read parse cache: {e}")
+
+    # Lookups are reads; the hit is written to last_used later, by the writer
+    with _stats_lock:
+        _stats[stat] += 1
+        _touches[row[0]] = now
+    return json.loads(row[1])
+
+
+def apply_touches():
+    '''
+    Write the last_used time of every hit since the last call, in one statement.
+
+    Lookups only read, so they can run on any reader thread; this is the write
+    half, to be run on the writer thread. store() applies pending touches too,
+    before it evicts anything.
+
+    Returns:
+        Number of entries touched
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    with _stats_lock:
+        touches = list(_touches.items())
+        _touches.clear()
+    if not touches:
+        return 0
+    try:
+        with db_manager.get_connection() as conn:
+            conn.executemany(
+                'update parse_cache set last_used = max(last_used, ?) where pdf_hash = ?',
+                [(used, key) for key, used in touches]
+            )
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to update parse cache: {e}")
+    return len(touches)
+
+
+def get_by_pdf_hash(key):
+    '''
+    Look up parsed events by the hash of the uploaded PDF bytes.
+
+    Args:
+        key: value returned by pdf_hash()
+
+    Returns:
+        The cached list of events, None on a miss or an expired entry
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    return _lookup('pdf_hash', key, 'pdf_hits')
+
+
+def get_by_text_hash(key):
+    '''
+    Look up parsed events by the hash of the normalized extracted text.
+
+    Args:
+        key: value returned by text_hash()
+
+    Returns:
+        The cached list of events, None on a miss or an expired entry
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    return _lookup('text_hash', key, 'text_hits')
+
+
+def record_miss():
+    '''
+    Count an upload that had to go through extraction and the LLM.
+    '''
+    with _stats_lock:
+        _stats["misses"] += 1
+
+
+def store(pdf_key, text_key, events):
+    '''
+    Store parsed events under both keys, then enforce TTL and size limits.
+
+    Args:
+        pdf_key: value returned by pdf_hash()
+        text_key: value returned by text_hash()
+        events: list of parsed events
+
+    Raise:
+        Exception: if failed to connect to the database
+    '''
+    apply_touches()  # so eviction sees the latest hits
+    now = time.time()
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                insert or replace into parse_cache(pdf_hash, text_hash, events, created_at, last_used)
+                values (?, ?, ?, ?, ?)
+            ''', (pdf_key, text_key, json.dumps(events), now, now))
+
+            cursor.execute('delete from parse_cache where created_at <= ?', (now - PARSE_CACHE_TTL,))
+            evicted = cursor.rowcount
+            cursor.execute('''
+                delete from parse_cache where pdf_hash in (
+                    select pdf_hash from parse_cache
+                    order by last_used desc limit -1 offset ?
+                )
+            ''', (PARSE_CACHE_MAX_ENTRIES,))
+            evicted += cursor.rowcount
+            conn.commit()
+
+    except sqlite3.Error as e:
+        raise Exception(f"Failed to write parse cache: {e}")
+
+    with _stats_lock:
+        _stats["stores"] += 1
+        _stats["evictions"] += evicted
+
+
+def cache_stats():
+    '''
+    Snapshot of the in-process hit/miss counters.
+
+    Returns:
+        dict of counters plus the overall hit rate
+    '''
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["pdf_hits"] + stats["text_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["pdf_hits"] + stats["text_hits"]) / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats():
+    '''
+    Zero the in-process counters.
+    '''
+    with _stats_lock:
+        for k in _stats:
+            _stats[k] = 0
+        _touches.clear()
@@ -0,0 +1,95 @@
+"""
+Streaming .ics and .csv exporters.
+
+Each exporter is a generator that serializes one event at a time and yields
+bytes in chunks of about EXPORT_CHUNK_BYTES, so a StreamingResponse can start
+sending immediately and memory stays constant however many events are exported.
+Events can be pydantic models or dicts with title, date, type and description,
+plus an optional uid (see event_uid) that calendar subscriptions use to match
+an event across refreshes, and an optional dtstamp (UTC datetime of the last
+change; the time of export otherwise).
+"""
+import csv
+import hashlib
+import io
+from datetime import date as date_type, datetime, timezone
+from typing import Iterable, Iterator
+
+from icalendar import Event as ICalEvent
+
+EXPORT_CHUNK_BYTES = 16 * 1024
+
+ICS_HEADER = b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Plannr//Syllabus Export//EN\r\n'
+ICS_FOOTER = b'END:VCALENDAR\r\n'
+CSV_COLUMNS = ['Title', 'Date', 'Type', 'Description']
+
+
+def _field(event, name):
+    if isinstance(event, dict):
+        return event.get(name)
+    return getattr(event, name, None)
+
+
+def _chunked(pieces: Iterable[bytes], size: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Join small pieces into chunks of roughly size bytes."""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def event_uid(email: str, course: str, local_id: str) -> str:
+    """UID that stays the same for an event however often it is edited or exported."""
+    digest = hashlib.sha256(f"{email}\n{course}\n{local_id}".encode('utf-8')).hexdigest()[:32]
+    return f"{digest}@plannr"
+
+
+def vevent_ical(event, dtstamp: datetime = None) -> bytes:
+    """One all-day VEVENT, serialized. DTSTAMP is required by RFC 5545; dtstamp is used if the event has none."""
+    vevent = ICalEvent()
+    if _field(event, 'uid'):
+        vevent.add('uid', _field(event, 'uid'))
+    vevent.add('dtstamp', _field(event, 'dtstamp') or dtstamp or datetime.now(timezone.utc))
+    vevent.add('summary', _field(event, 'title'))
+    event_date = date_type.fromisoformat(_field(event, 'date'))
+    vevent.add('dtstart', event_date)
+    vevent.add('dtend', event_date)
+    if _field(event, 'description'):
+        vevent.add('description', _field(event, 'description'))
+    if _field(event, 'type'):
+        vevent.add('categories', [_field(event, 'type')])
+    return vevent.to_ical()
+
+
+def iter_ics(events: Iterable) -> Iterator[bytes]:
+    """Yield an RFC 5545 calendar of all-day events, one VEVENT at a time."""
+    def pieces():
+        exported_at = datetime.now(timezone.utc)
+        yield ICS_HEADER
+        for event in events:
+            yield vevent_ical(event, exported_at)
+        yield ICS_FOOTER
+    return _chunked(pieces())
+
+
+def iter_csv(events: Iterable) -> Iterator[bytes]:
+    """Yield CSV rows (Title, Date, Type, Description), reusing one small row buffer."""
+    def pieces():
+        row = io.StringIO()
+        writer = csv.writer(row)
+        for values in _rows(events):
+            writer.writerow(values)
+            yield row.getvalue().encode('utf-8')
+            row.seek(0)
+            row.truncate()
+    return _chunked(pieces())
+
+
+def _rows(events):
+    yield CSV_COLUMNS
+    for event in events:
+        yield [_field(event, 'title'), _field(event, 'date'), _field(event, 'type') or '', _field(event, 'description') or '']
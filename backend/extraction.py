@@ -0,0 +1,491 @@
+"""
+PDF text extraction (PyPDF2 with an OCR fallback) and the process pool it runs in.
+
+Extraction is CPU-bound and, for scanned syllabi, takes tens of seconds, so the
+API never calls these functions on the event loop directly. Everything here must
+stay importable without importing app.py: worker processes only load this module.
+"""
+import asyncio
+import functools
+import mmap
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+from PyPDF2 import PdfReader
+
+OCR_DPI = 200
+# Size of the worker process pool (ExtractionPool in app.py)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages rasterized and OCR'd at once across every worker process; also the cap on page bitmaps in memory
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", str(os.cpu_count() or 1)))
+# Pages OCR'd concurrently within one document. OCR_CONCURRENCY bounds the total, so one
+# upload on an idle machine uses every core and concurrent uploads share them.
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", str(os.cpu_count() or 1)))
+# Per-page OCR classification thresholds (see page_needs_ocr)
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "40"))
+OCR_DENSE_PAGE_CHARS = int(os.getenv("OCR_DENSE_PAGE_CHARS", "400"))
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.4"))
+# How often progress reported by a worker process is forwarded to the caller (seconds)
+PROGRESS_POLL_INTERVAL = 0.1
+
+
+# In a worker process of an ExtractionPool: the semaphore its workers share (see _init_worker)
+_ocr_slots = None
+
+
+def _init_worker(ocr_slots) -> None:
+    """ProcessPoolExecutor initializer: take the pool's OCR semaphore."""
+    global _ocr_slots
+    _ocr_slots = ocr_slots
+
+
+class ExtractionBusyError(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class ExtractionTimeoutError(Exception):
+    """Raised when a single extraction job exceeds its deadline."""
+
+
+class QueueProgress:
+    """
+    Progress callback usable inside a worker process.
+
+    Forwards progress(stage, **data) to a multiprocessing.Manager queue that
+    ExtractionPool.run drains in the API process. Reporting is best-effort and
+    never fails the extraction.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def __call__(self, stage: str, **data) -> None:
+        try:
+            self.channel.put((stage, data))
+        except Exception as e:
+            print(f"Could not report progress: {e}")
+
+
+def extract_text_from_pdf(pdf_bytes: bytes, progress: Optional[Callable[..., None]] = None) -> str:
+    """
+    Extract text from PDF bytes, OCR'ing only the pages that need it.
+
+    Each page is classified on its own (see page_needs_ocr), so a typed syllabus
+    with a scanned schedule table OCRs just that page, and a scan with a few
+    typed pages skips OCR on those. progress, if given, is called with
+    ("text_layer", pages=, ocr_pages=) and then ("ocr_page", page=, done=, total=).
+    """
+    return _extract_text(BytesIO(pdf_bytes), lambda pages: ocr_pages(pdf_bytes, pages, progress), progress)
+
+
+def extract_text_from_file(pdf_path: str, progress: Optional[Callable[..., None]] = None) -> str:
+    """
+    extract_text_from_pdf for a PDF on disk.
+
+    The file is memory-mapped rather than read, so the worker never holds a
+    private copy of the upload, and OCR rasterizes straight from the path.
+    """
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_view:
+        return _extract_text(pdf_view, lambda pages: ocr_pdf_file(pdf_path, pages, progress), progress)
+
+
+def _extract_text(stream, ocr: Callable[[Optional[List[int]]], Dict[int, str]],
+                  progress: Optional[Callable[..., None]]) -> str:
+    """Text layer per page from stream, with ocr(pages) (all pages if None) filling in the rest."""
+    try:
+        pdf_reader = PdfReader(stream)
+        page_texts = []
+        scanned_pages = []
+        for page_number, page in enumerate(pdf_reader.pages, start=1):
+            page_text = page.extract_text() or ""
+            page_texts.append(page_text)
+            if page_needs_ocr(page, page_text):
+                scanned_pages.append(page_number)
+
+    except Exception as e:
+        print(f"Error extracting PDF text: {e}")
+        return _join_ocr_pages(ocr(None))
+
+    if progress is not None:
+        progress("text_layer", pages=len(page_texts), ocr_pages=len(scanned_pages))
+    print(f"PyPDF2 extracted {sum(len(t) for t in page_texts)} characters from {len(page_texts)} page(s)")
+    if scanned_pages:
+        print(f"OCR needed for page(s) {scanned_pages}")
+        ocr_texts = ocr(scanned_pages)
+        for page_number, ocr_text in ocr_texts.items():
+            # OCR reads the whole rendered page, including any text layer, so it replaces it
+            if ocr_text.strip():
+                page_texts[page_number - 1] = ocr_text
+
+    text = "\n".join(page_texts)
+    return text if text.strip() else ""
+
+
+def page_needs_ocr(page, page_text: str) -> bool:
+    """
+    Decide whether a page's text layer is missing or only covers part of it.
+
+    - Sparse text layer (under OCR_MIN_PAGE_CHARS): OCR it.
+    - Mostly image (a scan covering OCR_IMAGE_COVERAGE of the page) with only a
+      little text, e.g. a typed heading above a scanned schedule table: OCR it.
+    - Otherwise the text layer is trusted, including searchable scans whose
+      full-page image already carries an invisible OCR text layer.
+    """
+    chars = len(page_text.strip())
+    if chars < OCR_MIN_PAGE_CHARS:
+        return True
+    if chars >= OCR_DENSE_PAGE_CHARS:
+        return False
+    return page_image_coverage(page) >= OCR_IMAGE_COVERAGE
+
+
+def page_image_coverage(page) -> float:
+    """
+    Fraction of the page area covered by image XObjects, from the content stream.
+
+    Tracks the transformation matrix through q/Q/cm so each `Do` of an image
+    contributes the area of its unit square in page space. Returns 0.0 when the
+    content stream cannot be read.
+    """
+    try:
+        from PyPDF2.generic import ContentStream
+
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        image_names = {
+            name for name, ref in xobjects.items()
+            if ref.get_object().get("/Subtype") == "/Image"
+        }
+        if not image_names:
+            return 0.0
+
+        contents = page.get_contents()
+        if contents is None:
+            return 0.0
+
+        ctm = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+        stack = []
+        covered = 0.0
+        for operands, operator in ContentStream(contents, page.pdf).operations:
+            if operator == b"q":
+                stack.append(ctm)
+            elif operator == b"Q":
+                ctm = stack.pop() if stack else (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+            elif operator == b"cm":
+                ctm = _multiply_matrix(tuple(float(x) for x in operands), ctm)
+            elif operator == b"Do" and operands and operands[0] in image_names:
+                a, b, c, d = ctm[:4]
+                covered += abs(a * d - b * c)
+
+        page_area = float(page.mediabox.width) * float(page.mediabox.height)
+        return min(1.0, covered / page_area) if page_area else 0.0
+
+    except Exception as e:
+        print(f"Could not measure image coverage: {e}")
+        return 0.0
+
+
+def _multiply_matrix(m, n):
+    """m x n for PDF 3x2 affine matrices stored as (a, b, c, d, e, f)."""
+    return (
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    )
+
+
+def extract_text_via_ocr(pdf_bytes: bytes, progress: Optional[Callable[..., None]] = None) -> str:
+    """OCR every page of a scanned/image-based PDF."""
+    return _join_ocr_pages(ocr_pages(pdf_bytes, progress=progress))
+
+
+def _join_ocr_pages(page_texts: Dict[int, str]) -> str:
+    text = "".join(page_texts[n] + "\n" for n in sorted(page_texts))
+    print(f"OCR total: {len(text)} characters extracted")
+    return text
+
+
+def ocr_pages(pdf_bytes: bytes, pages: Optional[List[int]] = None,
+              progress: Optional[Callable[..., None]] = None) -> Dict[int, str]:
+    """OCR the given 1-based pages of PDF bytes (all pages if None). Returns {page_number: text}."""
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Write the PDF once; convert_from_bytes would re-write it for every page
+            pdf_path = os.path.join(tmp_dir, "upload.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+            return ocr_pdf_file(pdf_path, pages, progress)
+
+    except Exception as e:
+        print(f"OCR failed: {e}")
+        return {}
+
+
+def ocr_pdf_file(pdf_path: str, pages: Optional[List[int]] = None,
+                 progress: Optional[Callable[..., None]] = None) -> Dict[int, str]:
+    """
+    OCR the given 1-based pages of a PDF on disk (all pages if None). Returns {page_number: text}.
+
+    Pages are rasterized one at a time inside the OCR threads, so at most
+    OCR_PAGE_WORKERS page bitmaps exist at once regardless of page count (and
+    OCR_CONCURRENCY across a pool's workers, see ocr_page).
+    pdftoppm and tesseract are subprocesses, so threads give real parallelism.
+    A page that fails is left out of the result; the other pages are kept.
+    """
+    try:
+        from pdf2image import pdfinfo_from_path
+
+        if pages is None:
+            pages = list(range(1, int(pdfinfo_from_path(pdf_path)["Pages"]) + 1))
+        if not pages:
+            return {}
+        workers = max(1, min(OCR_PAGE_WORKERS, len(pages)))
+        print(f"OCR: {len(pages)} page(s) across {workers} thread(s)")
+        if workers > 1:
+            # One tesseract per core; its internal OpenMP threads would oversubscribe
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+        done = 0
+        done_lock = threading.Lock()
+
+        def run_page(page_number):
+            nonlocal done
+            try:
+                page_text = ocr_page(pdf_path, page_number)
+            except Exception as e:
+                print(f"OCR page {page_number} failed: {e}")
+                page_text = None
+            if progress is not None:
+                with done_lock:
+                    done += 1
+                    progress("ocr_page", page=page_number, done=done, total=len(pages))
+            return page_text
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            page_texts = executor.map(run_page, pages)
+            return {n: text for n, text in zip(pages, page_texts) if text is not None}
+
+    except Exception as e:
+        print(f"OCR failed: {e}")
+        return {}
+
+
+def ocr_page(pdf_path: str, page_number: int) -> str:
+    """
+    Rasterize a single page (1-based) and OCR it.
+
+    In a pool worker this waits for one of the pool's OCR_CONCURRENCY slots, so
+    concurrent uploads share the cores instead of oversubscribing them.
+    """
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    with _ocr_slots if _ocr_slots is not None else nullcontext():
+        images = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=page_number, last_page=page_number)
+        try:
+            page_text = "".join(pytesseract.image_to_string(image) for image in images)
+        finally:
+            for image in images:
+                image.close()
+    print(f"OCR page {page_number}: {len(page_text)} characters")
+    return page_text
+
+
+class ExtractionPool:
+    """
+    A ProcessPoolExecutor with a bounded backlog and a per-job deadline.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker; anything beyond that is rejected immediately with ExtractionBusyError
+    so the caller can answer 429 instead of piling up uploads in memory.
+
+    Workers are started by a forkserver, not forked from the API process, so
+    they don't inherit its threads or the locks those hold.
+    A job that times out may be stuck (a hung pdftoppm or tesseract) and a
+    running process can't be interrupted, so its pool is retired: new jobs go
+    to a fresh pool, and the old one's processes are killed as soon as only
+    timed-out jobs are left in it.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload([__name__])
+        self._executor = None
+        self._manager = None
+        self._lock = threading.Lock()
+        self._live: Dict[ProcessPoolExecutor, set] = {}  # unfinished jobs per pool
+        self._hung: Dict[ProcessPoolExecutor, set] = {}  # timed-out jobs of retired pools
+        self._pending = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._killed_pools = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # A fresh semaphore per pool: a killed worker may have died holding a slot
+            ocr_slots = self._context.BoundedSemaphore(OCR_CONCURRENCY)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=self._context,
+                initializer=_init_worker, initargs=(ocr_slots,)
+            )
+            self._live[self._executor] = set()
+        return self._executor
+
+    def _job_done(self, executor: ProcessPoolExecutor, future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._live.get(executor, set()).discard(future)
+            kill = self._only_hung_jobs_left(executor)
+        if kill:
+            self._kill(executor)
+
+    def _only_hung_jobs_left(self, executor: ProcessPoolExecutor) -> bool:
+        """With the lock held: whether a retired pool is down to its timed-out jobs; if so, forget it."""
+        hung = self._hung.get(executor)
+        if hung is None or not self._live.get(executor, set()) <= hung:
+            return False
+        del self._hung[executor]
+        self._live.pop(executor, None)
+        return True
+
+    def _retire(self, executor: ProcessPoolExecutor, future) -> None:
+        """Stop giving jobs to the pool whose worker is stuck on future, and kill it once its other jobs are done."""
+        with self._lock:
+            self._timeouts += 1
+            if self._executor is executor:
+                self._executor = None
+            self._hung.setdefault(executor, set()).add(future)
+            kill = self._only_hung_jobs_left(executor)
+        if kill:
+            self._kill(executor)
+
+    def _kill(self, executor: ProcessPoolExecutor) -> None:
+        # The timed-out jobs fail with BrokenProcessPool, which frees their slots
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._killed_pools += 1
+
+    def _progress_channel(self):
+        # Only a Manager queue can be handed to an already running worker process
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._context.Manager()
+            return self._manager.Queue()
+
+    async def run(self, fn, *args, progress: Optional[Callable[..., None]] = None):
+        """
+        Run fn(*args) in a worker process and await its result.
+
+        If progress is given, fn is called with a progress=QueueProgress keyword
+        argument and every report it makes is passed on to progress(stage, **data)
+        on the event loop while the job runs.
+        """
+        kwargs = {}
+        channel = None
+        if progress is not None:
+            channel = await asyncio.to_thread(self._progress_channel)
+            kwargs["progress"] = QueueProgress(channel)
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExtractionBusyError("Too many documents are being processed right now. Please try again shortly.")
+            self._pending += 1
+            try:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(fn, *args, **kwargs)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM on a huge scan); start a fresh pool
+                    self._live.pop(executor, None)
+                    self._executor = None
+                    executor = self._get_executor()
+                    future = executor.submit(fn, *args, **kwargs)
+            except BaseException:
+                self._pending -= 1
+                raise
+            self._live[executor].add(future)
+        future.add_done_callback(functools.partial(self._job_done, executor))
+        forwarder = None
+        if channel is not None:
+            forwarder = asyncio.ensure_future(_forward_progress(channel, progress, future.done))
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+            if forwarder is not None:
+                await forwarder  # deliver the last reports before the result
+            return result
+        except asyncio.TimeoutError:
+            self._retire(executor, future)
+            raise ExtractionTimeoutError(f"Text extraction took longer than {self.timeout:.0f} seconds.")
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            if forwarder is not None and not forwarder.done():
+                forwarder.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pending,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "killed_pools": self._killed_pools,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+            retired = list(self._hung)
+            self._hung.clear()
+            self._live.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for stuck in retired:
+            self._kill(stuck)
+        if manager is not None:
+            manager.shutdown()
+
+
+def _drain(channel, timeout: float) -> list:
+    """Wait up to timeout for one progress report, then take whatever else is queued."""
+    reports = []
+    try:
+        reports.append(channel.get(timeout=timeout))
+        while True:
+            reports.append(channel.get_nowait())
+    except queue.Empty:
+        pass
+    return reports
+
+
+async def _forward_progress(channel, progress: Callable[..., None], finished: Callable[[], bool]) -> None:
+    """Pass reports from a worker's channel to progress until the job has finished and the channel is empty."""
+    while True:
+        was_finished = finished()
+        for stage, data in await asyncio.to_thread(_drain, channel, PROGRESS_POLL_INTERVAL):
+            progress(stage, **data)
+        if was_finished:
+            return
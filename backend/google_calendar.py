@@ -0,0 +1,324 @@
+"""
+Helpers for talking to the Google Calendar API efficiently.
+
+- OAuth credentials are cached per user (CalendarCredentialsCache); Calendar
+  services are built on them from a discovery document parsed once per process.
+- Event mutations are sent as HTTP batch requests (one round trip per
+  BATCH_SIZE calls) instead of one execute() per event; sub-requests that fail
+  transiently are retried on their own instead of failing the whole sync.
+- Concurrent syncs for one user each use a service of their own and are capped
+  by UserSyncLimiter.
+- Services can be metered by a quota scheduler (calendar_quota.CalendarQuota);
+  throttled responses are recognised by rate_limit_scope and retry_after.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+
+# Google recommends at most 50 calls per batch request
+BATCH_SIZE = 50
+BATCH_MAX_RETRIES = 3
+BATCH_BACKOFF_BASE = 1.0  # seconds
+
+# 403 covers rateLimitExceeded / userRateLimitExceeded on the Calendar API
+RETRYABLE_STATUS_CODES = {403, 429, 500, 502, 503, 504}
+# Target event/calendar is already gone
+GONE_STATUS_CODES = {404, 410}
+
+
+USER_SCOPE, PROJECT_SCOPE = 'user', 'project'
+# Reasons Google gives for a throttled request, by the quota that ran out
+PROJECT_RATE_LIMIT_REASONS = ('quotaExceeded',)
+USER_RATE_LIMIT_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
+
+
+class CalendarQuotaError(Exception):
+    """
+    A Calendar call was throttled by Google, or would have waited too long for quota.
+
+    retry_after is the number of seconds the client should wait (answered as 429).
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, scope: str = USER_SCOPE):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+def error_status(error: Exception) -> int:
+    """HTTP status of a googleapiclient error, 0 if it isn't one."""
+    if isinstance(error, HttpError):
+        return int(getattr(error.resp, 'status', 0) or 0)
+    return 0
+
+
+def rate_limit_scope(error: Exception) -> Optional[str]:
+    """USER_SCOPE or PROJECT_SCOPE if error means a Calendar quota ran out, else None."""
+    if isinstance(error, CalendarQuotaError):
+        return error.scope
+    status = error_status(error)
+    if status not in (403, 429):
+        return None
+    # Only the rate-limit flavours of 403 are transient; permission errors are not
+    text = str(error)
+    if any(reason in text for reason in PROJECT_RATE_LIMIT_REASONS):
+        return PROJECT_SCOPE
+    if status == 429 or any(reason in text for reason in USER_RATE_LIMIT_REASONS):
+        return USER_SCOPE
+    return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of a throttled response (delta or HTTP date), None if absent."""
+    if isinstance(error, CalendarQuotaError):
+        return error.retry_after
+    if not isinstance(error, HttpError):
+        return None
+    value = (error.resp or {}).get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def raise_if_rate_limited(errors: Dict[str, Exception]) -> None:
+    """
+    Raise CalendarQuotaError if any sub-request is still throttled after execute_batch's retries.
+
+    Callers do this before treating leftover errors as a failed sync, so running
+    out of quota is answered with 429 rather than triggering a rebuild that
+    would need even more requests.
+    """
+    throttled = [err for err in errors.values() if rate_limit_scope(err) is not None]
+    if throttled:
+        waits = [retry_after(err) for err in throttled]
+        raise CalendarQuotaError(
+            f"{len(throttled)} Calendar request(s) were rate limited by Google",
+            retry_after=max((w for w in waits if w is not None), default=None),
+            scope=rate_limit_scope(throttled[0])
+        )
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = error_status(error)
+    if status in (403, 429):
+        return rate_limit_scope(error) is not None
+    return status in RETRYABLE_STATUS_CODES
+
+
+def execute_batch(service, requests: List[Tuple[str, object]],
+                  max_retries: int = BATCH_MAX_RETRIES) -> Tuple[Dict[str, dict], Dict[str, Exception]]:
+    """
+    Execute (key, HttpRequest) pairs as batch requests.
+
+    Returns (responses, errors), both keyed by the caller's key. Sub-requests
+    that fail with a rate-limit or 5xx error are retried in a smaller follow-up
+    batch with exponential backoff, waiting at least as long as the longest
+    Retry-After among them; anything else is returned in errors for the caller
+    to handle.
+    """
+    responses: Dict[str, dict] = {}
+    errors: Dict[str, Exception] = {}
+    pending = list(requests)
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            delay = random.uniform(0, BATCH_BACKOFF_BASE * (2 ** (attempt - 1)))
+            waits = [retry_after(errors[key]) for key, _ in pending]
+            time.sleep(max([delay] + [w for w in waits if w is not None]))
+
+        failed: Dict[str, Exception] = {}
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+                errors.pop(request_id, None)
+            else:
+                failed[request_id] = exception
+
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for key, request in pending[start:start + BATCH_SIZE]:
+                batch.add(request, request_id=key)
+            batch.execute()
+
+        errors.update(failed)
+        pending = [(key, request) for key, request in pending if key in failed and _is_retryable(failed[key])]
+        if pending and attempt < max_retries:
+            print(f"Retrying {len(pending)} failed batch sub-request(s)")
+
+    return responses, errors
+
+
+def event_content_hash(title: str, date: str, description: str = "", event_type: str = "") -> str:
+    """Stable hash of the event fields a sync writes; equal hashes mean no update is needed."""
+    content = json.dumps([title, date, description or "", event_type or ""], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def calendar_discovery_doc() -> dict:
+    """The Calendar v3 discovery document shipped with googleapiclient, parsed once per process."""
+    return json.loads(discovery_cache.get_static_doc('calendar', 'v3'))
+
+
+def build_calendar_service(credentials: Credentials):
+    """Equivalent of build('calendar', 'v3', credentials=...) without re-reading the discovery doc."""
+    return build_from_document(calendar_discovery_doc(), credentials=credentials)
+
+
+def credentials_from_json(creds_json: str) -> Credentials:
+    """Rebuild google.oauth2 Credentials from the JSON stored in the users table."""
+    creds_data = json.loads(creds_json)
+    expiry = creds_data.get('expiry')
+    return Credentials(
+        token=creds_data.get('token'),
+        refresh_token=creds_data.get('refresh_token'),
+        token_uri=creds_data.get('token_uri'),
+        client_id=creds_data.get('client_id'),
+        client_secret=creds_data.get('client_secret'),
+        scopes=creds_data.get('scopes'),
+        # Knowing the expiry lets google-auth refresh proactively instead of after a 401
+        expiry=datetime.fromisoformat(expiry) if expiry else None
+    )
+
+
+def credentials_to_dict(credentials: Credentials) -> dict:
+    """Inverse of credentials_from_json, in the shape stored by /auth/callback plus expiry."""
+    return {
+        'token': credentials.token,
+        'refresh_token': credentials.refresh_token,
+        'token_uri': credentials.token_uri,
+        'client_id': credentials.client_id,
+        'client_secret': credentials.client_secret,
+        'scopes': list(credentials.scopes) if credentials.scopes else credentials.scopes,
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None
+    }
+
+
+class _CachedCredentials:
+    def __init__(self, credentials: Credentials, creds_json: str, expires_at: float):
+        self.credentials = credentials
+        self.creds_json = creds_json
+        self.expires_at = expires_at
+        self.token = credentials.token
+
+
+class CalendarCredentialsCache:
+    """
+    Per-user LRU cache of parsed OAuth credentials with a TTL, and the Calendar services built on them.
+
+    httplib2 connections are not thread-safe, so every caller gets a service of
+    its own; building one from the parsed discovery document is cheap. The
+    services of one user share a Credentials object, so an access token
+    refreshed by any of them is reused by the others, and save_if_refreshed
+    writes it back so the next request (or another worker) doesn't refresh again.
+    Credentials are reused only while the stored JSON is unchanged, so a
+    re-login (new tokens in the database) always starts fresh.
+    With a quota (calendar_quota.CalendarQuota), every service handed out is
+    wrapped so its calls are metered against that user's and the project's quota.
+    """
+
+    def __init__(self, max_size: int, ttl: float, quota=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quota = quota
+        self._entries: "OrderedDict[str, _CachedCredentials]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def credentials(self, email: str, creds_json: str) -> Credentials:
+        """Return email's credentials, parsing creds_json if none are cached or they are stale."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry.creds_json == creds_json and entry.expires_at > now:
+                self._entries.move_to_end(email)
+                return entry.credentials
+
+        credentials = credentials_from_json(creds_json)
+        with self._lock:
+            self._entries[email] = _CachedCredentials(credentials, creds_json, now + self.ttl)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return credentials
+
+    def service(self, email: str, creds_json: str):
+        """A new Calendar service on email's cached credentials, for use by one caller at a time."""
+        service = build_calendar_service(self.credentials(email, creds_json))
+        return self.quota.wrap(service, email) if self.quota is not None else service
+
+    def save_if_refreshed(self, email: str, save: Callable[[str, dict], None]) -> None:
+        """Persist the access token if google-auth refreshed it while a service was used."""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry.credentials.token == entry.token:
+                return
+            creds_data = credentials_to_dict(entry.credentials)
+            entry.token = entry.credentials.token
+        save(email, creds_data)
+        with self._lock:
+            # The stored JSON now matches these credentials; keep the entry valid
+            entry.creds_json = json.dumps(creds_data)
+
+    def invalidate(self, email: str) -> None:
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class UserSyncLimiter:
+    """
+    Caps how many calendar syncs run at once for one user, across requests.
+
+    Google's per-user quota is shared by every request for that user, so a
+    fan-out over many classes must not open unlimited concurrent API calls.
+    Semaphores live on the event loop and are dropped once a user is idle.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._users: Dict[str, list] = {}  # email -> [asyncio.Semaphore, holders]
+
+    @asynccontextmanager
+    async def slot(self, email: str):
+        entry = self._users.get(email)
+        if entry is None:
+            entry = self._users[email] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._users[email]
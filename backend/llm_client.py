@@ -0,0 +1,176 @@
+"""
+Shared Gemini client used by every LLM call in the API.
+
+One long-lived GenerativeModel is reused across requests. The blocking
+generate_content call runs on a dedicated thread pool so it never stalls the
+event loop, behind a global cap on in-flight requests, with a per-call deadline
+and jittered exponential backoff on rate limits and server errors.
+"""
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+# HTTP statuses worth retrying: rate limited or transient provider failure
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when the LLM call fails after all retries."""
+
+
+class _LatencyStat:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_seconds": self.total / self.count if self.count else 0.0,
+            "max_seconds": self.max,
+        }
+
+
+class GeminiClient:
+    """
+    Async facade over a single GenerativeModel.
+
+    max_concurrency bounds in-flight provider calls across the whole process;
+    callers beyond that wait on a semaphore (time spent there is reported as
+    queue wait). Each attempt is bounded by timeout seconds, and up to
+    max_retries retries are made on 429/5xx and deadline errors.
+    """
+
+    def __init__(self, model_name: str, generation_config=None, max_concurrency: int = 8,
+                 timeout: float = 60, max_retries: int = 3, backoff_base: float = 1.0,
+                 backoff_cap: float = 20.0, deadline_grace: float = 5.0, model=None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.deadline_grace = deadline_grace
+        self._model = model
+        self._executor = None
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._stats_lock = threading.Lock()
+        self._queue_wait = _LatencyStat()
+        self._call_latency = _LatencyStat()
+        self._in_flight = 0
+        self._waiting = 0
+        self._retries = 0
+        self._failures = 0
+        self._timeouts = 0
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = genai.GenerativeModel(self.model_name, generation_config=self.generation_config)
+        return self._model
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one event loop; rebuild if the loop changed (tests, reloads)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def generate(self, prompt: str) -> str:
+        """Send prompt to the model and return the response text."""
+        semaphore = self._get_semaphore()
+        queued_at = time.monotonic()
+        with self._stats_lock:
+            self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._stats_lock:
+                self._waiting -= 1
+        try:
+            with self._stats_lock:
+                self._queue_wait.add(time.monotonic() - queued_at)
+                self._in_flight += 1
+            return await self._generate_with_retries(prompt)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            semaphore.release()
+
+    async def _generate_with_retries(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        model = self._get_model()
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                call = loop.run_in_executor(
+                    self._get_executor(),
+                    lambda: model.generate_content(prompt, request_options={"timeout": self.timeout})
+                )
+                # Small grace over the transport timeout so the provider deadline fires first
+                response = await asyncio.wait_for(call, timeout=self.timeout + self.deadline_grace)
+                with self._stats_lock:
+                    self._call_latency.add(time.monotonic() - started)
+                return response.text
+
+            except asyncio.TimeoutError:
+                with self._stats_lock:
+                    self._timeouts += 1
+                error = LLMError(f"Gemini call exceeded {self.timeout:.0f}s deadline")
+            except google_exceptions.GoogleAPICallError as e:
+                if e.code not in RETRYABLE_STATUS_CODES:
+                    with self._stats_lock:
+                        self._failures += 1
+                    raise
+                error = e
+
+            if attempt == self.max_retries:
+                with self._stats_lock:
+                    self._failures += 1
+                raise LLMError(f"Gemini call failed after {attempt + 1} attempt(s): {error}") from error
+
+            delay = self._backoff(attempt)
+            print(f"Gemini call failed ({error}); retrying in {delay:.1f}s")
+            with self._stats_lock:
+                self._retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "retries": self._retries,
+                "failures": self._failures,
+                "timeouts": self._timeouts,
+                "queue_wait": self._queue_wait.as_dict(),
+                "call_latency": self._call_latency.as_dict(),
+            }
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,253 @@
+"""
+Deterministic extraction of explicitly dated deliverables, run before the LLM.
+
+Most syllabi list work as "HW3 due Oct 14", "Lab 2 - 10/21" or schedule rows like
+"Week 4 Friday: Quiz 2". Those lines are resolved here without a Gemini call.
+Lines that mention a deliverable but can't be pinned to a single date (recurring
+work, "due in week 5", release-and-due on one line...) are reported as
+unresolved so only those fragments need to go to the LLM.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional
+
+DEFAULT_YEAR = 2026  # Same default the LLM prompt uses
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+# Instruction typically starts on the first Monday on/after these dates
+QUARTER_ANCHORS = {'winter': (1, 2), 'spring': (3, 28), 'summer': (6, 22), 'fall': (9, 22)}
+# A term's dates run from a few weeks before instruction starts to less than a year after
+TERM_LEAD = timedelta(days=30)
+
+_TITLE_RE = re.compile(
+    r'\b(?P<kind>homework|hw|assignment|lab|quiz|midterm(?:\s+exam)?|final\s+exam|final\s+project'
+    r'|final(?!\s+(?:version|draft|submission|grades?|report|review|day)\b)|project|exam)'
+    r'(?:\s*#?\s*(?P<num>\d{1,2}[a-z]?)\b)?',
+    re.IGNORECASE
+)
+_TYPE_BY_KIND = {
+    'homework': 'homework', 'hw': 'homework', 'assignment': 'homework',
+    'lab': 'lab', 'quiz': 'quiz',
+    'midterm': 'exam', 'midterm exam': 'exam', 'final': 'exam', 'final exam': 'exam', 'exam': 'exam',
+    'project': 'other', 'final project': 'other',
+}
+_MONTH_NAME = r'(?P<month>jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+_DATE_PATTERNS = [
+    re.compile(r'\b(?P<year>20\d{2})-(?P<mnum>\d{1,2})-(?P<day>\d{1,2})\b'),
+    re.compile(r'\b' + _MONTH_NAME + r'\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(?P<year>20\d{2}))?', re.IGNORECASE),
+    re.compile(r'\b(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+' + _MONTH_NAME + r'(?:,?\s+(?P<year>20\d{2}))?', re.IGNORECASE),
+    re.compile(r'(?<![\d/])(?P<mnum>1[0-2]|0?[1-9])/(?P<day>3[01]|[12]\d|0?[1-9])(?:/(?P<year>(?:20)?\d{2}))?(?![\d/])'),
+]
+_WEEKDAY_NAME = r'(?P<weekday>mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)[a-z]*\.?'
+_WEEK_PATTERNS = [
+    re.compile(r'\bweek\s*(?P<week>\d{1,2})\b[\s,:\-|]*' + _WEEKDAY_NAME, re.IGNORECASE),
+    re.compile(r'\b' + _WEEKDAY_NAME + r'\s*(?:,|of)?\s*week\s*(?P<week>\d{1,2})\b', re.IGNORECASE),
+]
+_TERM_RE = re.compile(r'\b(?P<quarter>fall|winter|spring|summer)\s*(?:quarter|term|session)?\s*[\',]?\s*(?P<year>20\d{2})\b', re.IGNORECASE)
+_START_RE = re.compile(
+    r'(?:classes|instruction|quarter|lectures?)\s+(?:begins?|starts?)\s*(?:on)?\s*[:\-]?\s*(?P<rest>.{0,40})',
+    re.IGNORECASE
+)
+_COURSE_RE = re.compile(r'\b(?P<dept>[A-Z]{2,6}(?: [A-Z]{1,3})?)\s?(?P<num>\d{1,3}[A-Z]{0,2})\b')
+_NOT_COURSE_DEPTS = {'HW', 'LAB', 'QUIZ', 'EXAM', 'WEEK', 'ROOM', 'UNIT', 'PART', 'PAGE'}
+
+# Lines that are policy or grading text, or that describe something other than the due date
+_POLICY_RE = re.compile(r'%|\bweight|\bgrad(?:e|ing)\b|\bpolic', re.IGNORECASE)
+_NOT_DUE_RE = re.compile(r'\b(review|solutions?|released?|assigned|out|posted|office hours?|lecture on|grades? returned)\b', re.IGNORECASE)
+_BARE_DELIVERABLE_RE = re.compile(r'\b(homeworks?|hws?|assignments?|labs?|quiz(?:zes)?|projects?)\b.*\bdue\b', re.IGNORECASE)
+_RECURRING_RE = re.compile(r'\b(every|each|weekly|biweekly|daily)\b', re.IGNORECASE)
+# A dated line with one of these is a deadline even if its deliverable isn't a known title ("Essay 1 due Oct 17")
+_DUE_RE = re.compile(r'\b(due|submit(?:ted|ssion)?|turn(?:ed)?\s+in|deadline)\b', re.IGNORECASE)
+
+
+@dataclass
+class RuleExtraction:
+    events: List[dict] = field(default_factory=list)
+    unresolved: List[str] = field(default_factory=list)  # deliverable lines that need the LLM
+    year_is_explicit: bool = False
+    course: str = "unknown"
+
+    @property
+    def confidence(self) -> float:
+        """Share of deliverable lines that were resolved to a date."""
+        resolved = len({e['description'] for e in self.events})
+        total = resolved + len(self.unresolved)
+        return resolved / total if total else 0.0
+
+    @property
+    def is_confident(self) -> bool:
+        """Everything was resolved and the year came from the syllabus, not a guess."""
+        return bool(self.events) and not self.unresolved and self.year_is_explicit
+
+
+def term_start(text: str) -> Optional[date]:
+    """First Monday of instruction of the term named in text ("Fall 2025"), None if it names none."""
+    term = _TERM_RE.search(text)
+    if not term:
+        return None
+    return _quarter_start(term.group('quarter'), int(term.group('year')), text)
+
+
+def align_to_term(when: date, start: date) -> date:
+    """when moved by whole years into the term starting at start: Jan 3 of a Fall 2025 term is 2026-01-03."""
+    window_start = start - TERM_LEAD
+    year = window_start.year + ((when.month, when.day) < (window_start.month, window_start.day))
+    try:
+        return when.replace(year=year)
+    except ValueError:
+        return when  # Feb 29 outside a leap year; leave it for the caller to notice
+
+
+def _quarter_start(quarter: Optional[str], year: int, text: str) -> Optional[date]:
+    """First Monday of instruction: an explicit 'classes begin ...' date wins over the convention."""
+    match = _START_RE.search(text)
+    if match:
+        dates = _find_dates(match.group('rest'), year)
+        if dates:
+            start = dates[0][1]
+            return start - timedelta(days=start.weekday())
+    if not quarter:
+        return None
+    month, day = QUARTER_ANCHORS[quarter.lower()]
+    anchor = date(year, month, day)
+    return anchor + timedelta(days=(7 - anchor.weekday()) % 7)
+
+
+def _find_dates(line: str, default_year: int, start: Optional[date] = None) -> List[tuple]:
+    """
+    Explicit calendar dates in line as (position, date). A date without a year gets
+    default_year, or with start (the term's first Monday) the year that puts it in the term.
+    """
+    found = []
+    spans = []
+    for pattern in _DATE_PATTERNS:
+        for m in pattern.finditer(line):
+            if any(m.start() < end and start < m.end() for start, end in spans):
+                continue
+            groups = m.groupdict()
+            month = MONTHS[groups['month'][:3].lower()] if groups.get('month') else int(groups['mnum'])
+            year = groups.get('year')
+            year = default_year if not year else int(year) + (2000 if len(year) == 2 else 0)
+            try:
+                when = date(year, month, int(groups['day']))
+            except ValueError:
+                continue
+            if start is not None and not groups.get('year'):
+                when = align_to_term(when, start)
+            found.append((m.start(), when))
+            spans.append((m.start(), m.end()))
+    return sorted(found)
+
+
+def _find_week_dates(line: str, quarter_start: Optional[date]) -> List[tuple]:
+    """'Week 3 Friday' / 'Fri of week 3' references as (position, date)."""
+    if quarter_start is None:
+        return []
+    found = []
+    for pattern in _WEEK_PATTERNS:
+        for m in pattern.finditer(line):
+            week = int(m.group('week'))
+            weekday = WEEKDAYS[m.group('weekday')[:3].lower()]
+            found.append((m.start(), quarter_start + timedelta(weeks=week - 1, days=weekday)))
+    return sorted(set(found))
+
+
+def _find_titles(line: str) -> List[tuple]:
+    titles = []
+    previous = None
+    for m in _TITLE_RE.finditer(line):
+        kind = re.sub(r'\s+', ' ', m.group('kind').lower())
+        num = m.group('num')
+        after_exam = previous is not None and previous.group('kind').lower().startswith(('midterm', 'final'))
+        if kind == 'exam' and after_exam and not re.search(r'\w', line[previous.end():m.start()]):
+            continue  # "Midterm - Exam": one deliverable named twice
+        previous = m
+        # Numbered HW/Lab/Quiz are unambiguous; a bare "lab" or "project" usually isn't a deliverable
+        if kind in ('hw', 'homework', 'assignment', 'lab', 'quiz', 'project') and not num:
+            continue
+        title = re.sub(r'\s+', ' ', m.group(0).strip())
+        titles.append((title, _TYPE_BY_KIND[kind]))
+    return titles
+
+
+def _infer_course(text: str) -> str:
+    for line in text.splitlines()[:15]:
+        for match in _COURSE_RE.finditer(line):
+            if match.group('dept') not in _NOT_COURSE_DEPTS:
+                return f"{match.group('dept')} {match.group('num')}"
+    return "unknown"
+
+
+def extract_rule_based(text: str) -> RuleExtraction:
+    """Resolve explicitly dated deliverables in text; see RuleExtraction for the result."""
+    term = _TERM_RE.search(text)
+    if term:
+        quarter, year, year_is_explicit = term.group('quarter'), int(term.group('year')), True
+    else:
+        quarter = None
+        years = re.findall(r'\b(20\d{2})\b', text)
+        year_is_explicit = bool(years)
+        year = int(max(set(years), key=years.count)) if years else DEFAULT_YEAR
+    quarter_start = _quarter_start(quarter, year, text)
+
+    result = RuleExtraction(year_is_explicit=year_is_explicit, course=_infer_course(text))
+    seen = set()
+    for raw_line in text.splitlines():
+        line = ' '.join(raw_line.split())
+        titles = _find_titles(line)
+        # With a named term, a date without a year belongs to that term ("Final Exam Jan 3" in Fall 2025)
+        dates = [d for _, d in sorted(_find_dates(line, year, quarter_start if term else None)
+                                      + _find_week_dates(line, quarter_start))]
+        if not titles:
+            if _BARE_DELIVERABLE_RE.search(line) or (dates and _DUE_RE.search(line)):
+                # "Labs are due at the end of section", "Problem Set 2 due Oct 10"
+                result.unresolved.append(line)
+            continue
+
+        if _POLICY_RE.search(line) and not dates:
+            continue  # grading breakdown, late policy...
+        if _RECURRING_RE.search(line) or _NOT_DUE_RE.search(line) or _POLICY_RE.search(line) or not dates:
+            result.unresolved.append(line)
+            continue
+        if len(dates) == 1:
+            pairs = [(title, dates[0]) for title in titles]
+        elif len(dates) == len(titles):
+            pairs = list(zip(titles, dates))  # "Midterm Feb 10, Final Mar 18"
+        else:
+            result.unresolved.append(line)
+            continue
+
+        for (title, event_type), when in pairs:
+            key = (title.lower(), when)
+            if key in seen:
+                continue
+            seen.add(key)
+            result.events.append({
+                "title": title,
+                "date": when.isoformat(),
+                "type": event_type,
+                "description": line,
+                "Class": result.course,
+                "isSyllabus": True,
+            })
+    return result
+
+
+def unresolved_fragments(text: str, extraction: RuleExtraction, context_lines: int = 1) -> str:
+    """
+    The unresolved deliverable lines with a line of context on each side (table
+    headers, the 'Week N' row above), for sending to the LLM instead of the whole text.
+    """
+    lines = [' '.join(l.split()) for l in text.splitlines()]
+    wanted = set(extraction.unresolved)
+    keep = set()
+    for i, line in enumerate(lines):
+        if line in wanted:
+            keep.update(range(max(0, i - context_lines), min(len(lines), i + context_lines + 1)))
+    return '\n'.join(lines[i] for i in sorted(keep) if lines[i])
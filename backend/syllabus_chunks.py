@@ -0,0 +1,143 @@
+"""
+Splitting long syllabi into LLM-sized chunks and merging the per-chunk results.
+
+Chunks break on section and table boundaries (blank lines, headings, "Week N"
+rows) so a schedule row is never cut in half. Every chunk after the first is
+sent with the syllabus header for course/term context, and the merge step
+deduplicates events and reconciles the year and course name across chunks.
+"""
+import re
+from collections import Counter
+from datetime import date
+from typing import List
+
+from rule_extractor import term_start, align_to_term
+
+# Lines that start a new section: "Week 3", "Schedule", "# Grading", "UNIT 2", "Lab Policy:" ...
+_HEADING_RE = re.compile(
+    r'^\s*(#+\s|(?i:week|wk|unit|module|part|section|lecture)\s*\d+\b|[A-Z][A-Z0-9 &/\-]{3,60}$|[A-Z][\w ]{2,40}:\s*$)'
+)
+
+
+def split_syllabus(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring section boundaries."""
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    current = ""
+    for block in _split_blocks(text):
+        if len(block) > max_chars:
+            # A single huge section (e.g. one long table): fall back to line boundaries
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_lines(block, max_chars))
+            continue
+        if len(current) + len(block) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += block
+    if current.strip():
+        chunks.append(current)
+    return [c for c in chunks if c.strip()]
+
+
+def _split_blocks(text: str) -> List[str]:
+    """Cut text into blocks that each start at a blank line or a heading."""
+    blocks = []
+    current = ""
+    previous_blank = False
+    for line in text.splitlines(keepends=True):
+        is_blank = not line.strip()
+        starts_section = (previous_blank and not is_blank) or (not is_blank and _HEADING_RE.match(line))
+        if starts_section and current.strip():
+            blocks.append(current)
+            current = ""
+        current += line
+        previous_blank = is_blank
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _split_lines(block: str, max_chars: int) -> List[str]:
+    chunks = []
+    current = ""
+    for line in block.splitlines(keepends=True):
+        while len(line) > max_chars:
+            # Pathological single line (no newlines from extraction)
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def syllabus_header(text: str, max_chars: int = 1500) -> str:
+    """The start of the syllabus, where course code, term and year usually live."""
+    return text[:max_chars]
+
+
+def _event_key(event: dict) -> tuple:
+    title = re.sub(r'[^a-z0-9]', '', str(event.get('title', '')).lower())
+    return title, str(event.get('date', ''))
+
+
+def _is_unknown_class(name) -> bool:
+    return not name or str(name).strip().lower() in ('unknown', 'error', 'n/a', 'none')
+
+
+def merge_chunk_results(results: List[dict], header: str = "") -> dict:
+    """
+    Merge per-chunk {"events": [...]} results into one.
+
+    - Partial: if any chunk failed ({"partial": True}), so is the merged result.
+    - Year: chunks that only saw part of the syllabus can guess the year wrong.
+      If the header names the term ("Fall 2025"), a date outside that term's
+      window is moved by whole years into it, e.g. a January final of a Fall
+      term to the next year. Dates inside the window are kept as parsed.
+    - Class: the most common known course name is applied to events marked unknown.
+    - Duplicates (same normalized title and date, e.g. from chunk overlap) are
+      dropped, keeping the more detailed description.
+    """
+    events = []
+    for result in results:
+        events.extend(e for e in (result or {}).get('events', []) if isinstance(e, dict))
+
+    start = term_start(header)
+    if start is not None:
+        for event in events:
+            try:
+                when = date.fromisoformat(str(event.get('date', '')))
+            except ValueError:
+                continue  # left for the client to show as it came
+            event['date'] = align_to_term(when, start).isoformat()
+
+    class_names = Counter(e.get('Class') for e in events if not _is_unknown_class(e.get('Class')))
+    if class_names:
+        course = class_names.most_common(1)[0][0]
+        for event in events:
+            if _is_unknown_class(event.get('Class')):
+                event['Class'] = course
+
+    merged = {}
+    for event in events:
+        key = _event_key(event)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = event
+        elif len(str(event.get('description') or '')) > len(str(existing.get('description') or '')):
+            existing['description'] = event['description']
+
+    result = {"events": sorted(merged.values(), key=lambda e: str(e.get('date', '')))}
+    if any((r or {}).get('partial') for r in results):
+        result["partial"] = True
+    return result
@@ -0,0 +1,167 @@
+"""
+Background workers for queued syllabus parse jobs.
+
+POST /syllabus/jobs stores the upload under JOB_DIR, records a job in the
+syllabus_jobs table (database/job_store.py) and answers straight away. The
+workers here claim queued jobs, run the same pipeline as POST /syllabus and
+store the result for GET /syllabus/jobs/{id}. The table is the queue, so jobs
+survive a restart and any worker process sharing the database can pick them up.
+"""
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple, Type
+
+from database import job_store
+from database.async_db import database
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_DIR = Path(os.getenv("JOB_DIR", os.path.join(tempfile.gettempdir(), "plannr-jobs")))
+JOB_POLL_INTERVAL = 1.0  # seconds an idle worker waits before looking for due retries
+JOB_RETRY_DELAY = 10  # seconds before the first automatic retry, doubled on each attempt
+JOB_HOUSEKEEPING_INTERVAL = 60  # seconds between stale-job and expiry sweeps
+# Seconds between updated_at refreshes of a running job, well inside JOB_STALE_AFTER
+# so a slow parse is never mistaken for one whose worker died
+JOB_HEARTBEAT_INTERVAL = job_store.JOB_STALE_AFTER / 4
+
+
+class JobRunner:
+    """
+    A fixed number of asyncio worker tasks draining the syllabus_jobs table.
+
+    process(pdf_path) returns (events, cached). Exceptions listed in transient
+    are retried with backoff up to JOB_MAX_ATTEMPTS; any other exception fails
+    the job, which can then be retried by the client without re-uploading.
+    """
+
+    def __init__(self, process: Callable[[Path], Awaitable[Tuple[list, bool]]], workers: int,
+                 transient: Tuple[Type[BaseException], ...] = (), poll_interval: float = JOB_POLL_INTERVAL):
+        self.process = process
+        self.workers = workers
+        self.transient = transient
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stats = {"completed": 0, "failed": 0, "retried": 0, "purged": 0, "requeued_stale": 0}
+
+    def start(self) -> None:
+        """Start the workers on the running loop; a no-op if they are already running there."""
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._tasks[0].get_loop() is loop:
+            # Replace any task that died rather than letting the pool shrink
+            self._tasks = [self._spawn(i) if task.done() else task for i, task in enumerate(self._tasks)]
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [self._spawn(i) for i in range(self.workers + 1)]
+
+    def _spawn(self, index: int) -> asyncio.Task:
+        if index < self.workers:
+            return asyncio.create_task(self._worker(), name=f"syllabus-job-{index}")
+        return asyncio.create_task(self._housekeeping(), name="syllabus-job-housekeeping")
+
+    def notify(self) -> None:
+        """Wake idle workers after a job was queued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        # A job interrupted here stays 'running' and is queued again by requeue_stale_jobs
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _claim(self) -> Optional[dict]:
+        claim = asyncio.ensure_future(database.write(job_store.claim_next_job))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # The claim still runs on the writer thread; a job it took would stay
+            # 'running' until it went stale, so wait for it and put the job back
+            try:
+                job = await claim
+                if job is not None:
+                    await database.write(job_store.release_job, job["id"])
+            except Exception as e:
+                print(f"Warning: could not release a syllabus job claimed while stopping: {e}")
+            raise
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"Warning: could not claim a syllabus job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # The outcome wasn't stored; the job stays 'running' and is queued again once stale
+                print(f"Warning: could not record the result of syllabus job {job['id']}: {e}")
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await database.write(job_store.touch_job, job_id)
+            except Exception as e:
+                print(f"Warning: could not refresh syllabus job {job_id}: {e}")
+
+    async def _process(self, job: dict) -> Tuple[list, bool]:
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            return await self.process(Path(job["pdf_path"]))
+        finally:
+            heartbeat.cancel()
+
+    async def _run(self, job: dict) -> None:
+        job_id = job["id"]
+        try:
+            events, cached = await self._process(job)
+        except asyncio.CancelledError:
+            raise
+        except self.transient as e:
+            if job["attempts"] < job_store.JOB_MAX_ATTEMPTS:
+                retry_in = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                print(f"Syllabus job {job_id} attempt {job['attempts']} failed ({e}); retrying in {retry_in}s")
+                await database.write(job_store.fail_job, job_id, str(e), retry_in)
+                self._count("retried")
+            else:
+                await database.write(job_store.fail_job, job_id, str(e))
+                self._count("failed")
+        except Exception as e:
+            print(f"Syllabus job {job_id} failed: {e}")
+            await database.write(job_store.fail_job, job_id, str(e))
+            self._count("failed")
+        else:
+            await database.write(job_store.finish_job, job_id, events, cached)
+            self._count("completed")
+
+    async def _housekeeping(self) -> None:
+        while True:
+            try:
+                requeued = await database.write(job_store.requeue_stale_jobs)
+                if requeued:
+                    self._count("requeued_stale", requeued)
+                    self.notify()
+                expired = await database.write(job_store.purge_expired_jobs)
+                for pdf_path in expired:
+                    await asyncio.to_thread(Path(pdf_path).unlink, missing_ok=True)
+                self._count("purged", len(expired))
+            except Exception as e:
+                print(f"Warning: syllabus job housekeeping failed: {e}")
+            await asyncio.sleep(JOB_HOUSEKEEPING_INTERVAL)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        self._stats[name] += n
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "running": bool(self._tasks), **self._stats}
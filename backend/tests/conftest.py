@@ -0,0 +1,30 @@
+"""Shared test setup."""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# app.py initializes the database on import; make sure that never touches a tracked
+# or developer database (.env values don't override variables that are already set)
+_db_dir = tempfile.mkdtemp(prefix="plannr-tests-")
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+os.environ["DB_FILEPATH"] = os.path.join(_db_dir, "plannr.db")
+
+
+@pytest.fixture
+def mock_db(tmp_path, monkeypatch):
+    """A fresh database in tmp_path with every table the app uses and zeroed parse cache counters."""
+    from database import db_manager, parse_cache, job_store, channel_store
+
+    db_file = tmp_path / "test.db"
+    monkeypatch.setattr(db_manager, "DB_NAME", db_file)
+    db_manager.init_db()
+    parse_cache.init_parse_cache()
+    job_store.init_job_store()
+    channel_store.init_channel_store()
+    parse_cache.reset_stats()
+    yield db_file
+    parse_cache.reset_stats()
@@ -0,0 +1,215 @@
+"""In-memory stand-in for the Google Calendar v3 service used by the calendar tests."""
+
+import itertools
+import time
+from urllib.parse import urlparse
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def http_error(status, reason="", retry_after=None):
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = str(retry_after)
+    return HttpError(httplib2.Response(headers), (reason or "error").encode())
+
+
+class FakeRequest:
+    def __init__(self, service, resource, method, kwargs):
+        self.service = service
+        self.resource = resource
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self):
+        self.service.round_trips += 1
+        return self.service.handle(self)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.round_trips += 1
+        self.service.batch_sizes.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                response, error = self.service.handle(request), None
+            except HttpError as e:
+                response, error = None, e
+            self.callback(request_id, response, error)
+
+
+class _Resource:
+    def __init__(self, service, name):
+        self._service = service
+        self._name = name
+
+    def __getattr__(self, method):
+        return lambda **kwargs: FakeRequest(self._service, self._name, method, kwargs)
+
+
+class FakeCalendarService:
+    """
+    Keeps calendars and events in dicts and counts HTTP round trips.
+
+    Set fail_next[(resource, method)] = [(status, reason), ...] to make the next
+    calls of that kind fail with those HTTP errors; a third item is sent as Retry-After.
+
+    Every event change is logged, so events().list(syncToken=...) returns only
+    what changed since that token, and events().watch channels are recorded
+    for send_notifications. edit_event / remove_event play a user editing the
+    calendar in Google Calendar; expire_sync_tokens makes old tokens answer 410.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.calendar_store = {}  # calendar id -> summary
+        self.event_store = {}  # calendar id -> {event id -> body}
+        self.calls = []  # (resource, method) in call order
+        self.round_trips = 0
+        self.batch_sizes = []
+        self.fail_next = {}
+        self.watch_channels = {}  # channel id -> watch request body plus calendarId and resourceId
+        self._changes = []  # (calendar id, event id) per change, a sync token is an index into it
+        self._oldest_valid_token = 0
+
+    def add_calendar(self, summary):
+        cal_id = f"cal{next(self._ids)}@group.calendar.google.com"
+        self.calendar_store[cal_id] = summary
+        self.event_store[cal_id] = {}
+        return cal_id
+
+    def add_event(self, cal_id, body):
+        event_id = f"ev{next(self._ids)}"
+        self.event_store[cal_id][event_id] = dict(body, id=event_id)
+        self._changes.append((cal_id, event_id))
+        return event_id
+
+    def edit_event(self, cal_id, event_id, **fields):
+        self.event_store[cal_id][event_id].update(fields)
+        self._changes.append((cal_id, event_id))
+
+    def remove_event(self, cal_id, event_id):
+        del self.event_store[cal_id][event_id]
+        self._changes.append((cal_id, event_id))
+
+    def expire_sync_tokens(self):
+        self._oldest_valid_token = len(self._changes)
+
+    def count(self, resource, method):
+        return self.calls.count((resource, method))
+
+    # Resource accessors, mirroring the discovery-built service
+    def events(self):
+        return _Resource(self, "events")
+
+    def calendars(self):
+        return _Resource(self, "calendars")
+
+    def calendarList(self):
+        return _Resource(self, "calendarList")
+
+    def channels(self):
+        return _Resource(self, "channels")
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def handle(self, request):
+        key = (request.resource, request.method)
+        self.calls.append(key)
+        failures = self.fail_next.get(key)
+        if failures:
+            raise http_error(*failures.pop(0))
+        handler = getattr(self, f"_{request.resource}_{request.method}")
+        return handler(**request.kwargs)
+
+    def _events_insert(self, calendarId, body, **_):
+        if calendarId not in self.event_store:
+            raise http_error(404)
+        return dict(self.event_store[calendarId][self.add_event(calendarId, body)])
+
+    def _events_update(self, calendarId, eventId, body, **_):
+        if eventId not in self.event_store.get(calendarId, {}):
+            raise http_error(404)
+        self.event_store[calendarId][eventId] = dict(body, id=eventId)
+        self._changes.append((calendarId, eventId))
+        return dict(self.event_store[calendarId][eventId])
+
+    def _events_delete(self, calendarId, eventId, **_):
+        if eventId not in self.event_store.get(calendarId, {}):
+            raise http_error(410)
+        self.remove_event(calendarId, eventId)
+        return ""
+
+    def _events_list(self, calendarId, pageToken=None, syncToken=None, **_):
+        if calendarId not in self.event_store:
+            raise http_error(404)
+        events = self.event_store[calendarId]
+        if syncToken is None:
+            items = list(events.values())
+        else:
+            since = int(syncToken.split("-")[1])
+            if since < self._oldest_valid_token:
+                raise http_error(410, "fullSyncRequired")
+            changed = dict.fromkeys(event_id for cal_id, event_id in self._changes[since:] if cal_id == calendarId)
+            items = [events.get(event_id) or {"id": event_id, "status": "cancelled"} for event_id in changed]
+        return {"items": items, "nextSyncToken": f"sync-{len(self._changes)}"}
+
+    def _events_watch(self, calendarId, body, **_):
+        if calendarId not in self.event_store:
+            raise http_error(404)
+        expiration = int((time.time() + int(body.get("params", {}).get("ttl", 604800))) * 1000)
+        self.watch_channels[body["id"]] = dict(body, calendarId=calendarId, resourceId=f"res-{calendarId}", expiration=expiration)
+        return {"kind": "api#channel", "id": body["id"], "resourceId": f"res-{calendarId}", "expiration": str(expiration)}
+
+    def _channels_stop(self, body, **_):
+        if self.watch_channels.pop(body["id"], None) is None:
+            raise http_error(404)
+        return ""
+
+    def _calendars_get(self, calendarId, **_):
+        if calendarId not in self.calendar_store:
+            raise http_error(404)
+        return {"id": calendarId, "summary": self.calendar_store[calendarId]}
+
+    def _calendars_insert(self, body, **_):
+        return {"id": self.add_calendar(body["summary"]), "summary": body["summary"]}
+
+    def _calendars_delete(self, calendarId, **_):
+        if calendarId not in self.calendar_store:
+            raise http_error(404)
+        del self.calendar_store[calendarId]
+        del self.event_store[calendarId]
+        return ""
+
+    def _calendarList_list(self, **_):
+        return {"items": [{"id": i, "summary": s} for i, s in self.calendar_store.items()]}
+
+    def _calendarList_patch(self, calendarId, **_):
+        return {"id": calendarId}
+
+
+def send_notifications(client, service, cal_id, state="exists"):
+    """
+    Play Google's push service: POST a notification for cal_id to the address of
+    every channel watching it, with the headers Google sends. Returns the responses.
+    """
+    responses = []
+    for number, channel in enumerate(c for c in list(service.watch_channels.values()) if c["calendarId"] == cal_id):
+        responses.append(client.post(urlparse(channel["address"]).path, headers={
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Channel-Token": channel.get("token", ""),
+            "X-Goog-Resource-ID": channel["resourceId"],
+            "X-Goog-Resource-State": state,
+            "X-Goog-Message-Number": str(number + 1),
+        }))
+    return responses
@@ -0,0 +1,93 @@
+"""Tests for the async database facade and its write batching."""
+
+import asyncio
+import time
+
+import pytest
+
+import database.db_manager as db_manager
+from database.async_db import AsyncDB
+
+
+@pytest.fixture
+def adb(mock_db):
+    db = AsyncDB(read_workers=2, batch_window=0.05, batch_max=64)
+    yield db
+    db.shutdown()
+
+
+def test_reads_and_writes_round_trip(adb):
+    async def scenario():
+        assert await adb.read(db_manager.fetch_user_creds, "a@example.com") is None  # auto-creates
+        await adb.write(db_manager.update_creds, "a@example.com", {"token": "t"})
+        return await adb.read(db_manager.fetch_user_creds, "a@example.com")
+
+    assert asyncio.run(scenario()) == '{"token": "t"}'
+
+
+def test_concurrent_writes_share_a_transaction(adb):
+    emails = [f"user{i}@example.com" for i in range(20)]
+
+    async def scenario():
+        await asyncio.gather(*(adb.write(db_manager.add_user, email) for email in emails))
+        await asyncio.gather(*(adb.write(db_manager.update_creds, email, {"token": email}) for email in emails))
+
+    asyncio.run(scenario())
+    stats = adb.stats()
+    assert stats["writes"] == 40
+    assert stats["batches"] <= 4
+    assert db_manager.fetch_user_creds("user19@example.com") == '{"token": "user19@example.com"}'
+
+
+def test_failed_write_only_fails_its_caller(adb):
+    db_manager.add_user("exists@example.com")
+
+    async def scenario():
+        return await asyncio.gather(
+            adb.write(db_manager.update_creds, "exists@example.com", {"token": "ok"}),
+            adb.write(db_manager.add_user, "exists@example.com"),  # duplicate
+            adb.write(db_manager.save_course_events, "exists@example.com", "CS101",
+                      [{"local_id": "a", "title": "HW1", "date": "2026-01-10"}]),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert results[0] is None and results[2] is None
+    assert "User Already Exists" in str(results[1])
+    assert adb.stats()["batches"] == 1
+    assert db_manager.fetch_user_creds("exists@example.com") == '{"token": "ok"}'
+    assert len(db_manager.fetch_events("exists@example.com")) == 1
+
+
+def test_slow_database_work_does_not_block_the_loop(adb):
+    def slow_read():
+        time.sleep(0.3)
+        return "done"
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await adb.read(slow_read)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == "done"
+    assert ticks >= 10
+
+
+def test_write_batch_rolls_back_only_the_failing_write(mock_db):
+    db_manager.add_user("a@example.com")
+    with db_manager.write_batch() as run:
+        run(db_manager.update_creds, "a@example.com", {"token": "new"})
+        with pytest.raises(Exception, match="does not exist"):
+            run(db_manager.update_syllabi, "ghost@example.com", {"course": "CS101"})
+    assert db_manager.fetch_user_creds("a@example.com") == '{"token": "new"}'
+    assert db_manager.fetch_courses("ghost@example.com") == []
@@ -0,0 +1,96 @@
+"""Tests for the per-user Calendar credentials cache and credential write-back."""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import google_calendar
+from google_calendar import CalendarCredentialsCache
+
+CREDS = json.dumps({
+    "token": "access-1",
+    "refresh_token": "refresh",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "client_id": "client",
+    "client_secret": "secret",
+    "scopes": ["https://www.googleapis.com/auth/calendar"],
+})
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    built = []
+
+    def fake_build(credentials):
+        built.append(credentials)
+        return object()
+
+    monkeypatch.setattr(google_calendar, "build_calendar_service", fake_build)
+    return built
+
+
+def test_discovery_doc_parsed_once_and_builds_offline():
+    google_calendar.calendar_discovery_doc.cache_clear()
+    creds = google_calendar.credentials_from_json(CREDS)
+    service = google_calendar.build_calendar_service(creds)
+    google_calendar.build_calendar_service(creds)
+    assert hasattr(service, "events")
+    assert google_calendar.calendar_discovery_doc.cache_info().misses == 1
+
+
+def test_services_share_the_users_credentials(builds):
+    cache = CalendarCredentialsCache(max_size=10, ttl=60)
+    first = cache.service("a@example.com", CREDS)
+    second = cache.service("a@example.com", CREDS)
+    assert first is not second  # one per caller: httplib2 is not thread-safe
+    assert builds[0] is builds[1]
+
+
+def test_new_credentials_replace_cached_ones(builds):
+    cache = CalendarCredentialsCache(max_size=10, ttl=60)
+    cache.service("a@example.com", CREDS)
+    relogin = json.dumps(dict(json.loads(CREDS), token="access-2"))
+    cache.service("a@example.com", relogin)
+    assert builds[-1] is not builds[0]
+    assert builds[-1].token == "access-2"
+
+
+def test_ttl_and_lru_bounds(builds):
+    cache = CalendarCredentialsCache(max_size=2, ttl=0)
+    cache.service("a@example.com", CREDS)
+    cache.service("a@example.com", CREDS)
+    assert builds[0] is not builds[1]  # expired immediately
+
+    cache = CalendarCredentialsCache(max_size=2, ttl=60)
+    for email in ("a@example.com", "b@example.com", "c@example.com"):
+        cache.service(email, CREDS)
+    assert len(cache) == 2
+    first_a = builds[-3]
+    cache.service("a@example.com", CREDS)
+    assert builds[-1] is not first_a  # a was evicted
+
+
+def test_refreshed_token_is_written_back_once(builds):
+    cache = CalendarCredentialsCache(max_size=10, ttl=60)
+    cache.service("a@example.com", CREDS)
+    saved = []
+
+    cache.save_if_refreshed("a@example.com", lambda email, data: saved.append(data))
+    assert saved == []  # nothing refreshed yet
+
+    credentials = builds[0]
+    credentials.token = "access-refreshed"
+    credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+    cache.save_if_refreshed("a@example.com", lambda email, data: saved.append(data))
+    cache.save_if_refreshed("a@example.com", lambda email, data: saved.append(data))
+
+    assert len(saved) == 1
+    assert saved[0]["token"] == "access-refreshed"
+    assert saved[0]["refresh_token"] == "refresh"
+
+    # The database now holds the refreshed JSON; the cached credentials stay valid for it
+    restored = google_calendar.credentials_from_json(json.dumps(saved[0]))
+    assert restored.expiry == credentials.expiry
+    cache.service("a@example.com", json.dumps(saved[0]))
+    assert builds[-1] is credentials
@@ -0,0 +1,140 @@
+"""Tests for the Calendar API quota scheduler (token buckets, lanes, Retry-After)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import calendar_quota
+import google_calendar
+from calendar_quota import CalendarQuota, quota_lane, BACKGROUND, INTERACTIVE
+from google_calendar import CalendarQuotaError, execute_batch, rate_limit_scope, retry_after
+from tests.fake_google import FakeCalendarService, http_error
+
+EMAIL = "student@example.com"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(google_calendar, "BATCH_BACKOFF_BASE", 0)
+
+
+def test_burst_then_refill_rate():
+    # burst 5, then (600 - 5) / 60 ~ 10 tokens a second
+    quota = CalendarQuota(user_per_minute=600, project_per_minute=10 ** 6, max_wait=5, user_burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        quota.acquire(EMAIL)
+    assert time.monotonic() - start < 0.05
+    quota.acquire(EMAIL, cost=2)
+    assert time.monotonic() - start >= 0.15
+
+    stats = quota.stats()["lanes"][INTERACTIVE]
+    assert stats["calls"] == 6 and stats["requests"] == 7 and stats["waited"] == 1
+
+
+def test_users_have_separate_buckets_but_share_the_project():
+    quota = CalendarQuota(user_per_minute=60, project_per_minute=600, max_wait=0.01, user_burst=2, project_burst=3)
+    quota.acquire("a@example.com", cost=2)
+    quota.acquire("b@example.com")
+    with pytest.raises(CalendarQuotaError) as exc:
+        quota.acquire("c@example.com")
+    assert exc.value.scope == google_calendar.PROJECT_SCOPE
+    assert exc.value.retry_after >= 1
+
+
+def test_wait_beyond_max_wait_is_rejected():
+    quota = CalendarQuota(user_per_minute=62, project_per_minute=10 ** 6, max_wait=0.05, user_burst=2)
+    quota.acquire(EMAIL, cost=2)
+    with pytest.raises(CalendarQuotaError) as exc:
+        quota.acquire(EMAIL)
+    assert exc.value.scope == google_calendar.USER_SCOPE
+    assert rate_limit_scope(exc.value) == google_calendar.USER_SCOPE
+    assert quota.stats()["lanes"][INTERACTIVE]["rejected"] == 1
+
+
+def test_interactive_lane_goes_before_background():
+    # One token every 0.2s after the first
+    quota = CalendarQuota(user_per_minute=301, project_per_minute=10 ** 6, max_wait=5, user_burst=1)
+    quota.acquire(EMAIL)
+    finished = []
+
+    def take(lane):
+        with quota_lane(lane):
+            quota.acquire(EMAIL)
+        finished.append(lane)
+
+    background = threading.Thread(target=take, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=take, args=(INTERACTIVE,))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+    assert finished == [INTERACTIVE, BACKGROUND]
+
+
+def test_lane_follows_calls_onto_worker_threads():
+    quota = CalendarQuota(user_per_minute=600, project_per_minute=10 ** 6, max_wait=5)
+
+    async def scenario():
+        with quota_lane(BACKGROUND):
+            await asyncio.to_thread(quota.acquire, EMAIL)
+
+    asyncio.run(scenario())
+    assert quota.stats()["lanes"][BACKGROUND]["calls"] == 1
+    assert quota.stats()["lanes"][INTERACTIVE]["calls"] == 0
+
+
+def test_retry_after_header_pauses_and_request_is_resent():
+    quota = CalendarQuota(user_per_minute=600, project_per_minute=10 ** 6, max_wait=5)
+    fake = FakeCalendarService()
+    cal_id = fake.add_calendar("CS 148")
+    fake.fail_next[("calendars", "get")] = [(429, "rateLimitExceeded", "0.2")]
+    service = quota.wrap(fake, EMAIL)
+
+    start = time.monotonic()
+    assert service.calendars().get(calendarId=cal_id).execute()["summary"] == "CS 148"
+    assert time.monotonic() - start >= 0.2
+    assert fake.count("calendars", "get") == 2
+    assert quota.stats()["throttled"] == {"user": 1, "project": 0}
+
+
+def test_permission_errors_are_not_retried():
+    quota = CalendarQuota(user_per_minute=600, project_per_minute=10 ** 6, max_wait=5)
+    fake = FakeCalendarService()
+    fake.fail_next[("calendars", "get")] = [(403, "forbidden")]
+    with pytest.raises(Exception):
+        quota.wrap(fake, EMAIL).calendars().get(calendarId="x").execute()
+    assert fake.count("calendars", "get") == 1
+    assert quota.stats()["throttled"] == {"user": 0, "project": 0}
+
+
+def test_batch_costs_one_token_per_sub_request(monkeypatch):
+    monkeypatch.setattr(calendar_quota, "DEFAULT_THROTTLE_PAUSE", 0)
+    quota = CalendarQuota(user_per_minute=600, project_per_minute=10 ** 6, max_wait=5)
+    fake = FakeCalendarService()
+    cal_id = fake.add_calendar("CS 148")
+    fake.fail_next[("events", "insert")] = [(403, "quotaExceeded")]
+    service = quota.wrap(fake, EMAIL)
+
+    requests = [
+        (f"e{i}", service.events().insert(calendarId=cal_id, body={"summary": f"HW{i}"}))
+        for i in range(3)
+    ]
+    responses, errors = execute_batch(service, requests)
+    assert len(responses) == 3 and not errors
+    assert fake.batch_sizes == [3, 1]
+    stats = quota.stats()
+    assert stats["lanes"][INTERACTIVE]["requests"] == 4
+    assert stats["throttled"] == {"user": 0, "project": 1}
+
+
+def test_retry_after_parsing():
+    assert retry_after(http_error(429, "rateLimitExceeded", 7)) == 7
+    assert retry_after(http_error(429, "rateLimitExceeded", "Wed, 21 Oct 2015 07:28:00 GMT")) == 0
+    assert retry_after(http_error(429, "rateLimitExceeded")) is None
+    assert rate_limit_scope(http_error(403, "userRateLimitExceeded")) == google_calendar.USER_SCOPE
+    assert rate_limit_scope(http_error(403, "forbidden")) is None
+    assert rate_limit_scope(http_error(500, "backendError")) is None
@@ -0,0 +1,415 @@
+"""Tests for POST /calendar/sync with batched Google Calendar writes."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import calendar_quota
+import google_calendar
+import database.db_manager as db_manager
+from calendar_quota import CalendarQuota
+from tests.fake_google import FakeCalendarService
+
+FAKE_CREDS = json.dumps({"token": "fake-token", "refresh_token": "fake-refresh"})
+
+
+@pytest.fixture(autouse=True)
+def roomy_quota(monkeypatch):
+    """Calls still go through the quota scheduler, but one sized so these tests never wait."""
+    import app
+    monkeypatch.setattr(calendar_quota, "DEFAULT_THROTTLE_PAUSE", 0)
+    quota = CalendarQuota(user_per_minute=10 ** 6, project_per_minute=10 ** 7, max_wait=5)
+    monkeypatch.setattr(app.calendar_credentials, "quota", quota)
+    return quota
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    monkeypatch.setattr(google_calendar, "BATCH_BACKOFF_BASE", 0)
+    return FakeCalendarService()
+
+
+@pytest.fixture
+def sync(fake_service, mock_db):
+    from app import app, calendar_credentials
+
+    client = TestClient(app)
+    calendar_credentials.clear()
+
+    def post(payload):
+        with patch("app.fetch_user_creds", return_value=FAKE_CREDS), \
+                patch("google_calendar.build_calendar_service", return_value=fake_service):
+            return client.post("/calendar/sync", params={"email": "student@example.com"}, json=payload)
+
+    return post
+
+
+def make_events(n, start=0):
+    return [
+        {"local_id": f"local-{i}", "title": f"HW{i}", "date": f"2026-01-{(i % 28) + 1:02d}"}
+        for i in range(start, start + n)
+    ]
+
+
+def test_new_class_inserts_in_one_batch(sync, fake_service):
+    resp = sync({"class_name": "CS 148", "events": make_events(40)})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [e["local_id"] for e in body["synced_events"]] == [f"local-{i}" for i in range(40)]
+    assert len(fake_service.event_store[body["google_calendar_id"]]) == 40
+    assert fake_service.batch_sizes == [40]
+    # calendarList.list + calendars.insert + one batch, instead of 40 inserts
+    assert fake_service.round_trips == 3
+
+
+def test_large_sync_is_split_into_batches_of_50(sync, fake_service):
+    sync({"class_name": "CS 148", "events": make_events(120)})
+    assert fake_service.batch_sizes == [50, 50, 20]
+
+
+def test_updates_deletes_and_inserts_mapped_to_local_ids(sync, fake_service):
+    cal_id = fake_service.add_calendar("CS 148")
+    keep = fake_service.add_event(cal_id, {"summary": "HW1"})
+    gone = fake_service.add_event(cal_id, {"summary": "HW2"})
+    resp = sync({
+        "class_name": "CS 148",
+        "google_calendar_id": cal_id,
+        "events": [
+            {"local_id": "a", "title": "HW1 (updated)", "date": "2026-01-10", "google_event_id": keep},
+            {"local_id": "b", "title": "HW2", "date": "2026-01-11", "google_event_id": gone, "is_deleted": True},
+            {"local_id": "c", "title": "HW3", "date": "2026-01-12"},
+        ],
+    })
+    synced = {e["local_id"]: e["google_event_id"] for e in resp.json()["synced_events"]}
+    assert set(synced) == {"a", "c"}
+    assert synced["a"] == keep
+    assert fake_service.event_store[cal_id][keep]["summary"] == "HW1 (updated)"
+    assert gone not in fake_service.event_store[cal_id]
+
+
+def test_rate_limited_sub_requests_retried_without_rebuild(sync, fake_service):
+    fake_service.fail_next[("events", "insert")] = [(403, "rateLimitExceeded"), (503, "backendError")]
+    resp = sync({"class_name": "CS 148", "events": make_events(10)})
+    assert resp.status_code == 200
+    assert len(resp.json()["synced_events"]) == 10
+    assert fake_service.batch_sizes == [10, 2]
+    assert fake_service.count("events", "list") == 0  # no full rebuild
+
+
+def test_failed_delete_is_reported_and_kept(sync, fake_service):
+    events = make_events(3)
+    first = sync({"class_name": "CS 148", "events": events})
+    payload = resync_payload(first, events)
+    payload["events"][1]["is_deleted"] = True
+    fake_service.fail_next[("events", "delete")] = [(403, "forbidden")]
+
+    body = sync(payload).json()
+    assert body["failed_deletes"] == ["local-1"]
+    assert "rebuild" not in body
+    cal_id = body["google_calendar_id"]
+    assert payload["events"][1]["google_event_id"] in fake_service.event_store[cal_id]
+    assert "local-1" in db_manager.fetch_sync_state("student@example.com", cal_id)
+
+    # Sent again, the delete goes through
+    body = sync(payload).json()
+    assert "failed_deletes" not in body
+    assert payload["events"][1]["google_event_id"] not in fake_service.event_store[cal_id]
+    assert "local-1" not in db_manager.fetch_sync_state("student@example.com", cal_id)
+
+
+def test_externally_deleted_event_is_recreated(sync, fake_service):
+    cal_id = fake_service.add_calendar("CS 148")
+    resp = sync({
+        "class_name": "CS 148",
+        "google_calendar_id": cal_id,
+        "events": [{"local_id": "a", "title": "HW1", "date": "2026-01-10", "google_event_id": "missing"}],
+    })
+    new_id = resp.json()["synced_events"][0]["google_event_id"]
+    assert new_id != "missing"
+    assert new_id in fake_service.event_store[cal_id]
+    assert fake_service.count("events", "list") == 0
+
+
+def test_permanent_failure_falls_back_to_batched_rebuild(sync, fake_service):
+    cal_id = fake_service.add_calendar("CS 148")
+    stale = fake_service.add_event(cal_id, {"summary": "old"})
+    fake_service.fail_next[("events", "insert")] = [(400, "invalid")]
+    resp = sync({"class_name": "CS 148", "google_calendar_id": cal_id, "events": make_events(3)})
+    assert resp.status_code == 200
+    assert stale not in fake_service.event_store[cal_id]
+    assert len(fake_service.event_store[cal_id]) == 3
+    assert len(resp.json()["synced_events"]) == 3
+
+
+def resync_payload(first_response, events):
+    """The request the app sends next time: same events, now with their google_event_ids."""
+    body = first_response.json()
+    ids = {e["local_id"]: e["google_event_id"] for e in body["synced_events"]}
+    return {
+        "class_name": "CS 148",
+        "google_calendar_id": body["google_calendar_id"],
+        "events": [dict(ev, google_event_id=ids[ev["local_id"]]) for ev in events],
+    }
+
+
+def test_resync_without_changes_skips_every_event(sync, fake_service):
+    events = make_events(30)
+    payload = resync_payload(sync({"class_name": "CS 148", "events": events}), events)
+    fake_service.batch_sizes.clear()
+
+    resp = sync(payload)
+    body = resp.json()
+    assert sorted(body["skipped_events"]) == sorted(e["local_id"] for e in events)
+    assert len(body["synced_events"]) == 30
+    assert fake_service.batch_sizes == []
+    assert fake_service.count("events", "update") == 0
+
+
+def test_resync_sends_only_changed_events(sync, fake_service):
+    events = make_events(30)
+    payload = resync_payload(sync({"class_name": "CS 148", "events": events}), events)
+    payload["events"][3]["description"] = "Now covers chapter 4"
+    payload["events"][7]["is_deleted"] = True
+    payload["events"].append({"local_id": "new", "title": "Quiz", "date": "2026-02-01"})
+    fake_service.batch_sizes.clear()
+
+    body = sync(payload).json()
+    assert len(body["skipped_events"]) == 28
+    assert fake_service.count("events", "update") == 1
+    assert fake_service.count("events", "delete") == 1
+    assert fake_service.batch_sizes == [1, 2]  # the delete, then the update and the insert
+
+    # The next sync only knows about the new state
+    payload = resync_payload(sync(payload), [ev for ev in payload["events"] if not ev.get("is_deleted")])
+    assert len(sync(payload).json()["skipped_events"]) == 30
+
+
+def test_sync_state_is_per_calendar(sync, fake_service):
+    events = make_events(3)
+    first = sync({"class_name": "CS 148", "events": events})
+    payload = resync_payload(first, events)
+    # The calendar was deleted in Google: the events are re-created in a new calendar
+    fake_service.calendar_store.clear()
+    fake_service.event_store.clear()
+
+    body = sync(payload).json()
+    assert body["google_calendar_id"] != first.json()["google_calendar_id"]
+    assert body["skipped_events"] == []
+    assert len(fake_service.event_store[body["google_calendar_id"]]) == 3
+
+
+def test_synced_events_are_stored_per_course(sync, fake_service):
+    events = make_events(3)
+    payload = resync_payload(sync({"class_name": "CS 148", "events": events}), events)
+    payload["events"][0]["is_deleted"] = True
+    sync(payload)
+
+    assert [e["local_id"] for e in db_manager.fetch_events("student@example.com", "CS 148")] == ["local-1", "local-2"]
+    assert db_manager.fetch_courses("student@example.com") == [
+        {"name": "CS 148", "google_calendar_id": payload["google_calendar_id"]}
+    ]
+
+
+@pytest.fixture
+def sync_all(fake_service, mock_db):
+    from app import app, calendar_credentials
+
+    client = TestClient(app)
+    calendar_credentials.clear()
+
+    def post(classes):
+        with patch("app.fetch_user_creds", return_value=FAKE_CREDS), \
+                patch("google_calendar.build_calendar_service", return_value=fake_service):
+            return client.post("/calendar/sync/all", params={"email": "student@example.com"}, json={"classes": classes})
+
+    return post
+
+
+def test_sync_all_resolves_calendars_with_one_list(sync_all, fake_service):
+    known = fake_service.add_calendar("CS 148")
+    by_name = fake_service.add_calendar("MATH 4A")
+    resp = sync_all([
+        {"class_name": "CS 148", "google_calendar_id": known, "events": make_events(3)},
+        {"class_name": "MATH 4A", "events": make_events(2)},
+        {"class_name": "WRIT 2", "events": make_events(4)},
+    ])
+
+    body = resp.json()
+    assert resp.status_code == 200
+    assert body["succeeded"] == 3 and body["failed"] == 0
+    assert [c["class_name"] for c in body["classes"]] == ["CS 148", "MATH 4A", "WRIT 2"]
+    assert [c["google_calendar_id"] for c in body["classes"]][:2] == [known, by_name]
+    assert fake_service.count("calendarList", "list") == 1
+    assert fake_service.count("calendars", "get") == 0
+    assert fake_service.count("calendars", "insert") == 1
+    assert [len(fake_service.event_store[c["google_calendar_id"]]) for c in body["classes"]] == [3, 2, 4]
+    assert {c["name"] for c in db_manager.fetch_courses("student@example.com")} == {"CS 148", "MATH 4A", "WRIT 2"}
+
+
+def test_sync_all_reports_failures_per_class(sync_all, fake_service):
+    fake_service.add_calendar("CS 148")
+    fake_service.fail_next[("calendars", "insert")] = [(403, "forbidden")]
+    body = sync_all([
+        {"class_name": "CS 148", "events": make_events(2)},
+        {"class_name": "WRIT 2", "events": make_events(2)},
+    ]).json()
+
+    assert [c["status"] for c in body["classes"]] == [200, 400]
+    assert body["succeeded"] == 1 and body["failed"] == 1
+
+
+def test_sync_all_rejects_duplicate_classes(sync_all):
+    resp = sync_all([{"class_name": "CS 148", "events": []}, {"class_name": "CS 148", "events": []}])
+    assert resp.status_code == 400
+
+
+def test_user_sync_limiter_caps_concurrency():
+    import asyncio
+
+    limiter = google_calendar.UserSyncLimiter(2)
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+
+    async def work(email):
+        async with limiter.slot(email):
+            running[email] += 1
+            peak[email] = max(peak[email], running[email])
+            await asyncio.sleep(0.01)
+            running[email] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(work(email) for email in ["a"] * 5 + ["b"] * 3))
+
+    asyncio.run(scenario())
+    assert peak == {"a": 2, "b": 2}
+    assert limiter._users == {}
+
+
+def test_known_class_skips_calendar_list_and_get(sync, fake_service):
+    first = sync({"class_name": "CS 148", "events": make_events(2)}).json()
+    fake_service.calls.clear()
+
+    # No google_calendar_id in the request: the stored index supplies it
+    body = sync({"class_name": "CS 148", "events": make_events(1, start=2)}).json()
+    assert body["google_calendar_id"] == first["google_calendar_id"]
+    assert fake_service.count("calendarList", "list") == 0
+    assert fake_service.count("calendars", "get") == 0
+    assert len(fake_service.event_store[first["google_calendar_id"]]) == 3
+
+
+def test_stale_calendar_id_is_replaced_on_404(sync, fake_service):
+    first = sync({"class_name": "CS 148", "events": make_events(2)}).json()
+    del fake_service.calendar_store[first["google_calendar_id"]]
+    del fake_service.event_store[first["google_calendar_id"]]
+
+    body = sync({"class_name": "CS 148", "events": make_events(3)}).json()
+    assert body["google_calendar_id"] != first["google_calendar_id"]
+    assert len(fake_service.event_store[body["google_calendar_id"]]) == 3
+    assert db_manager.fetch_calendar_id("student@example.com", "CS 148") == body["google_calendar_id"]
+
+
+def test_deleting_a_calendar_drops_it_from_the_index(sync, fake_service):
+    from app import app
+
+    cal_id = sync({"class_name": "CS 148", "events": make_events(1)}).json()["google_calendar_id"]
+    with patch("app.fetch_user_creds", return_value=FAKE_CREDS), \
+            patch("google_calendar.build_calendar_service", return_value=fake_service):
+        resp = TestClient(app).delete("/calendar", params={"email": "student@example.com", "google_calendar_id": cal_id})
+    assert resp.status_code == 200
+    assert db_manager.fetch_calendar_id("student@example.com", "CS 148") is None
+
+
+def test_sync_all_uses_the_index(sync, sync_all, fake_service):
+    sync({"class_name": "CS 148", "events": make_events(1)})
+    fake_service.calls.clear()
+
+    body = sync_all([{"class_name": "CS 148", "events": make_events(2)}]).json()
+    assert body["succeeded"] == 1
+    assert fake_service.count("calendarList", "list") == 0
+
+
+def test_rebuild_reconciles_and_reuses_existing_events(sync, fake_service):
+    events = make_events(4)
+    payload = resync_payload(sync({"class_name": "CS 148", "events": events}), events)
+    cal_id = payload["google_calendar_id"]
+    stray = fake_service.add_event(cal_id, {"summary": "added by hand"})
+    edited = payload["events"][0]["google_event_id"]
+    fake_service.event_store[cal_id][edited]["summary"] = "edited in Google"
+    payload["events"].append({"local_id": "new", "title": "HW9", "date": "2026-01-20"})
+    fake_service.fail_next[("events", "insert")] = [(400, "invalid")]  # breaks the incremental sync
+    fake_service.calls.clear()
+
+    body = sync(payload).json()
+    assert body["google_calendar_id"] == cal_id
+    assert body["rebuild"] == {"mode": "reconcile", "reused": 3, "updated": 1, "inserted": 1, "deleted": 1}
+    assert sorted(body["skipped_events"]) == ["local-1", "local-2", "local-3"]
+    assert fake_service.event_store[cal_id][edited]["summary"] == "HW0"
+    assert stray not in fake_service.event_store[cal_id]
+    assert len(fake_service.event_store[cal_id]) == 5
+    assert fake_service.count("events", "list") == 1
+
+
+def test_rebuild_recreates_calendar_when_it_is_gone(sync, fake_service):
+    events = make_events(3)
+    first = sync({"class_name": "CS 148", "events": events}).json()
+    old_cal = first["google_calendar_id"]
+    # Fails the 5 inserts of the incremental sync, then the calendar is gone when the reconcile lists it
+    fake_service.fail_next[("events", "insert")] = [(400, "invalid")] * 5
+    fake_service.fail_next[("events", "list")] = [(404, "notFound")]
+
+    body = sync({"class_name": "CS 148", "google_calendar_id": old_cal, "events": make_events(5)}).json()
+    new_cal = body["google_calendar_id"]
+    assert body["rebuild"] == {"mode": "recreate", "inserted": 5, "replaced_calendar": old_cal}
+    assert len(fake_service.event_store[new_cal]) == 5
+    assert fake_service.count("calendars", "delete") == 0
+    assert db_manager.fetch_calendar_id("student@example.com", "CS 148") == new_cal
+    assert db_manager.fetch_sync_state("student@example.com", old_cal) == {}
+    assert len(db_manager.fetch_sync_state("student@example.com", new_cal)) == 5
+
+
+def test_failed_reconcile_keeps_the_calendar(sync, fake_service):
+    cal_id = sync({"class_name": "CS 148", "events": make_events(3)}).json()["google_calendar_id"]
+    # Fails all 5 inserts of the incremental sync and the first insert of the reconcile
+    fake_service.fail_next[("events", "insert")] = [(400, "invalid")] * 6
+
+    resp = sync({"class_name": "CS 148", "google_calendar_id": cal_id, "events": make_events(5)})
+    assert resp.status_code == 400
+    assert cal_id in fake_service.calendar_store
+    assert fake_service.count("calendars", "delete") == 0
+    assert fake_service.count("calendars", "insert") == 1
+    assert db_manager.fetch_calendar_id("student@example.com", "CS 148") == cal_id
+
+
+def test_recreated_calendar_is_indexed_before_its_events_are_inserted(sync, fake_service):
+    old_cal = sync({"class_name": "CS 148", "events": make_events(1)}).json()["google_calendar_id"]
+    fake_service.fail_next[("events", "insert")] = [(400, "invalid")] * 3
+    fake_service.fail_next[("events", "list")] = [(404, "notFound")]
+
+    assert sync({"class_name": "CS 148", "google_calendar_id": old_cal, "events": make_events(2)}).status_code == 400
+    new_cal = db_manager.fetch_calendar_id("student@example.com", "CS 148")
+    assert new_cal not in (None, old_cal)
+    assert new_cal in fake_service.calendar_store
+
+
+def test_invalid_date_is_rejected_before_any_calendar_call(sync, fake_service):
+    cal_id = sync({"class_name": "CS 148", "events": make_events(1)}).json()["google_calendar_id"]
+    fake_service.calls.clear()
+
+    for bad in ("TBD", "2026-1-5", "20260105", "2026-02-30"):
+        resp = sync({"class_name": "CS 148", "google_calendar_id": cal_id,
+                     "events": [{"local_id": "local-0", "title": "HW0", "date": bad}]})
+        assert resp.status_code == 422
+    assert fake_service.calls == []
+    assert cal_id in fake_service.calendar_store
+
+
+def test_exhausted_rate_limit_is_429_without_rebuild(sync, fake_service, roomy_quota):
+    fake_service.fail_next[("events", "insert")] = [(403, "userRateLimitExceeded", 0)] * 3 + [(403, "userRateLimitExceeded", 3)]
+    resp = sync({"class_name": "CS 148", "events": make_events(1)})
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "3"
+    assert fake_service.count("events", "list") == 0  # no rebuild
+    assert fake_service.count("calendars", "delete") == 0
+    assert roomy_quota.stats()["throttled"]["user"] == 4
@@ -0,0 +1,216 @@
+"""Tests for watch channels on class calendars and the POST /calendar/notifications webhook."""
+
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import calendar_quota
+import calendar_watch
+import google_calendar
+import database.db_manager as db_manager
+from calendar_quota import CalendarQuota
+from database import channel_store
+from tests.fake_google import FakeCalendarService, send_notifications
+
+FAKE_CREDS = json.dumps({"token": "fake-token", "refresh_token": "fake-refresh"})
+EMAIL = "student@example.com"
+WEBHOOK_URL = "https://plannr.example.com/calendar/notifications"
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    import app
+    monkeypatch.setattr(google_calendar, "BATCH_BACKOFF_BASE", 0)
+    monkeypatch.setattr(calendar_quota, "DEFAULT_THROTTLE_PAUSE", 0)
+    monkeypatch.setattr(app.calendar_credentials, "quota", CalendarQuota(10 ** 6, 10 ** 7, max_wait=5))
+    monkeypatch.setattr(app.watches, "address", WEBHOOK_URL)
+    app.calendar_credentials.clear()
+    return FakeCalendarService()
+
+
+@pytest.fixture
+def client(fake_service, mock_db):
+    from app import app
+
+    with patch("app.fetch_user_creds", return_value=FAKE_CREDS), \
+            patch("google_calendar.build_calendar_service", return_value=fake_service):
+        yield TestClient(app)
+
+
+def make_events(n):
+    return [{"local_id": f"local-{i}", "title": f"HW{i}", "date": f"2026-01-{i + 1:02d}"} for i in range(n)]
+
+
+def sync_class(client, events):
+    resp = client.post("/calendar/sync", params={"email": EMAIL}, json={"class_name": "CS 148", "events": events})
+    assert resp.status_code == 200
+    body = resp.json()
+    return body["google_calendar_id"], {e["local_id"]: e["google_event_id"] for e in body["synced_events"]}
+
+
+def stored_events():
+    return {e["local_id"]: e for e in db_manager.fetch_events(EMAIL, "CS 148")}
+
+
+def test_sync_opens_a_channel_with_a_baseline_token(client, fake_service):
+    cal_id, _ = sync_class(client, make_events(3))
+
+    channel = channel_store.channel_for_calendar(EMAIL, cal_id)
+    assert channel["course"] == "CS 148"
+    assert channel["sync_token"] is not None
+    assert fake_service.watch_channels[channel["id"]]["address"] == WEBHOOK_URL
+    assert fake_service.count("events", "watch") == 1
+
+    # A second sync keeps the channel
+    sync_class(client, make_events(3))
+    assert fake_service.count("events", "watch") == 1
+    assert channel_store.channel_count() == 1
+
+
+def test_google_edits_are_pulled_incrementally(client, fake_service):
+    cal_id, google_ids = sync_class(client, make_events(20))
+    lists_before = fake_service.count("events", "list")
+
+    fake_service.edit_event(cal_id, google_ids["local-3"], summary="HW3 (moved)", start={"date": "2026-02-01"})
+    fake_service.remove_event(cal_id, google_ids["local-5"])
+    assert [r.status_code for r in send_notifications(client, fake_service, cal_id)] == [200]
+
+    events = stored_events()
+    assert events["local-3"]["title"] == "HW3 (moved)"
+    assert events["local-3"]["date"] == "2026-02-01"
+    assert "local-5" not in events
+    assert len(events) == 19
+    assert fake_service.count("events", "list") == lists_before + 1
+
+    # The next client sync of the edited content has nothing to send
+    state = db_manager.fetch_sync_state(EMAIL, cal_id)
+    assert "local-5" not in state
+    assert state["local-3"][0] == google_ids["local-3"]
+
+
+def resync(client, cal_id, google_ids, events):
+    """The client's next sync of events, with the google_event_ids it was given."""
+    resp = client.post("/calendar/sync", params={"email": EMAIL}, json={
+        "class_name": "CS 148", "google_calendar_id": cal_id,
+        "events": [dict(ev, google_event_id=google_ids[ev["local_id"]]) for ev in events],
+    })
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_stale_client_sync_keeps_google_edits_and_returns_them(client, fake_service):
+    events = make_events(4)
+    cal_id, google_ids = sync_class(client, events)
+    fake_service.edit_event(cal_id, google_ids["local-1"], summary="HW1 (moved)", start={"date": "2026-02-01"})
+    fake_service.remove_event(cal_id, google_ids["local-2"])
+    send_notifications(client, fake_service, cal_id)
+    inserts = fake_service.count("events", "insert")
+
+    # The client hasn't heard of either change and sends what it synced last time
+    body = resync(client, cal_id, google_ids, events)
+    changes = {c["local_id"]: c for c in body["remote_changes"]}
+    assert changes["local-1"]["title"] == "HW1 (moved)"
+    assert changes["local-1"]["date"] == "2026-02-01"
+    assert changes["local-2"] == {"local_id": "local-2", "google_event_id": google_ids["local-2"], "is_deleted": True}
+    assert fake_service.event_store[cal_id][google_ids["local-1"]]["summary"] == "HW1 (moved)"
+    assert google_ids["local-2"] not in fake_service.event_store[cal_id]
+    assert fake_service.count("events", "insert") == inserts  # the deleted event isn't recreated
+    assert stored_events()["local-1"]["title"] == "HW1 (moved)"
+    assert "local-2" not in stored_events()
+
+    # Delivered once: the sync after that is an ordinary one
+    assert "remote_changes" not in resync(client, cal_id, google_ids, [events[0], events[3]])
+
+
+def test_client_edit_wins_over_an_older_google_edit(client, fake_service):
+    events = make_events(2)
+    cal_id, google_ids = sync_class(client, events)
+    fake_service.edit_event(cal_id, google_ids["local-0"], summary="edited in Google")
+    send_notifications(client, fake_service, cal_id)
+
+    events[0]["title"] = "edited in the app"
+    body = resync(client, cal_id, google_ids, events)
+    assert "remote_changes" not in body
+    assert fake_service.event_store[cal_id][google_ids["local-0"]]["summary"] == "edited in the app"
+    assert db_manager.fetch_remote_changes(EMAIL, cal_id) == {}
+
+
+def test_servers_own_writes_are_ignored(client, fake_service):
+    from app import watches
+
+    events = make_events(3)
+    cal_id, google_ids = sync_class(client, events)
+    # The client edits an event; the server's update comes back as a Google change
+    events[1]["description"] = "Now covers chapter 4"
+    client.post("/calendar/sync", params={"email": EMAIL}, json={
+        "class_name": "CS 148", "google_calendar_id": cal_id,
+        "events": [dict(ev, google_event_id=google_ids[ev["local_id"]]) for ev in events],
+    })
+    before, applied = stored_events(), watches.stats()["changes_applied"]
+    lists_before = fake_service.count("events", "list")
+
+    send_notifications(client, fake_service, cal_id)
+    assert fake_service.count("events", "list") == lists_before + 1
+    assert stored_events() == before
+    assert watches.stats()["changes_applied"] == applied
+
+
+def test_expired_sync_token_falls_back_to_a_full_pull(client, fake_service):
+    cal_id, google_ids = sync_class(client, make_events(3))
+    fake_service.remove_event(cal_id, google_ids["local-1"])
+    fake_service.expire_sync_tokens()
+
+    send_notifications(client, fake_service, cal_id)
+    assert "local-1" not in stored_events()
+    assert channel_store.channel_for_calendar(EMAIL, cal_id)["sync_token"] == f"sync-{len(fake_service._changes)}"
+
+
+def test_unknown_channel_or_wrong_token_is_rejected(client, fake_service):
+    cal_id, _ = sync_class(client, make_events(1))
+    channel = channel_store.channel_for_calendar(EMAIL, cal_id)
+    headers = {"X-Goog-Channel-ID": channel["id"], "X-Goog-Resource-ID": channel["resource_id"],
+               "X-Goog-Resource-State": "exists"}
+
+    assert client.post("/calendar/notifications", headers=dict(headers, **{"X-Goog-Channel-Token": "guess"})).status_code == 404
+    assert client.post("/calendar/notifications", headers=dict(headers, **{
+        "X-Goog-Channel-ID": "nope", "X-Goog-Channel-Token": channel["token"]
+    })).status_code == 404
+
+
+def test_sync_message_needs_no_pull(client, fake_service):
+    cal_id, _ = sync_class(client, make_events(1))
+    lists_before = fake_service.count("events", "list")
+
+    assert [r.status_code for r in send_notifications(client, fake_service, cal_id, state="sync")] == [200]
+    assert fake_service.count("events", "list") == lists_before
+
+
+def test_expiring_channel_is_renewed_with_its_sync_token(client, fake_service):
+    from app import watches
+
+    cal_id, _ = sync_class(client, make_events(2))
+    old = channel_store.channel_for_calendar(EMAIL, cal_id)
+    channel_store.save_channel(old["id"], EMAIL, cal_id, "CS 148", old["resource_id"], old["token"],
+                               time.time() + 60, old["sync_token"])
+    lists_before = fake_service.count("events", "list")
+
+    assert asyncio.run(watches.renew_expiring()) == 1
+
+    new = channel_store.channel_for_calendar(EMAIL, cal_id)
+    assert new["id"] != old["id"]
+    assert new["sync_token"] == old["sync_token"]
+    assert new["expiration"] > time.time() + calendar_watch.WATCH_RENEW_BEFORE
+    assert set(fake_service.watch_channels) == {new["id"]}
+    assert fake_service.count("events", "list") == lists_before  # no full pull needed
+
+
+def test_deleting_the_calendar_stops_its_channel(client, fake_service):
+    cal_id, _ = sync_class(client, make_events(1))
+
+    assert client.delete("/calendar", params={"email": EMAIL, "google_calendar_id": cal_id}).status_code == 200
+    assert channel_store.channel_count() == 0
+    assert fake_service.watch_channels == {}
@@ -0,0 +1,107 @@
+"""Tests for chunked (map-reduce) syllabus parsing."""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+from syllabus_chunks import split_syllabus, merge_chunk_results
+
+SCHEDULE = "CS 148 Syllabus - Winter 2026\n\n" + "".join(
+    f"Week {n}\nLecture topic {n}: " + "material " * 20 + f"\nHW{n} due Friday of week {n}\n\n"
+    for n in range(1, 11)
+)
+
+
+def test_short_text_is_one_chunk():
+    assert split_syllabus("HW1 due Jan 15", 1000) == ["HW1 due Jan 15"]
+
+
+def test_chunks_respect_limit_and_keep_rows_whole():
+    chunks = split_syllabus(SCHEDULE, 600)
+    assert len(chunks) > 1
+    assert all(len(c) <= 600 for c in chunks)
+    assert "".join(chunks).replace("\n", "") == SCHEDULE.replace("\n", "")
+    for n in range(1, 11):
+        # Each week's section lands in exactly one chunk, with its HW row
+        holders = [c for c in chunks if f"Week {n}\n" in c]
+        assert len(holders) == 1
+        assert f"HW{n} due" in holders[0]
+
+
+def test_oversized_line_is_split():
+    chunks = split_syllabus("x" * 2500, 1000)
+    assert [len(c) for c in chunks] == [1000, 1000, 500]
+
+
+def test_merge_reconciles_class_and_duplicates():
+    merged = merge_chunk_results([
+        {"events": [
+            {"title": "HW1", "date": "2026-01-16", "Class": "CS148", "description": ""},
+            {"title": "HW2", "date": "2026-01-23", "Class": "CS148", "description": ""},
+        ]},
+        {"events": [
+            {"title": "HW 2", "date": "2026-01-23", "Class": "unknown", "description": "Problems 1-5"},
+            {"title": "Final Exam", "date": "2027-01-02", "Class": "unknown", "description": ""},
+        ]},
+        {"events": []},
+    ])
+    events = merged["events"]
+    assert [e["title"] for e in events] == ["HW1", "HW2", "Final Exam"]
+    assert events[1]["description"] == "Problems 1-5"
+    assert events[2]["date"] == "2027-01-02"  # no header naming the term: dates are kept as parsed
+    assert all(e["Class"] == "CS148" for e in events)
+    assert "partial" not in merged
+
+
+def test_merge_moves_dates_into_the_headers_term():
+    merged = merge_chunk_results([
+        {"events": [{"title": "HW1", "date": "2025-10-03", "Class": "MATH4A", "description": ""}]},
+        # A later chunk saw no year and guessed the wrong one
+        {"events": [
+            {"title": "HW6", "date": "2026-11-07", "Class": "MATH4A", "description": ""},
+            {"title": "Final Exam", "date": "2025-01-05", "Class": "MATH4A", "description": ""},
+            {"title": "Project", "date": "not a date", "Class": "MATH4A", "description": ""},
+        ]},
+    ], header="MATH 4A Calculus\nFall 2025\n")
+    dates = {e["title"]: e["date"] for e in merged["events"]}
+    assert dates == {"HW1": "2025-10-03", "HW6": "2025-11-07", "Final Exam": "2026-01-05", "Project": "not a date"}
+
+
+def test_long_syllabus_parsed_per_chunk(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "GEMINI_CHUNK_CHARS", 600)
+    prompts = []
+
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        week = len(prompts)
+        return json.dumps({"events": [{"title": f"Item {week}", "date": f"2026-01-{week:02d}", "Class": "CS148"}]})
+
+    with patch.object(app.gemini_client, "generate", side_effect=fake_generate):
+        result = asyncio.run(app.parse_with_gemini(SCHEDULE))
+
+    assert len(prompts) == len(split_syllabus(SCHEDULE, 600))
+    assert len(result["events"]) == len(prompts)
+    # Later chunks carry the header for term/year inference
+    assert "Beginning of document" not in prompts[0]
+    assert all("CS 148 Syllabus - Winter 2026" in p for p in prompts[1:])
+
+
+def test_failed_chunk_makes_the_result_partial(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "GEMINI_CHUNK_CHARS", 600)
+    calls = []
+
+    async def flaky_generate(prompt):
+        calls.append(prompt)
+        if len(calls) == 2:
+            raise TimeoutError("deadline exceeded")
+        return json.dumps({"events": [{"title": f"Item {len(calls)}", "date": "2026-01-05", "Class": "CS148"}]})
+
+    with patch.object(app.gemini_client, "generate", side_effect=flaky_generate):
+        result = asyncio.run(app.parse_with_gemini(SCHEDULE))
+
+    assert result["partial"] is True
+    assert len(result["events"]) == len(calls) - 1
@@ -1,6 +1,7 @@
 import pytest
 import sqlite3
 import json
+import threading
 from unittest.mock import patch
 import database.db_manager as db_manager
 
@@ -59,33 +60,214 @@ def test_fetch_existing_user_creds(mock_db, sample_user):
     fetched_creds = db_manager.fetch_user_creds(sample_user)
     assert json.loads(fetched_creds) == creds_data
 
-@pytest.mark.parametrize("update_func, col_name, payload", [
-    (db_manager.update_creds, "google_credentials", {"access_token": "token_123"}),
-    (db_manager.update_syllabi, "syllabi", {"course": "CS101"}),
-    (db_manager.update_calendar, "calendar", {"event": "Interview"}),
-])
-def test_update_functions(mock_db, sample_user, update_func, col_name, payload):
-    """
-    Parametrized test to cover all update functions.
-    Checks if the correct column is updated with the correct JSON.
-    """
-    update_func(sample_user, payload)
+def test_update_creds(mock_db, sample_user):
+    """Credentials are still stored as JSON on the users row."""
+    payload = {"access_token": "token_123"}
+    db_manager.update_creds(sample_user, payload)
 
     with sqlite3.connect(mock_db) as conn:
         cursor = conn.cursor()
-        cursor.execute(f"SELECT {col_name} FROM users WHERE email=?", (sample_user,))
+        cursor.execute("SELECT google_credentials FROM users WHERE email=?", (sample_user,))
         row = cursor.fetchone()
         assert json.loads(row[0]) == payload
 
+def test_update_syllabi_stores_event_rows(mock_db, sample_user):
+    """Syllabi are stored one row per event, replacing only the courses given."""
+    db_manager.update_syllabi(sample_user, [
+        {"course": "CS101", "events": [{"title": "Midterm", "date": "2023-10-25"}]},
+        {"course": "MATH3A", "events": [{"title": "Quiz 1", "date": "2023-10-02", "type": "quiz"}]},
+    ])
+    db_manager.update_syllabi(sample_user, {"course": "CS101", "events": [{"title": "Final", "date": "2023-12-15"}]})
+
+    events = db_manager.fetch_events(sample_user)
+    assert [(e["Class"], e["title"], e["date"]) for e in events] == [
+        ("MATH3A", "Quiz 1", "2023-10-02"),
+        ("CS101", "Final", "2023-12-15"),
+    ]
+    assert events[0]["type"] == "quiz"
+
+def test_update_calendar_maps_courses(mock_db, sample_user):
+    """Calendar info is stored as a course -> google calendar id mapping."""
+    db_manager.update_calendar(sample_user, {"CS101": "cal-1"})
+    db_manager.update_calendar(sample_user, [{"class_name": "MATH3A", "google_calendar_id": "cal-2"}])
+    assert db_manager.fetch_courses(sample_user) == [
+        {"name": "CS101", "google_calendar_id": "cal-1"},
+        {"name": "MATH3A", "google_calendar_id": "cal-2"},
+    ]
+
+def test_event_level_writes(mock_db, sample_user):
+    """Single events are inserted, updated and deleted without touching the rest."""
+    db_manager.save_course_events(sample_user, "CS101", [
+        {"local_id": "a", "title": "HW1", "date": "2023-10-01"},
+        {"local_id": "b", "title": "HW2", "date": "2023-10-08"},
+    ], google_calendar_id="cal-1")
+    db_manager.save_course_events(sample_user, "CS101", [
+        {"local_id": "a", "title": "HW1", "date": "2023-10-03", "description": "moved"},
+    ], removed=["b"])
+    db_manager.save_course_events(sample_user, "CS102", [{"local_id": "c", "title": "Lab", "date": "2023-10-05"}])
+
+    assert [(e["local_id"], e["date"], e["description"]) for e in db_manager.fetch_events(sample_user, "CS101")] == [
+        ("a", "2023-10-03", "moved")
+    ]
+    assert [e["local_id"] for e in db_manager.fetch_events(sample_user, start="2023-10-04")] == ["c"]
+    assert db_manager.delete_course_event(sample_user, "CS102", "c")
+    assert not db_manager.delete_course_event(sample_user, "CS102", "c")
+    assert db_manager.fetch_courses(sample_user)[0] == {"name": "CS101", "google_calendar_id": "cal-1"}
+
+def test_init_db_migrates_legacy_blobs(tmp_path, monkeypatch):
+    """Existing JSON blobs are moved into the normalized tables once."""
+    legacy_db = tmp_path / "legacy.db"
+    with sqlite3.connect(legacy_db) as conn:
+        conn.execute("create table users(email text unique not null, google_credentials text, calendar text, syllabi text)")
+        conn.execute("insert into users values (?, NULL, ?, ?)", (
+            "old@example.com",
+            json.dumps({"CS101": "cal-1"}),
+            json.dumps([{"course": "CS101", "events": [{"title": "Midterm", "date": "2023-10-25"}]}]),
+        ))
+        conn.execute("insert into users values (?, NULL, ?, NULL)", ("odd@example.com", json.dumps(["not", "a", "mapping"])))
+    monkeypatch.setattr(db_manager, "DB_NAME", legacy_db)
+
+    db_manager.init_db()
+    db_manager.init_db()
+
+    assert [(e["Class"], e["title"]) for e in db_manager.fetch_events("old@example.com")] == [("CS101", "Midterm")]
+    assert db_manager.fetch_courses("old@example.com") == [{"name": "CS101", "google_calendar_id": "cal-1"}]
+    with sqlite3.connect(legacy_db) as conn:
+        rows = dict(conn.execute("select email, coalesce(calendar, '') || coalesce(syllabi, '') from users").fetchall())
+    assert rows["old@example.com"] == ""
+    assert rows["odd@example.com"] == json.dumps(["not", "a", "mapping"])  # unrecognized blobs are kept
+
 def test_remove_user(mock_db, sample_user):
     """Test user removal."""
+    db_manager.update_syllabi(sample_user, {"course": "CS101", "events": [{"title": "Final", "date": "2023-12-15"}]})
     db_manager.remove_user(sample_user)
+    assert db_manager.fetch_events(sample_user) == []
     
     with sqlite3.connect(mock_db) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE email=?", (sample_user,))
         assert cursor.fetchone() is None
 
+def test_sync_state_round_trip(mock_db, sample_user):
+    """Sync state is stored per calendar and updated in place."""
+    db_manager.save_sync_state(sample_user, "cal1", [("a", "ev1", "h1"), ("b", "ev2", "h2")])
+    db_manager.save_sync_state(sample_user, "cal2", [("a", "ev9", "h9")])
+    db_manager.save_sync_state(sample_user, "cal1", [("a", "ev1", "h1-new")], removed=["b"])
+
+    assert db_manager.fetch_sync_state(sample_user, "cal1") == {"a": ("ev1", "h1-new")}
+    assert db_manager.fetch_sync_state(sample_user, "cal2") == {"a": ("ev9", "h9")}
+
+    db_manager.clear_sync_state(sample_user, "cal1")
+    assert db_manager.fetch_sync_state(sample_user, "cal1") == {}
+
+def test_remote_changes_keep_the_first_base_hash(mock_db, sample_user):
+    """Remote changes keep the hash the client synced before the first Google edit."""
+    db_manager.save_remote_changes(sample_user, "cal1", [("a", "h1", False), ("b", "h2", False)])
+    db_manager.save_remote_changes(sample_user, "cal1", [("a", "h1-edited", True)])
+    assert db_manager.fetch_remote_changes(sample_user, "cal1") == {"a": ("h1", True), "b": ("h2", False)}
+
+    db_manager.clear_remote_changes(sample_user, "cal1", ["b"])
+    assert db_manager.fetch_remote_changes(sample_user, "cal1") == {"a": ("h1", True)}
+    db_manager.clear_sync_state(sample_user, "cal1")
+    assert db_manager.fetch_remote_changes(sample_user, "cal1") == {}
+
+def test_calendar_index(mock_db, sample_user):
+    """Calendar ids are looked up per (email, course) and can be dropped without losing the course."""
+    assert db_manager.fetch_calendar_id(sample_user, "CS101") is None
+    db_manager.save_calendar_id(sample_user, "CS101", "cal1")
+    db_manager.save_calendar_id(sample_user, "CS101", "cal2")
+    assert db_manager.fetch_calendar_id(sample_user, "CS101") == "cal2"
+    assert db_manager.fetch_calendar_id("other@example.com", "CS101") is None
+
+    db_manager.forget_calendar(sample_user, "cal2")
+    assert db_manager.fetch_calendar_id(sample_user, "CS101") is None
+    assert db_manager.fetch_courses(sample_user) == [{"name": "CS101", "google_calendar_id": None}]
+
+def test_connection_is_reused_per_thread_in_wal_mode(mock_db):
+    """Each thread keeps one configured connection instead of connecting per call."""
+    conn = db_manager.get_connection()
+    assert db_manager.get_connection() is conn
+    assert conn.execute("pragma journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db_manager.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+def test_concurrent_writers_do_not_lock(mock_db):
+    """Writers in many threads wait for the lock instead of failing."""
+    errors = []
+
+    def worker(n):
+        try:
+            email = f"user{n}@example.com"
+            db_manager.add_user(email)
+            for i in range(10):
+                db_manager.update_creds(email, {"token": f"t{i}"})
+                db_manager.save_course_events(email, "CS101", [{"local_id": str(i), "title": "HW", "date": "2023-10-01"}])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db_manager.close_connection()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(db_manager.fetch_events("user7@example.com")) == 10
+
+def test_credentials_served_from_cache_until_updated(mock_db, sample_user):
+    """Repeated lookups skip SQLite; update_creds and remove_user invalidate."""
+    db_manager.update_creds(sample_user, {"token": "v1"})
+    assert db_manager.fetch_user_creds(sample_user) == '{"token": "v1"}'
+
+    with patch('database.db_manager.get_connection', side_effect=AssertionError("hit the database")):
+        assert db_manager.fetch_user_creds(sample_user) == '{"token": "v1"}'
+    assert db_manager.credential_cache_stats()["hits"] >= 1
+
+    db_manager.update_creds(sample_user, {"token": "v2"})
+    assert db_manager.fetch_user_creds(sample_user) == '{"token": "v2"}'
+
+    db_manager.remove_user(sample_user)
+    assert db_manager.fetch_user_creds(sample_user) is None  # re-created without credentials
+
+def test_credentials_cache_expires(mock_db, sample_user, monkeypatch):
+    """Another worker's write is seen once the TTL passes."""
+    db_manager.update_creds(sample_user, {"token": "v1"})
+    db_manager.fetch_user_creds(sample_user)
+    with sqlite3.connect(mock_db) as conn:
+        conn.execute("update users set google_credentials = 'other-worker' where email = ?", (sample_user,))
+    assert db_manager.fetch_user_creds(sample_user) == '{"token": "v1"}'
+
+    monkeypatch.setattr(db_manager._creds_cache, "ttl", 0)
+    db_manager.update_creds(sample_user, {"token": "x"})  # clears the entry
+    db_manager.fetch_user_creds(sample_user)
+    with sqlite3.connect(mock_db) as conn:
+        conn.execute("update users set google_credentials = 'other-worker' where email = ?", (sample_user,))
+    assert db_manager.fetch_user_creds(sample_user) == "other-worker"
+
+def test_missing_credentials_are_not_cached(mock_db, sample_user):
+    """A user who just signed in through another worker is not answered from a cached None."""
+    assert db_manager.fetch_user_creds(sample_user) is None
+    with sqlite3.connect(mock_db) as conn:
+        conn.execute("update users set google_credentials = 'other-worker' where email = ?", (sample_user,))
+    assert db_manager.fetch_user_creds(sample_user) == "other-worker"
+
+def test_stale_read_does_not_refill_cache():
+    """A read that started before an invalidation can't put its old value back."""
+    cache = db_manager._CredentialCache(max_size=2, ttl=60)
+    version = cache.version("k")
+    cache.invalidate("k")
+    cache.put("k", "stale", version)
+    assert cache.get("k") == (False, None)
+
+    cache.put("k", "fresh", cache.version("k"))
+    assert cache.get("k") == (True, "fresh")
+
 # --- Exception & Edge Case Tests ---
 
 def test_add_duplicate_user_raises_error(mock_db, sample_user):
@@ -116,6 +298,6 @@ def test_init_db_connection_error():
 
 def test_add_user_generic_db_error(mock_db):
     """Simulate a generic DB error during add_user."""
-    with patch('sqlite3.connect', side_effect=sqlite3.Error("Disk full")):
+    with patch('database.db_manager.get_connection', side_effect=sqlite3.Error("Disk full")):
         with pytest.raises(Exception, match="Failed to add the user"):
             db_manager.add_user("example@gmail.com")
\ No newline at end of file
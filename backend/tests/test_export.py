@@ -102,3 +102,134 @@ def test_export_empty_events(client):
         )
     assert resp.status_code == 400
     assert "no events" in resp.json()["error"].lower()
+
+
+def test_export_invalid_date_is_rejected_before_streaming(client):
+    """A bad date still returns 400 instead of a truncated file."""
+    with patch("app.fetch_user_creds", return_value=FAKE_CREDS):
+        resp = client.post(
+            "/export",
+            params={"email": "student@example.com", "format": "ics"},
+            json={"events": [{"title": "HW1", "date": "next Tuesday"}]}
+        )
+    assert resp.status_code == 400
+
+
+def test_exporters_stream_incrementally():
+    """Exporters pull events lazily and yield bounded chunks."""
+    from icalendar import Calendar
+    from exporters import iter_csv, iter_ics, EXPORT_CHUNK_BYTES
+
+    pulled = []
+
+    def events(n):
+        for i in range(n):
+            pulled.append(i)
+            yield {"title": f"HW{i}", "date": "2025-04-15", "type": "homework", "description": "x" * 100}
+
+    stream = iter_ics(events(5000))
+    first = next(stream)
+    assert first.startswith(b"BEGIN:VCALENDAR")
+    assert len(pulled) < 5000  # started before all events were serialized
+
+    body = first + b"".join(stream)
+    assert len(Calendar.from_ical(body).walk("VEVENT")) == 5000
+
+    chunks = list(iter_csv(events(5000)))
+    assert all(len(chunk) < 2 * EXPORT_CHUNK_BYTES for chunk in chunks)
+    assert b"".join(chunks).decode().splitlines()[1] == "HW0,2025-04-15,homework," + "x" * 100
+
+
+@pytest.fixture
+def feed(client, tmp_path, monkeypatch):
+    """GET /export/feed against a temporary database."""
+    import database.db_manager as db_manager
+
+    monkeypatch.setattr(db_manager, "DB_NAME", tmp_path / "test_feed.db")
+    db_manager.init_db()
+    db_manager.save_course_events("student@example.com", "CS 148", [
+        {"local_id": "a", "title": "Midterm Exam", "date": "2025-05-01", "type": "exam"},
+        {"local_id": "b", "title": "HW1", "date": "2025-04-15", "type": "homework"},
+    ])
+    db_manager.save_course_events("student@example.com", "MATH 4A", [
+        {"local_id": "a", "title": "Quiz 1", "date": "2025-04-10", "type": "quiz"},
+    ])
+
+    with patch("app.fetch_user_creds", return_value=FAKE_CREDS):
+        token = client.post("/export/feed/token", params={"email": "student@example.com"}).json()["token"]
+
+    def get(headers=None, **params):
+        return client.get("/export/feed", params={"token": token, **params}, headers=headers or {})
+
+    return db_manager, get
+
+
+def test_feed_combines_stored_courses_with_stable_uids(feed):
+    from icalendar import Calendar
+
+    db_manager, get = feed
+    resp = get()
+    assert resp.status_code == 200
+    assert "text/calendar" in resp.headers["content-type"]
+    vevents = Calendar.from_ical(resp.content).walk("VEVENT")
+    assert [str(v["summary"]) for v in vevents] == ["Quiz 1", "HW1", "Midterm Exam"]
+    uids = {str(v["summary"]): str(v["uid"]) for v in vevents}
+    assert len(set(uids.values())) == 3
+
+    db_manager.save_course_events("student@example.com", "CS 148", [
+        {"local_id": "b", "title": "HW1 (extended)", "date": "2025-04-17", "type": "homework"},
+    ])
+    vevents = Calendar.from_ical(get().content).walk("VEVENT")
+    assert {str(v["summary"]): str(v["uid"]) for v in vevents}["HW1 (extended)"] == uids["HW1"]
+
+    only_math = get(course="MATH 4A", format="csv").text.strip().splitlines()
+    assert only_math[1:] == ["Quiz 1,2025-04-10,quiz,"]
+
+
+def test_feed_returns_304_until_events_change(feed):
+    db_manager, get = feed
+    first = get()
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    assert get({"If-None-Match": etag}).status_code == 304
+    assert get({"If-Modified-Since": last_modified}).status_code == 304
+
+    # Re-saving identical events is not a change
+    db_manager.save_course_events("student@example.com", "MATH 4A", [
+        {"local_id": "a", "title": "Quiz 1", "date": "2025-04-10", "type": "quiz"},
+    ])
+    assert get({"If-None-Match": etag}).status_code == 304
+
+    db_manager.delete_course_event("student@example.com", "MATH 4A", "a")
+    changed = get({"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert "Quiz 1" not in changed.text
+
+
+def test_feed_requires_its_token(feed, client):
+    db_manager, get = feed
+    assert client.get("/export/feed", params={"email": "student@example.com"}).status_code == 422
+    assert client.get("/export/feed", params={"token": "guessed"}).status_code == 404
+
+    with patch("app.fetch_user_creds", return_value=FAKE_CREDS):
+        same = client.post("/export/feed/token", params={"email": "student@example.com"}).json()
+        assert get().status_code == 200
+        rotated = client.post("/export/feed/token", params={"email": "student@example.com", "rotate": True}).json()
+    assert same["path"] == f"/export/feed?token={same['token']}"
+    assert rotated["token"] != same["token"]
+    assert get().status_code == 404  # the old URL stops working
+    assert client.get("/export/feed", params={"token": rotated["token"]}).status_code == 200
+
+    with patch("app.fetch_user_creds", return_value=None):
+        assert client.post("/export/feed/token", params={"email": "other@example.com"}).status_code == 401
+
+
+def test_feed_events_have_a_stable_dtstamp(feed):
+    from icalendar import Calendar
+
+    _, get = feed
+    first, second = get(), get()
+    vevents = Calendar.from_ical(first.content).walk("VEVENT")
+    assert all("DTSTAMP" in v for v in vevents)
+    assert first.content == second.content
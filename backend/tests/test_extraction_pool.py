@@ -0,0 +1,128 @@
+"""Tests for the bounded extraction process pool and its 429/504 mapping."""
+
+import asyncio
+import os
+import time
+from unittest.mock import patch, AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from extraction import ExtractionPool, ExtractionBusyError, ExtractionTimeoutError
+
+
+def _slow_upper(text, delay):
+    time.sleep(delay)
+    return text.upper()
+
+
+def _count_pages(total, progress=None):
+    for page in range(1, total + 1):
+        progress("ocr_page", page=page, done=page, total=total)
+    return f"{total} pages"
+
+
+def _has_ocr_slots():
+    import extraction
+    return extraction._ocr_slots is not None
+
+
+@pytest.fixture
+def pool():
+    p = ExtractionPool(max_workers=1, max_queue=0, timeout=5)
+    yield p
+    p.shutdown()
+
+
+def test_run_returns_worker_result(pool):
+    assert asyncio.run(pool.run(_slow_upper, "syllabus", 0)) == "SYLLABUS"
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_workers_share_the_pools_ocr_slots(pool):
+    assert asyncio.run(pool.run(_has_ocr_slots))
+
+
+def test_saturated_pool_rejects(pool):
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(_slow_upper, "a", 0.5))
+        await asyncio.sleep(0)
+        with pytest.raises(ExtractionBusyError):
+            await pool.run(_slow_upper, "b", 0)
+        return await first
+
+    assert asyncio.run(scenario()) == "A"
+    assert pool.stats()["rejected"] == 1
+
+
+def test_hung_job_is_killed_and_the_pool_recycled(pool):
+    pool.timeout = 0.5
+
+    async def scenario():
+        with pytest.raises(ExtractionTimeoutError):
+            await pool.run(_slow_upper, "a", 60)
+        # The stuck worker is killed right away, which frees its slot for the next upload
+        for _ in range(50):
+            if pool.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.1)
+        assert pool.stats()["in_flight"] == 0
+        pool.timeout = 10  # a fresh worker has to import this module first
+        return await pool.run(_slow_upper, "b", 0)
+
+    assert asyncio.run(scenario()) == "B"
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["killed_pools"] == 1
+
+
+def test_retired_pool_finishes_its_other_jobs_first(pool):
+    pool.max_workers, pool.timeout = 2, 4
+
+    async def scenario():
+        stuck = asyncio.ensure_future(pool.run(_slow_upper, "stuck", 60))
+        await asyncio.sleep(1.5)
+        other = asyncio.ensure_future(pool.run(_slow_upper, "other", 3))
+        with pytest.raises(ExtractionTimeoutError):
+            await stuck
+        assert pool.stats()["killed_pools"] == 0  # "other" is still running there
+        assert await other == "OTHER"
+        for _ in range(50):
+            if pool.stats()["killed_pools"] == 1:
+                break
+            await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert pool.stats()["killed_pools"] == 1
+
+
+def test_workers_are_not_forked_from_the_api_process(pool):
+    assert asyncio.run(pool.run(os.getppid)) != os.getpid()
+
+
+def test_progress_is_forwarded_from_the_worker(pool):
+    reports = []
+
+    def progress(stage, **data):
+        reports.append((stage, data["done"], data["total"]))
+
+    assert asyncio.run(pool.run(_count_pages, 3, progress=progress)) == "3 pages"
+    assert reports == [("ocr_page", 1, 3), ("ocr_page", 2, 3), ("ocr_page", 3, 3)]
+
+
+def test_syllabus_returns_429_when_saturated():
+    from app import app
+
+    client = TestClient(app)
+    with patch("app._extract_text", AsyncMock(side_effect=ExtractionBusyError("busy"))):
+        resp = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-busy-test", "application/pdf")})
+    assert resp.status_code == 429
+    assert "retry-after" in resp.headers
+
+
+def test_syllabus_returns_504_on_timeout():
+    from app import app
+
+    client = TestClient(app)
+    with patch("app._extract_text", AsyncMock(side_effect=ExtractionTimeoutError("slow"))):
+        resp = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-timeout-test", "application/pdf")})
+    assert resp.status_code == 504
@@ -0,0 +1,124 @@
+"""Tests for per-page hybrid extraction (text layer + OCR only where needed)."""
+
+from io import BytesIO
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+import extraction
+
+TYPED_PAGE = (b"BT /F1 12 Tf 72 700 Td (" + b"HW1 due Oct 14. " * 30 + b") Tj ET", False)
+HEADING_OVER_SCAN = (
+    b"BT /F1 12 Tf 72 760 Td (Week by week schedule, see the table below for all homework and lab due dates) Tj ET "
+    b"q 1 0 0 1 0 0 cm q 600 0 0 700 0 0 cm /Im0 Do Q Q",
+    True,
+)
+FULL_SCAN = (b"q 612 0 0 792 0 0 cm /Im0 Do Q", True)
+SMALL_LOGO = (
+    b"BT /F1 12 Tf 72 700 Td (Course policies: late work is accepted with a penalty of ten percent per day) Tj ET "
+    b"q 50 0 0 50 500 720 cm /Im0 Do Q",
+    True,
+)
+
+
+def make_pdf(pages):
+    """Build a PDF from (content stream, has 1x1 image XObject /Im0) pairs."""
+    writer = PdfWriter()
+    for content, has_image in pages:
+        page = PageObject.create_blank_page(width=612, height=792)
+        font = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        })
+        resources = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})
+        })
+        if has_image:
+            image = DecodedStreamObject()
+            image.set_data(b"\x00")
+            image.update({
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(1),
+                NameObject("/Height"): NumberObject(1),
+                NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+                NameObject("/BitsPerComponent"): NumberObject(8),
+            })
+            resources[NameObject("/XObject")] = DictionaryObject({NameObject("/Im0"): writer._add_object(image)})
+        page[NameObject("/Resources")] = resources
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        page[NameObject("/Contents")] = writer._add_object(stream)
+        writer.add_page(page)
+    buf = BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    requested = []
+
+    def fake_ocr_pages(pdf_bytes, pages=None, progress=None):
+        requested.extend(pages)
+        return {n: f"OCR text of page {n}" for n in pages}
+
+    monkeypatch.setattr(extraction, "ocr_pages", fake_ocr_pages)
+    return requested
+
+
+def test_image_coverage_follows_transform():
+    reader = PdfReader(BytesIO(make_pdf([FULL_SCAN, HEADING_OVER_SCAN, SMALL_LOGO, TYPED_PAGE])))
+    coverages = [extraction.page_image_coverage(p) for p in reader.pages]
+    assert coverages[0] == pytest.approx(1.0)
+    assert coverages[1] == pytest.approx(600 * 700 / (612 * 792))
+    assert coverages[2] == pytest.approx(50 * 50 / (612 * 792))
+    assert coverages[3] == 0.0
+
+
+def test_only_scanned_pages_are_ocrd(fake_ocr):
+    pdf = make_pdf([TYPED_PAGE, HEADING_OVER_SCAN, SMALL_LOGO, FULL_SCAN])
+    text = extraction.extract_text_from_pdf(pdf)
+
+    assert fake_ocr == [2, 4]
+    assert "HW1 due Oct 14" in text
+    assert "late work is accepted" in text
+    assert "OCR text of page 2" in text
+    assert "OCR text of page 4" in text
+    # Pages stay in document order
+    assert text.index("HW1 due Oct 14") < text.index("OCR text of page 2") < text.index("late work") < text.index("OCR text of page 4")
+
+
+def test_typed_pdf_skips_ocr(fake_ocr):
+    text = extraction.extract_text_from_pdf(make_pdf([TYPED_PAGE, SMALL_LOGO]))
+    assert fake_ocr == []
+    assert "HW1 due Oct 14" in text
+
+
+def test_failed_ocr_keeps_text_layer(monkeypatch):
+    monkeypatch.setattr(extraction, "ocr_pages", lambda pdf_bytes, pages=None, progress=None: {})
+    text = extraction.extract_text_from_pdf(make_pdf([HEADING_OVER_SCAN]))
+    assert "Week by week schedule" in text
+
+
+def test_unreadable_pdf_falls_back_to_full_ocr(monkeypatch):
+    monkeypatch.setattr(extraction, "ocr_pages", lambda pdf_bytes, pages=None, progress=None: {1: "scanned"})
+    assert extraction.extract_text_from_pdf(b"not a pdf at all").strip() == "scanned"
+
+
+def test_file_extraction_ocrs_from_the_path(tmp_path, monkeypatch):
+    requested = []
+
+    def fake_ocr_pdf_file(pdf_path, pages=None, progress=None):
+        requested.append((pdf_path, pages))
+        return {n: f"OCR text of page {n}" for n in pages}
+
+    monkeypatch.setattr(extraction, "ocr_pdf_file", fake_ocr_pdf_file)
+    pdf_path = tmp_path / "upload.pdf"
+    pdf_path.write_bytes(make_pdf([TYPED_PAGE, FULL_SCAN]))
+
+    text = extraction.extract_text_from_file(str(pdf_path))
+    assert requested == [(str(pdf_path), [2])]
+    assert "HW1 due Oct 14" in text and "OCR text of page 2" in text
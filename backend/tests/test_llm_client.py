@@ -0,0 +1,110 @@
+"""Tests for the shared Gemini client: concurrency cap, retries, deadlines and metrics."""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from llm_client import GeminiClient, LLMError
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel; fails with the queued errors, then answers."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, request_options=None):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            with self.lock:
+                error = self.errors.pop(0) if self.errors else None
+            if error is not None:
+                raise error
+            return SimpleNamespace(text=f'{{"echo": "{prompt}"}}')
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def make_client(model, **kwargs):
+    kwargs.setdefault("backoff_base", 0)
+    return GeminiClient("test-model", model=model, **kwargs)
+
+
+def test_returns_response_text():
+    client = make_client(FakeModel())
+    assert asyncio.run(client.generate("hi")) == '{"echo": "hi"}'
+    stats = client.stats()
+    assert stats["call_latency"]["count"] == 1
+    assert stats["queue_wait"]["count"] == 1
+
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.ResourceExhausted("quota"),
+    google_exceptions.ServiceUnavailable("overloaded"),
+    google_exceptions.InternalServerError("oops"),
+])
+def test_retries_transient_errors(error):
+    model = FakeModel(errors=[error, error])
+    client = make_client(model)
+    assert asyncio.run(client.generate("hi")) == '{"echo": "hi"}'
+    assert model.calls == 3
+    assert client.stats()["retries"] == 2
+
+
+def test_does_not_retry_client_errors():
+    model = FakeModel(errors=[google_exceptions.InvalidArgument("bad prompt")])
+    client = make_client(model)
+    with pytest.raises(google_exceptions.InvalidArgument):
+        asyncio.run(client.generate("hi"))
+    assert model.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    model = FakeModel(errors=[google_exceptions.ResourceExhausted("quota")] * 5)
+    client = make_client(model, max_retries=2)
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+    assert model.calls == 3
+    assert client.stats()["failures"] == 1
+
+
+def test_backoff_is_bounded_and_jittered():
+    client = GeminiClient("test-model", model=FakeModel(), backoff_base=1, backoff_cap=4)
+    delays = [client._backoff(5) for _ in range(50)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_concurrency_is_capped():
+    model = FakeModel(delay=0.05)
+    client = make_client(model, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*(client.generate(str(i)) for i in range(6)))
+
+    results = asyncio.run(burst())
+    assert len(results) == 6
+    assert model.peak == 2
+    assert client.stats()["queue_wait"]["max_seconds"] > 0
+
+
+def test_deadline_exceeded_is_retried_then_fails():
+    model = FakeModel(delay=0.3)
+    client = make_client(model, timeout=0.1, deadline_grace=0, max_retries=1)
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+    assert client.stats()["timeouts"] == 2
@@ -0,0 +1,116 @@
+"""Tests for the page-at-a-time, page-parallel OCR pipeline."""
+
+import random
+import threading
+import time
+
+import pdf2image
+import pytesseract
+import pytest
+
+import extraction
+
+
+class FakeImage:
+    def __init__(self, page_number, tracker):
+        self.page_number = page_number
+        self.tracker = tracker
+
+    def close(self):
+        self.tracker.release()
+
+
+class PageTracker:
+    """Counts how many page bitmaps are alive at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.alive = 0
+        self.peak = 0
+        self.rasterized = []
+
+    def acquire(self, page_number):
+        with self.lock:
+            self.alive += 1
+            self.peak = max(self.peak, self.alive)
+            self.rasterized.append(page_number)
+
+    def release(self):
+        with self.lock:
+            self.alive -= 1
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    tracker = PageTracker()
+
+    def fake_pdfinfo(path):
+        return {"Pages": 12}
+
+    def fake_convert(path, dpi, first_page, last_page):
+        assert first_page == last_page
+        tracker.acquire(first_page)
+        return [FakeImage(first_page, tracker)]
+
+    def fake_image_to_string(image):
+        time.sleep(random.uniform(0, 0.02))  # finish out of order
+        return f"page {image.page_number}"
+
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_path", fake_pdfinfo)
+    monkeypatch.setattr(pdf2image, "convert_from_path", fake_convert)
+    monkeypatch.setattr(pytesseract, "image_to_string", fake_image_to_string)
+    return tracker
+
+
+def test_pages_joined_in_order(fake_ocr, monkeypatch):
+    monkeypatch.setattr(extraction, "OCR_PAGE_WORKERS", 4)
+    text = extraction.extract_text_via_ocr(b"%PDF-scanned")
+    assert text.splitlines() == [f"page {n}" for n in range(1, 13)]
+
+
+def test_each_page_rasterized_once(fake_ocr, monkeypatch):
+    monkeypatch.setattr(extraction, "OCR_PAGE_WORKERS", 4)
+    extraction.extract_text_via_ocr(b"%PDF-scanned")
+    assert sorted(fake_ocr.rasterized) == list(range(1, 13))
+
+
+def test_peak_bitmaps_bounded_by_workers(fake_ocr, monkeypatch):
+    monkeypatch.setattr(extraction, "OCR_PAGE_WORKERS", 3)
+    extraction.extract_text_via_ocr(b"%PDF-scanned")
+    assert fake_ocr.peak <= 3
+    assert fake_ocr.alive == 0
+
+
+def test_pool_wide_slots_bound_concurrent_documents(fake_ocr, monkeypatch):
+    monkeypatch.setattr(extraction, "OCR_PAGE_WORKERS", 4)
+    monkeypatch.setattr(extraction, "_ocr_slots", threading.BoundedSemaphore(3))
+    documents = [threading.Thread(target=extraction.extract_text_via_ocr, args=(b"%PDF-scanned",)) for _ in range(2)]
+    for document in documents:
+        document.start()
+    for document in documents:
+        document.join()
+    assert len(fake_ocr.rasterized) == 24
+    assert fake_ocr.peak <= 3
+
+
+def test_ocr_failure_returns_empty(monkeypatch):
+    def broken_pdfinfo(path):
+        raise RuntimeError("poppler not installed")
+
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_path", broken_pdfinfo)
+    assert extraction.extract_text_via_ocr(b"%PDF-scanned") == ""
+
+
+def test_failed_page_keeps_the_other_pages(fake_ocr, monkeypatch):
+    image_to_string = pytesseract.image_to_string
+
+    def flaky_image_to_string(image):
+        if image.page_number == 5:
+            raise RuntimeError("tesseract crashed")
+        return image_to_string(image)
+
+    monkeypatch.setattr(extraction, "OCR_PAGE_WORKERS", 4)
+    monkeypatch.setattr(pytesseract, "image_to_string", flaky_image_to_string)
+    text = extraction.extract_text_via_ocr(b"%PDF-scanned")
+    assert text.splitlines() == [f"page {n}" for n in range(1, 13) if n != 5]
+    assert fake_ocr.alive == 0
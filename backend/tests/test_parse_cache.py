@@ -0,0 +1,126 @@
+"""Tests for the content-addressed syllabus parse cache."""
+
+import time
+from unittest.mock import patch, AsyncMock
+
+from fastapi.testclient import TestClient
+
+import database.db_manager as db_manager
+from database import parse_cache
+
+EVENTS = [{"title": "HW1", "date": "2026-01-15", "type": "homework", "description": ""}]
+
+
+def test_text_hash_ignores_whitespace():
+    assert parse_cache.text_hash("HW1  due\n Jan 15") == parse_cache.text_hash("HW1 due Jan 15 ")
+    assert parse_cache.text_hash("HW1 due Jan 15") != parse_cache.text_hash("HW2 due Jan 15")
+
+
+def test_store_and_lookup_by_both_keys(mock_db):
+    parse_cache.store("pdf-a", "text-a", EVENTS)
+    assert parse_cache.get_by_pdf_hash("pdf-a") == EVENTS
+    assert parse_cache.get_by_text_hash("text-a") == EVENTS
+    assert parse_cache.get_by_pdf_hash("pdf-b") is None
+
+    stats = parse_cache.cache_stats()
+    assert stats["pdf_hits"] == 1
+    assert stats["text_hits"] == 1
+
+
+def test_expired_entries_are_misses(mock_db, monkeypatch):
+    parse_cache.store("pdf-a", "text-a", EVENTS)
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_TTL", 0)
+    assert parse_cache.get_by_pdf_hash("pdf-a") is None
+
+
+def test_lru_eviction_keeps_recently_used(mock_db, monkeypatch):
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_MAX_ENTRIES", 2)
+    parse_cache.store("pdf-1", "text-1", EVENTS)
+    time.sleep(0.01)
+    parse_cache.store("pdf-2", "text-2", EVENTS)
+    time.sleep(0.01)
+    parse_cache.get_by_pdf_hash("pdf-1")  # pdf-2 is now least recently used
+    time.sleep(0.01)
+    parse_cache.store("pdf-3", "text-3", EVENTS)
+
+    assert parse_cache.get_by_pdf_hash("pdf-1") == EVENTS
+    assert parse_cache.get_by_pdf_hash("pdf-2") is None
+    assert parse_cache.get_by_pdf_hash("pdf-3") == EVENTS
+    assert parse_cache.cache_stats()["evictions"] == 1
+
+
+def test_repeat_upload_skips_extraction_and_llm(mock_db):
+    from app import app
+
+    client = TestClient(app)
+    gemini = AsyncMock(return_value={"events": EVENTS})
+    with patch("app._extract_text", AsyncMock(return_value="HW1 due Jan 15")) as extract, \
+            patch("app.parse_syllabus_text", gemini):
+        first = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-same-bytes", "application/pdf")})
+        second = client.post("/syllabus", files={"file": ("b.pdf", b"%PDF-same-bytes", "application/pdf")})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["events"] == EVENTS
+    assert extract.await_count == 1
+    assert gemini.await_count == 1
+
+
+def test_same_text_different_bytes_hits_text_key(mock_db):
+    from app import app
+
+    client = TestClient(app)
+    gemini = AsyncMock(return_value={"events": EVENTS})
+    with patch("app._extract_text", AsyncMock(return_value="HW1 due Jan 15")), \
+            patch("app.parse_syllabus_text", gemini):
+        client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-export-1", "application/pdf")})
+        resp = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-export-2", "application/pdf")})
+
+    assert resp.json()["cached"] is True
+    assert gemini.await_count == 1
+    assert parse_cache.cache_stats()["text_hits"] == 1
+
+
+def test_empty_parse_is_not_cached(mock_db):
+    from app import app
+
+    client = TestClient(app)
+    gemini = AsyncMock(return_value={"events": []})
+    with patch("app._extract_text", AsyncMock(return_value="not a syllabus")), \
+            patch("app.parse_syllabus_text", gemini):
+        client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-x", "application/pdf")})
+        client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-x", "application/pdf")})
+
+    assert gemini.await_count == 2
+
+
+def test_partial_parse_is_not_cached(mock_db):
+    from app import app
+
+    client = TestClient(app)
+    gemini = AsyncMock(return_value={"events": EVENTS, "partial": True})
+    with patch("app._extract_text", AsyncMock(return_value="HW1 due Jan 15")), \
+            patch("app.parse_syllabus_text", gemini):
+        first = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-same-bytes", "application/pdf")})
+        second = client.post("/syllabus", files={"file": ("a.pdf", b"%PDF-same-bytes", "application/pdf")})
+
+    assert first.json()["events"] == EVENTS
+    assert second.json()["cached"] is False
+    assert gemini.await_count == 2
+
+
+def test_lookup_only_reads_and_touches_are_applied_later(mock_db):
+    parse_cache.store("pdf-a", "text-a", EVENTS)
+
+    def last_used():
+        with db_manager.get_connection() as conn:
+            return conn.execute("select last_used from parse_cache where pdf_hash = 'pdf-a'").fetchone()[0]
+
+    stored_at = last_used()
+    time.sleep(0.01)
+    assert parse_cache.get_by_text_hash("text-a") == EVENTS
+    assert last_used() == stored_at
+    assert parse_cache.apply_touches() == 1
+    assert last_used() > stored_at
+    assert parse_cache.apply_touches() == 0
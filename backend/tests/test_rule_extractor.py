@@ -0,0 +1,148 @@
+"""Tests for the rule-based fast path that runs before the LLM."""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from rule_extractor import extract_rule_based, unresolved_fragments
+
+EXPLICIT_SYLLABUS = """CS 148 Software Engineering
+Winter 2026
+Grading: Homework 30%, Midterm 30%, Final 40%
+Late policy: HW submitted late loses 10% per day
+
+Schedule
+HW1 due Jan 14
+Quiz 2 - 1/21
+Midterm 1: Feb 4
+Lab 3 due 2026-02-11
+Final Exam March 18, 2026
+"""
+
+
+def titles_and_dates(extraction):
+    return [(e["title"], e["date"]) for e in extraction.events]
+
+
+def test_explicit_dates_resolved_without_llm():
+    result = extract_rule_based(EXPLICIT_SYLLABUS)
+    assert titles_and_dates(result) == [
+        ("HW1", "2026-01-14"),
+        ("Quiz 2", "2026-01-21"),
+        ("Midterm 1", "2026-02-04"),
+        ("Lab 3", "2026-02-11"),
+        ("Final Exam", "2026-03-18"),
+    ]
+    assert result.unresolved == []
+    assert result.is_confident
+    assert {e["type"] for e in result.events} == {"homework", "quiz", "exam", "lab"}
+    assert all(e["Class"] == "CS 148" for e in result.events)
+
+
+def test_week_references_anchor_to_quarter_start():
+    text = "MATH 4A Fall 2025\nWeek 1 Friday: Quiz 1\nQuiz 2 on Wed of week 3\n"
+    result = extract_rule_based(text)
+    # Fall 2025 instruction starts Monday Sep 22
+    assert titles_and_dates(result) == [("Quiz 1", "2025-09-26"), ("Quiz 2", "2025-10-08")]
+
+
+def test_explicit_start_date_overrides_convention():
+    text = "PSTAT 120A Spring 2026\nInstruction begins March 30\nWeek 2 Monday: HW1 due\n"
+    assert titles_and_dates(extract_rule_based(text)) == [("HW1", "2026-04-06")]
+
+
+@pytest.mark.parametrize("line", [
+    "Homework is due every Friday",
+    "HW3 released Feb 2, due Feb 9",
+    "Midterm: in class during week 5",
+    "Quiz 3 and Quiz 4 on Feb 3, Feb 10, Feb 17",
+])
+def test_ambiguous_lines_are_left_for_llm(line):
+    result = extract_rule_based("CS 148 Winter 2026\n" + line)
+    assert result.events == []
+    assert result.unresolved == [line]
+    assert not result.is_confident
+
+
+@pytest.mark.parametrize("line", [
+    "Problem Set 2 due Oct 10",
+    "Essay 1 due October 17",
+    "Paper draft due Oct 24",
+    "Reading response due Nov 5",
+    "Submit the portfolio by 3/6",
+])
+def test_dated_deadlines_without_a_known_title_go_to_llm(line):
+    result = extract_rule_based(EXPLICIT_SYLLABUS + line)
+    assert len(result.events) == 5
+    assert result.unresolved == [line]
+    assert not result.is_confident
+
+
+@pytest.mark.parametrize("line, title, when", [
+    ("Midterm exam Feb 10", "Midterm exam", "2026-02-10"),
+    ("Midterm Exam: Thursday, April 30", "Midterm Exam", "2026-04-30"),
+    ("Midterm exam 2 - Feb 25", "Midterm exam 2", "2026-02-25"),
+    ("Midterm - Exam Feb 10", "Midterm", "2026-02-10"),
+    ("Final exam: March 18", "Final exam", "2026-03-18"),
+])
+def test_exam_names_are_one_event(line, title, when):
+    result = extract_rule_based("CS 148 Winter 2026\n" + line)
+    assert titles_and_dates(result) == [(title, when)]
+    assert result.events[0]["type"] == "exam"
+
+
+def test_dates_without_a_year_fall_in_the_named_term():
+    result = extract_rule_based("MATH 4A Fall 2025\nHW1 due Oct 3\nFinal Exam Jan 3\nProject 2 due 2025-12-05\n")
+    assert titles_and_dates(result) == [
+        ("HW1", "2025-10-03"), ("Final Exam", "2026-01-03"), ("Project 2", "2025-12-05"),
+    ]
+
+
+def test_dated_lines_without_a_deadline_are_ignored():
+    result = extract_rule_based(EXPLICIT_SYLLABUS + "Instruction begins January 5\nNo class on Jan 19\n")
+    assert result.unresolved == []
+    assert result.is_confident
+
+
+def test_guessed_year_is_not_confident():
+    result = extract_rule_based("HW1 due Jan 14")
+    assert titles_and_dates(result) == [("HW1", "2026-01-14")]
+    assert not result.is_confident
+
+
+def test_fragments_include_neighbouring_context():
+    text = "CS 148 Winter 2026\nWeek 5\nMidterm in class\nHW4 due Feb 6\n"
+    result = extract_rule_based(text)
+    assert unresolved_fragments(text, result) == "Week 5\nMidterm in class\nHW4 due Feb 6"
+
+
+def test_confident_syllabus_skips_gemini():
+    import app
+
+    with patch.object(app.gemini_client, "generate") as generate:
+        parsed = asyncio.run(app.parse_syllabus_text(EXPLICIT_SYLLABUS))
+    generate.assert_not_called()
+    assert len(parsed["events"]) == 5
+
+
+def test_only_unresolved_fragments_go_to_gemini():
+    import app
+
+    text = EXPLICIT_SYLLABUS + "Project checkpoint during week 6 section\nFinal Project 2: Week 10\n"
+    prompts = []
+
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        return json.dumps({"events": [{"title": "Final Project 2", "date": "2026-03-13", "Class": "CS 148"}]})
+
+    with patch.object(app.gemini_client, "generate", side_effect=fake_generate):
+        parsed = asyncio.run(app.parse_syllabus_text(text))
+
+    assert len(prompts) == 1
+    syllabus_part = prompts[0].split("Syllabus:")[-1]
+    assert "Final Project 2: Week 10" in syllabus_part
+    assert "Quiz 2 - 1/21" not in syllabus_part
+    assert "Final Project 2" in [e["title"] for e in parsed["events"]]
+    assert len(parsed["events"]) == 6
@@ -0,0 +1,83 @@
+"""Tests for the multi-file POST /syllabus/batch endpoint."""
+
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import patch, AsyncMock
+
+from fastapi.testclient import TestClient
+
+from extraction import ExtractionBusyError
+
+
+def _pdf(name, contents):
+    return ("files", (name, contents, "application/pdf"))
+
+
+def test_files_are_parsed_concurrently_and_duplicates_once(mock_db):
+    from app import app
+
+    extracted = []
+
+    async def slow_extract(pdf_path, progress=None):
+        pdf_bytes = Path(pdf_path).read_bytes()
+        extracted.append(pdf_bytes)
+        await asyncio.sleep(0.2)
+        return pdf_bytes.decode()
+
+    async def parse_text(text, progress=None):
+        return {"events": [{"title": text, "date": "2026-01-15"}]}
+
+    files = [_pdf("a.pdf", b"%PDF-batch-a"), _pdf("b.pdf", b"%PDF-batch-b"),
+             _pdf("a copy.pdf", b"%PDF-batch-a"), _pdf("c.pdf", b"%PDF-batch-c")]
+    with patch("app._extract_text", side_effect=slow_extract), \
+            patch("app.parse_syllabus_text", side_effect=parse_text):
+        started = time.monotonic()
+        resp = TestClient(app).post("/syllabus/batch", files=files)
+        elapsed = time.monotonic() - started
+
+    assert resp.status_code == 200
+    assert sorted(extracted) == [b"%PDF-batch-a", b"%PDF-batch-b", b"%PDF-batch-c"]
+    assert elapsed < 0.5  # three 0.2s parses overlapped
+
+    body = resp.json()
+    assert [r["filename"] for r in body["files"]] == ["a.pdf", "b.pdf", "a copy.pdf", "c.pdf"]
+    assert body["files"][2]["duplicate_of"] == 0
+    assert body["files"][2]["events"] == body["files"][0]["events"] == [{"title": "%PDF-batch-a", "date": "2026-01-15"}]
+    assert "duplicate_of" not in body["files"][1]
+    assert body["succeeded"] == 4 and body["failed"] == 0
+
+
+def test_one_failing_file_does_not_fail_the_batch(mock_db):
+    from app import app
+
+    async def extract(pdf_path, progress=None):
+        if Path(pdf_path).read_bytes() == b"%PDF-busy":
+            raise ExtractionBusyError("busy")
+        return "HW1 due Jan 15, 2026"
+
+    with patch("app._extract_text", side_effect=extract), \
+            patch("app.parse_syllabus_text", AsyncMock(return_value={"events": []})):
+        resp = TestClient(app).post("/syllabus/batch", files=[_pdf("ok.pdf", b"%PDF-ok"), _pdf("busy.pdf", b"%PDF-busy")])
+
+    body = resp.json()
+    assert [r["status"] for r in body["files"]] == [200, 429]
+    assert body["files"][1]["error"] == "busy"
+    assert body["succeeded"] == 1 and body["failed"] == 1
+
+
+def test_non_pdf_file_is_reported_per_file(mock_db):
+    from app import app
+
+    with patch("app._extract_text", AsyncMock(return_value="")):
+        resp = TestClient(app).post("/syllabus/batch", files=[_pdf("notes.txt", b"just text"), _pdf("a.pdf", b"%PDF-empty")])
+
+    assert [r["status"] for r in resp.json()["files"]] == [415, 400]
+
+
+def test_too_many_files_is_rejected(mock_db, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "SYLLABUS_BATCH_MAX_FILES", 1)
+
+    resp = TestClient(app_module.app).post("/syllabus/batch", files=[_pdf("a.pdf", b"a"), _pdf("b.pdf", b"b")])
+    assert resp.status_code == 400
@@ -0,0 +1,239 @@
+"""Tests for the queued syllabus parse jobs (POST /syllabus/jobs)."""
+
+import asyncio
+import time
+from unittest.mock import patch, AsyncMock
+
+from fastapi.testclient import TestClient
+
+import syllabus_jobs
+from database import job_store
+from extraction import ExtractionBusyError
+from syllabus_jobs import JobRunner
+
+EVENTS = [{"title": "HW1", "date": "2026-01-15", "type": "homework", "description": ""}]
+
+
+def _queue(tmp_path, job_id, contents=b"%PDF-1.4 test"):
+    pdf_path = tmp_path / f"{job_id}.pdf"
+    pdf_path.write_bytes(contents)
+    job_store.create_job(job_id, "syllabus.pdf", pdf_path, len(contents))
+    return pdf_path
+
+
+def test_claim_is_exclusive_and_counts_attempts(mock_db, tmp_path):
+    _queue(tmp_path, "job-1")
+    job = job_store.claim_next_job()
+    assert job["id"] == "job-1"
+    assert job["status"] == job_store.RUNNING
+    assert job["attempts"] == 1
+    assert job_store.claim_next_job() is None
+
+    job_store.finish_job("job-1", EVENTS, cached=True)
+    job = job_store.get_job("job-1")
+    assert job["status"] == job_store.DONE
+    assert job["events"] == EVENTS and job["cached"] is True
+
+
+def test_backoff_delays_the_next_claim(mock_db, tmp_path):
+    _queue(tmp_path, "job-1")
+    job_store.claim_next_job()
+    job_store.fail_job("job-1", "busy", retry_in=60)
+    assert job_store.get_job("job-1")["status"] == job_store.QUEUED
+    assert job_store.claim_next_job() is None
+
+
+def test_retry_only_requeues_failed_jobs(mock_db, tmp_path):
+    _queue(tmp_path, "job-1")
+    assert job_store.retry_job("job-1") is False
+    job_store.claim_next_job()
+    job_store.fail_job("job-1", "bad pdf")
+    assert job_store.retry_job("job-1") is True
+    job = job_store.claim_next_job()
+    assert job["id"] == "job-1" and job["attempts"] == 1
+
+
+def test_released_job_is_queued_without_counting_the_attempt(mock_db, tmp_path):
+    _queue(tmp_path, "job-1")
+    job_store.claim_next_job()
+    job_store.release_job("job-1")
+    job = job_store.claim_next_job()
+    assert job["id"] == "job-1" and job["attempts"] == 1
+
+
+def test_stale_and_expired_jobs(mock_db, tmp_path, monkeypatch):
+    _queue(tmp_path, "stale")
+    path = _queue(tmp_path, "old")
+    job_store.claim_next_job()  # 'stale' is now running
+    job_store.claim_next_job()
+    job_store.finish_job("old", EVENTS)
+
+    monkeypatch.setattr(job_store, "JOB_STALE_AFTER", -1)
+    monkeypatch.setattr(job_store, "JOB_TTL", -1)
+    assert job_store.requeue_stale_jobs() == 1
+    assert job_store.get_job("stale")["status"] == job_store.QUEUED
+    assert job_store.purge_expired_jobs() == [str(path)]
+    assert job_store.get_job("old") is None
+    assert job_store.job_counts()[job_store.QUEUED] == 1
+
+
+def test_stale_job_out_of_attempts_is_failed(mock_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(job_store, "JOB_STALE_AFTER", -1)
+    _queue(tmp_path, "crasher")
+    for attempt in range(2):
+        assert job_store.claim_next_job()["attempts"] == attempt + 1
+        # The worker died mid-parse
+        assert job_store.requeue_stale_jobs() == (1 if attempt == 0 else 0)
+
+    job = job_store.get_job("crasher")
+    assert job["status"] == job_store.FAILED
+    assert job["error"]
+    assert job_store.claim_next_job() is None
+
+
+def test_runner_retries_transient_errors(mock_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(syllabus_jobs, "JOB_RETRY_DELAY", 0)
+    _queue(tmp_path, "job-1", b"pdf bytes")
+    calls = []
+
+    async def process(pdf_path):
+        calls.append(pdf_path.read_bytes())
+        if len(calls) == 1:
+            raise ExtractionBusyError("busy")
+        return EVENTS, False
+
+    async def scenario():
+        runner = JobRunner(process, workers=2, transient=(ExtractionBusyError,), poll_interval=0.01)
+        runner.start()
+        runner.notify()
+        deadline = time.monotonic() + 5
+        while job_store.get_job("job-1")["status"] != job_store.DONE and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return runner.stats()
+
+    stats = asyncio.run(scenario())
+    job = job_store.get_job("job-1")
+    assert job["status"] == job_store.DONE
+    assert job["events"] == EVENTS and job["attempts"] == 2
+    assert calls == [b"pdf bytes", b"pdf bytes"]
+    assert stats["retried"] == 1 and stats["completed"] == 1
+
+
+def test_runner_fails_job_on_other_errors(mock_db, tmp_path):
+    _queue(tmp_path, "job-1")
+
+    async def process(pdf_path):
+        raise Exception("Could not extract text from PDF")
+
+    async def scenario():
+        runner = JobRunner(process, workers=1, poll_interval=0.01)
+        runner.start()
+        deadline = time.monotonic() + 5
+        while job_store.get_job("job-1")["status"] != job_store.FAILED and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    job = job_store.get_job("job-1")
+    assert job["status"] == job_store.FAILED
+    assert job["error"] == "Could not extract text from PDF"
+
+
+def test_failed_result_write_keeps_the_worker_alive(mock_db, tmp_path, monkeypatch):
+    _queue(tmp_path, "job-1")
+    _queue(tmp_path, "job-2")
+    finish_job = job_store.finish_job
+
+    def flaky_finish_job(job_id, events, cached=False):
+        if job_id == "job-1":
+            raise Exception("Failed to update job job-1: database is locked")
+        finish_job(job_id, events, cached)
+
+    monkeypatch.setattr(job_store, "finish_job", flaky_finish_job)
+
+    async def process(pdf_path):
+        return EVENTS, False
+
+    async def scenario():
+        runner = JobRunner(process, workers=1, poll_interval=0.01)
+        runner.start()
+        deadline = time.monotonic() + 5
+        while job_store.get_job("job-2")["status"] != job_store.DONE and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert job_store.get_job("job-1")["status"] == job_store.RUNNING
+    assert job_store.get_job("job-2")["status"] == job_store.DONE
+
+
+def test_start_replaces_dead_workers(mock_db):
+    async def process(pdf_path):
+        return EVENTS, False
+
+    async def scenario():
+        runner = JobRunner(process, workers=2, poll_interval=0.01)
+        runner.start()
+        dead, alive = runner._tasks[0], runner._tasks[1]
+        dead.cancel()
+        await asyncio.gather(dead, return_exceptions=True)
+        runner.start()
+        replaced = runner._tasks[0]
+        assert replaced is not dead and not replaced.done()
+        assert runner._tasks[1] is alive
+        assert len(runner._tasks) == 3
+        await runner.stop()
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_keeps_a_long_job_from_going_stale(mock_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(syllabus_jobs, "JOB_HEARTBEAT_INTERVAL", 0.02)
+    monkeypatch.setattr(job_store, "JOB_STALE_AFTER", 0.1)
+    _queue(tmp_path, "slow")
+    requeued = []
+
+    async def process(pdf_path):
+        await asyncio.sleep(0.4)
+        # Another process sweeping for stale jobs while this one is still parsing
+        requeued.append(job_store.requeue_stale_jobs())
+        return EVENTS, False
+
+    async def scenario():
+        runner = JobRunner(process, workers=1, poll_interval=0.01)
+        runner.start()
+        deadline = time.monotonic() + 5
+        while job_store.get_job("slow")["status"] != job_store.DONE and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert requeued == [0]
+    job = job_store.get_job("slow")
+    assert job["status"] == job_store.DONE and job["attempts"] == 1
+
+
+def test_enqueue_and_poll(mock_db, tmp_path, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "JOB_DIR", tmp_path / "jobs")
+
+    with patch("app._extract_text", new=AsyncMock(return_value="HW1 due Jan 15, 2026")), \
+         patch("app.parse_syllabus_text", new=AsyncMock(return_value={"events": EVENTS})), \
+         TestClient(app_module.app) as client:
+        response = client.post("/syllabus/jobs", files={"file": ("syllabus.pdf", b"%PDF-1.4 jobs", "application/pdf")})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"] == f"/syllabus/jobs/{job_id}"
+
+        deadline = time.monotonic() + 5
+        body = client.get(f"/syllabus/jobs/{job_id}").json()
+        while body["status"] != job_store.DONE and time.monotonic() < deadline:
+            time.sleep(0.02)
+            body = client.get(f"/syllabus/jobs/{job_id}").json()
+
+        assert body["events"] == EVENTS
+        assert body["filename"] == "syllabus.pdf"
+        assert client.post(f"/syllabus/jobs/{job_id}/retry").status_code == 409
+        assert client.get("/syllabus/jobs/unknown").status_code == 404
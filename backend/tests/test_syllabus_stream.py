@@ -0,0 +1,63 @@
+"""Tests for the Server-Sent Events variant of POST /syllabus."""
+
+import json
+from unittest.mock import patch, AsyncMock
+
+from fastapi.testclient import TestClient
+
+from extraction import ExtractionBusyError
+
+SYLLABUS = """CS 148 Software Engineering
+Winter 2026
+HW1 due Jan 14
+Midterm 1: Feb 4
+Final Project 2: Week 10
+"""
+
+
+def _events(body):
+    """Parse an SSE body into [(event, data)]."""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def test_stream_reports_stages_and_partial_events(mock_db):
+    from app import app
+
+    async def fake_extract(pdf_bytes, progress=None):
+        progress("text_layer", pages=2, ocr_pages=1)
+        progress("ocr_page", page=2, done=1, total=1)
+        return SYLLABUS
+
+    llm_events = [{"title": "Final Project 2", "date": "2026-03-13", "Class": "CS 148"}]
+    with patch("app._extract_text", side_effect=fake_extract), \
+            patch("app._parse_chunk_with_gemini", AsyncMock(return_value={"events": llm_events})):
+        resp = TestClient(app).post("/syllabus/stream", files={"file": ("a.pdf", b"%PDF-stream", "application/pdf")})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = _events(resp.text)
+    stages = [stage for stage, _ in events]
+    assert stages == ["received", "text_layer", "ocr_page", "text_extracted", "partial_events",
+                      "llm_request", "events_parsed", "done"]
+
+    partial = dict(events)["partial_events"]
+    assert partial["source"] == "rules"
+    assert [e["title"] for e in partial["events"]] == ["HW1", "Midterm 1"]
+    done = dict(events)["done"]
+    assert len(done["events"]) == 3 and done["cached"] is False
+    assert all("elapsed_ms" in data for _, data in events)
+
+
+def test_stream_reports_busy_pool_as_error_event(mock_db):
+    from app import app
+
+    with patch("app._extract_text", AsyncMock(side_effect=ExtractionBusyError("busy"))):
+        resp = TestClient(app).post("/syllabus/stream", files={"file": ("a.pdf", b"%PDF-stream-busy", "application/pdf")})
+
+    stage, data = _events(resp.text)[-1]
+    assert stage == "error"
+    assert data["status"] == 429
@@ -0,0 +1,57 @@
+"""Tests for bounded upload spooling and the 413/415 answers."""
+
+import asyncio
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+import uploads
+from database import parse_cache
+
+
+def _upload(contents, size=None):
+    return UploadFile(BytesIO(contents), filename="a.pdf", size=size)
+
+
+def test_spooled_upload_is_on_disk_and_hashed():
+    contents = b"%PDF-1.4\n" + b"x" * (3 * uploads.UPLOAD_CHUNK_BYTES)
+    upload = asyncio.run(uploads.spool_upload(_upload(contents)))
+    try:
+        assert upload.path.read_bytes() == contents
+        assert upload.size == len(contents)
+        assert upload.sha256 == parse_cache.pdf_hash(contents)
+    finally:
+        upload.remove()
+    assert not upload.path.exists()
+
+
+def test_oversized_upload_is_rejected_while_copying(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    with pytest.raises(uploads.UploadTooLargeError):
+        asyncio.run(uploads.spool_upload(_upload(b"%PDF-1.4\n" + b"x" * 5000), max_bytes=4096))
+    assert list(tmp_path.iterdir()) == []  # partial copy removed
+
+
+def test_declared_size_is_checked_before_reading():
+    file = _upload(b"%PDF-1.4", size=10 * 1024)
+    with pytest.raises(uploads.UploadTooLargeError):
+        asyncio.run(uploads.spool_upload(file, max_bytes=4096))
+    assert file.file.tell() == 0
+
+
+def test_header_must_be_pdf():
+    with pytest.raises(uploads.NotAPdfError):
+        asyncio.run(uploads.spool_upload(_upload(b"GIF89a not a pdf")))
+
+
+def test_syllabus_answers_413_and_415(monkeypatch):
+    from app import app
+
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024)
+    client = TestClient(app)
+    resp = client.post("/syllabus", files={"file": ("big.pdf", b"%PDF-" + b"x" * 2048, "application/pdf")})
+    assert resp.status_code == 413
+    resp = client.post("/syllabus", files={"file": ("a.docx", b"PK\x03\x04 word file", "application/pdf")})
+    assert resp.status_code == 415
@@ -0,0 +1,99 @@
+"""
+Bounded handling of uploaded PDFs.
+
+Uploads are copied in small chunks from the request's spooled file to a named
+temp file, hashed on the way, and never held in memory as a whole. The PDF
+header is checked on the first chunk and the copy stops as soon as the size
+limit is passed, so an oversized or non-PDF upload is rejected before anything
+is parsed. Extraction workers then open the file by path (see
+extraction.extract_text_from_file) instead of receiving a pickled copy of it.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))  # 25 MiB
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # None: the system temp directory
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# PDF readers accept the header anywhere in the first 1024 bytes
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_WINDOW = 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload is bigger than UPLOAD_MAX_BYTES (answered with 413)."""
+
+
+class NotAPdfError(Exception):
+    """Raised when an upload does not start with a PDF header (answered with 415)."""
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    size: int
+    sha256: str  # same value as parse_cache.pdf_hash of the contents
+    filename: Optional[str] = None
+
+    def remove(self) -> None:
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = None) -> StoredUpload:
+    """
+    Copy an upload to a temp file the caller must remove().
+
+    Raises:
+        UploadTooLargeError: the upload is bigger than max_bytes (default UPLOAD_MAX_BYTES)
+        NotAPdfError: the upload has no PDF header
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(_too_large_message(max_bytes))
+
+    head = await file.read(PDF_HEADER_WINDOW)
+    if PDF_MAGIC not in head:
+        raise NotAPdfError("Uploaded file is not a PDF")
+
+    fd, name = tempfile.mkstemp(suffix=".pdf", prefix="plannr-upload-", dir=UPLOAD_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(_too_large_message(max_bytes))
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+    except BaseException:
+        Path(name).unlink(missing_ok=True)
+        raise
+    return StoredUpload(Path(name), size, digest.hexdigest(), file.filename)
+
+
+def stored_upload(path, filename: Optional[str] = None) -> StoredUpload:
+    """A StoredUpload for a PDF already on disk (e.g. a queued job's upload), hashed in chunks."""
+    path = Path(path)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            digest.update(chunk)
+    return StoredUpload(path, size, digest.hexdigest(), filename)
+
+
+def _too_large_message(max_bytes: int) -> str:
+    return f"Uploaded file is larger than {max_bytes // (1024 * 1024)} MB"